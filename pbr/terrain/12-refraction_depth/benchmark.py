@@ -0,0 +1,191 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from panda3d.core import (
+    ClockObject,
+    load_prc_file_data,
+    Filename,
+    Texture
+)
+
+
+# Benchmark Variants
+# ==================
+# Each variant is run in its own process with the given config lines applied on top of settings.prc.
+variants = {
+    "planar": "water-reflection-mode planar",
+    "screen_space": "water-reflection-mode screen_space",
+    "main_pass": "water-refraction-mode main_pass",
+    "main_pass_ssr": "water-refraction-mode main_pass\nwater-reflection-mode screen_space",
+    "oblique": "water-clip-mode oblique",
+    "main_pass_oblique": "water-refraction-mode main_pass\nwater-clip-mode oblique",
+    "depth16": "water-depth-format depth16",
+    "depth32f": "water-depth-format depth32f",
+    "linear_depth": "water-linear-depth 1",
+    "linear_depth_ssr": "water-linear-depth 1\nwater-reflection-mode screen_space"
+}
+
+# Points along the camera path at which a screenshot is captured for the quality comparison
+keyframes = (.25, .5, .75)
+
+
+# Functions
+# =========
+def get_camera_pose(frame, num_frames):
+    # Fly the camera in a circle around the lake while bobbing up and down
+    t = frame / num_frames * math.pi * 2
+    pos = (math.sin(t) * 120, 261 - math.cos(t) * 120, 8 + math.sin(t * 3) * 4)
+    hpr = (math.degrees(t), -12, 0)
+    return pos, hpr
+
+
+def percentile(samples, pct):
+    return float(np.percentile(samples, pct)) * 1000
+
+
+def run_variant(name, num_frames, warmup, size, output_dir):
+    # Configure an offscreen window before the demo is created
+    load_prc_file_data("benchmark", "\n".join((
+        "window-type offscreen",
+        "win-size {} {}".format(*size),
+        "sync-video 0",
+        "audio-library-name null",
+        "model-path {}".format(Filename.from_os_specific(os.getcwd())),
+        variants[name]
+    )))
+
+    from main import TerrainDemo
+
+    app = TerrainDemo()
+    app.disable_mouse()
+
+    # Use a fixed time step so that animated effects look the same in every variant
+    clock = ClockObject.get_global_clock()
+    clock.set_mode(ClockObject.M_non_real_time)
+    clock.set_frame_rate(60)
+    clock.set_frame_time(0)
+
+    # Run the camera path
+    frame_times = []
+    screenshot_frames = [int(num_frames * keyframe) for keyframe in keyframes]
+
+    for frame in range(warmup + num_frames):
+        pos, hpr = get_camera_pose(max(frame - warmup, 0), num_frames)
+        app.camera.set_pos_hpr(pos, hpr)
+
+        start = time.perf_counter()
+        app.task_mgr.step()
+        end = time.perf_counter()
+
+        if frame < warmup:
+            continue
+
+        frame_times.append(end - start)
+
+        if frame - warmup in screenshot_frames:
+            screenshot = app.win.get_screenshot()
+            screenshot.write(Filename.from_os_specific(
+                os.path.join(output_dir, "{}-{:04d}.png".format(name, frame - warmup))
+            ))
+
+    return {
+        "name": name,
+        "frames": len(frame_times),
+        "mean_ms": float(np.mean(frame_times)) * 1000,
+        "p50_ms": percentile(frame_times, 50),
+        "p95_ms": percentile(frame_times, 95),
+        "p99_ms": percentile(frame_times, 99)
+    }
+
+
+def load_image(path):
+    tex = Texture()
+    tex.read(Filename.from_os_specific(path))
+    image = np.frombuffer(tex.get_ram_image_as("RGB"), np.uint8)
+    return image.reshape(tex.get_y_size(), tex.get_x_size(), 3).astype(np.float64)
+
+
+def compare_images(reference_path, path):
+    # Calculate the peak signal-to-noise ratio between 2 screenshots
+    mse = np.mean((load_image(reference_path) - load_image(path)) ** 2)
+
+    if mse == 0:
+        return math.inf
+
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def main():
+    # Parse command line
+    parser = argparse.ArgumentParser(description="Benchmark the terrain demo along a fixed camera path.")
+    parser.add_argument("variants", nargs="*", default=list(variants), help="variants to run")
+    parser.add_argument("--frames", type=int, default=360, help="number of measured frames")
+    parser.add_argument("--warmup", type=int, default=30, help="number of frames to skip before measuring")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), help="window size")
+    parser.add_argument("--output-dir", default="benchmark_results", help="directory for results and screenshots")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Run a single variant in this process
+    if args.run is not None:
+        result = run_variant(args.run, args.frames, args.warmup, args.size, args.output_dir)
+
+        with open(os.path.join(args.output_dir, args.run + ".json"), "w") as f:
+            json.dump(result, f, indent=4)
+
+        return
+
+    # Run each variant in a separate process so they don't share any state
+    results = []
+
+    for name in args.variants:
+        if name not in variants:
+            parser.error("unknown variant: {}".format(name))
+
+        subprocess.run([
+            sys.executable, __file__, "--run", name,
+            "--frames", str(args.frames),
+            "--warmup", str(args.warmup),
+            "--size", str(args.size[0]), str(args.size[1]),
+            "--output-dir", args.output_dir
+        ], check=True)
+
+        with open(os.path.join(args.output_dir, name + ".json")) as f:
+            results.append(json.load(f))
+
+    # Compare each variant against the first one. Screenshots must be loaded at their original size.
+    load_prc_file_data("benchmark", "textures-power-2 none")
+    reference = results[0]["name"]
+    print("{:<16} {:>9} {:>9} {:>9} {:>9} {:>10}".format(
+        "variant", "mean ms", "p50 ms", "p95 ms", "p99 ms", "PSNR dB"
+    ))
+
+    for result in results:
+        psnr = [
+            compare_images(
+                os.path.join(args.output_dir, "{}-{:04d}.png".format(reference, int(args.frames * keyframe))),
+                os.path.join(args.output_dir, "{}-{:04d}.png".format(result["name"], int(args.frames * keyframe)))
+            ) for keyframe in keyframes
+        ]
+        print("{:<16} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.2f}".format(
+            result["name"],
+            result["mean_ms"],
+            result["p50_ms"],
+            result["p95_ms"],
+            result["p99_ms"],
+            min(psnr)
+        ))
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    main()
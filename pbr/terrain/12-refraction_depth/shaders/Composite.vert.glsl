@@ -0,0 +1,11 @@
+#version 140
+
+in vec4 p3d_Vertex;
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+
+
+void main() {
+    // Calculate vertex position
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+}
@@ -0,0 +1,69 @@
+#version 140
+
+in vec4 p3d_Vertex;
+
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ViewMatrix;
+// The water cameras of oblique clipping mode are clipped by their near planes instead of clip planes. Variants
+// of this shader for it are created by defining WATER_OBLIQUE_CLIPPING before the shader is compiled.
+#ifndef WATER_OBLIQUE_CLIPPING
+uniform vec4 p3d_ClipPlane[1];
+#endif
+uniform mat4 trans_apiclip_to_model;
+uniform int projectedGridEnabled;
+uniform float gridMaxDistance;
+
+out vec3 fragPos;
+out vec2 uv;
+out vec3 toCameraVec;
+
+
+vec4 projectGridVertex(vec2 screenPos) {
+    // Cast a ray from the camera through the grid vertex
+    vec4 nearPos = trans_apiclip_to_model * vec4(screenPos, -1, 1);
+    vec4 farPos = trans_apiclip_to_model * vec4(screenPos, 1, 1);
+    nearPos /= nearPos.w;
+    farPos /= farPos.w;
+    vec3 rayDir = farPos.xyz - nearPos.xyz;
+
+    // Intersect the ray with the water plane. Rays that miss the water plane or hit it too far away are
+    // clamped to the max distance, which places them at the horizon.
+    float t = -nearPos.z / rayDir.z;
+    vec2 offset = rayDir.xy * t;
+
+    if(t <= 0 || length(offset) > gridMaxDistance) {
+        // A vertical ray has no horizontal direction, so any direction will do for it
+        vec2 horizonDir = length(rayDir.xy) > 1e-6 ? normalize(rayDir.xy) : vec2(0, 1);
+        offset = horizonDir * gridMaxDistance;
+    }
+
+    return vec4(nearPos.xy + offset, 0, 1);
+}
+
+
+void main() {
+    // Project the vertex onto the water plane if necessary
+    vec4 vertex = p3d_Vertex;
+
+    if(projectedGridEnabled != 0) {
+        vertex = projectGridVertex(p3d_Vertex.xy);
+    }
+
+    // Calculate position and fragment position
+    gl_Position = p3d_ModelViewProjectionMatrix * vertex;
+    fragPos = vec3(p3d_ModelViewMatrix * vertex);
+
+    // Calculate UV
+    uv = vec2(vertex.x / 2 + .5, vertex.y / 2 + .5);
+
+#ifndef WATER_OBLIQUE_CLIPPING
+    // Calculate clip distance
+    gl_ClipDistance[0] = dot(vec4(fragPos, 1), p3d_ClipPlane[0]);
+#endif
+
+    // Calculate vector to camera
+    vec3 camPos = p3d_ViewMatrix[3].xyz;
+    toCameraVec = fragPos - camPos;
+    toCameraVec.x = 0;
+}
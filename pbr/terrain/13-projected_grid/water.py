@@ -0,0 +1,578 @@
+import math
+
+from direct.directnotify.DirectNotifyGlobal import directNotify
+from panda3d.core import (
+    BitMask32,
+    Camera,
+    CardMaker,
+    ClipPlaneAttrib,
+    DepthTestAttrib,
+    FrameBufferProperties,
+    Geom,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexData,
+    GeomVertexFormat,
+    GeomVertexWriter,
+    GraphicsOutput,
+    Mat4,
+    Material,
+    MatrixLens,
+    NodePath,
+    OmniBoundingVolume,
+    OrthographicLens,
+    Plane,
+    PlaneNode,
+    SamplerState,
+    Shader,
+    Texture,
+    TextureStage,
+    Vec3,
+    Vec4
+)
+
+
+# Functions
+# =========
+def load_shader(vert_path, frag_path, clip_mode, defines=""):
+    # In oblique mode, the water cameras are clipped by their near planes and no clip plane is ever enabled, so
+    # shaders are compiled without their clip plane uniform and clip distance. Any other defines are inserted
+    # after the version directive as well.
+    if clip_mode == WaterPlane.CM_oblique:
+        defines += "#define WATER_OBLIQUE_CLIPPING\n"
+
+    with open(vert_path) as f:
+        vert_version, vert_src = f.read().split("\n", 1)
+
+    with open(frag_path) as f:
+        frag_version, frag_src = f.read().split("\n", 1)
+
+    return Shader.make(
+        Shader.SL_GLSL,
+        "{}\n{}{}".format(vert_version, defines, vert_src),
+        "{}\n{}{}".format(frag_version, defines, frag_src)
+    )
+
+
+# Classes
+# =======
+class WaterPlane(object):
+    # Reflection modes
+    RM_planar = "planar"
+    RM_screen_space = "screen_space"
+
+    # Refraction modes
+    RFM_separate_pass = "separate_pass"
+    RFM_main_pass = "main_pass"
+
+    # Clip modes
+    CM_clip_plane = "clip_plane"
+    CM_oblique = "oblique"
+
+    # Mesh modes
+    MM_quad = "quad"
+    MM_projected_grid = "projected_grid"
+
+    # Depth formats
+    DF_depth16 = "depth16"
+    DF_depth24 = "depth24"
+    DF_depth32f = "depth32f"
+
+    # Depth bits, float depth flag, and texture format of each depth format
+    depth_format_props = {
+        DF_depth16: (16, False, Texture.F_depth_component16),
+        DF_depth24: (24, False, Texture.F_depth_component24),
+        DF_depth32f: (32, True, Texture.F_depth_component32)
+    }
+
+    # Camera mask used to hide water planes from the water cameras
+    water_camera_mask = BitMask32.bit(1)
+
+    # Camera mask used by the main camera when the scene is rendered in a separate main pass
+    composite_camera_mask = BitMask32.bit(2)
+
+    water_shaders = {}
+    composite_shader = Shader.load(
+        Shader.SL_GLSL,
+        "shaders/Composite.vert.glsl",
+        "shaders/Composite.frag.glsl"
+    )
+    water_mat = None
+    plane_mesh = None
+    grid_meshes = {}
+    scene_buf = None
+
+    notify = directNotify.newCategory("WaterPlane")
+
+    def __init__(self, pos=Vec3(), heading=0, scale=Vec3(1, 1, 1), reflection_mode=RM_planar,
+        refraction_mode=RFM_separate_pass, clip_mode=CM_clip_plane, depth_format=DF_depth24,
+        linear_depth=False, strict_depth=False, mesh_mode=MM_quad, grid_size=128, grid_max_distance=4096.0,
+        sky_color=None, sky_map=None):
+        if reflection_mode not in (self.RM_planar, self.RM_screen_space):
+            raise ValueError("Unknown reflection mode: {}".format(reflection_mode))
+
+        if refraction_mode not in (self.RFM_separate_pass, self.RFM_main_pass):
+            raise ValueError("Unknown refraction mode: {}".format(refraction_mode))
+
+        if clip_mode not in (self.CM_clip_plane, self.CM_oblique):
+            raise ValueError("Unknown clip mode: {}".format(clip_mode))
+
+        if depth_format not in self.depth_format_props:
+            raise ValueError("Unknown depth format: {}".format(depth_format))
+
+        if mesh_mode not in (self.MM_quad, self.MM_projected_grid):
+            raise ValueError("Unknown mesh mode: {}".format(mesh_mode))
+
+        self.reflection_mode = reflection_mode
+        self.refraction_mode = refraction_mode
+        self.clip_mode = clip_mode
+        self.depth_format = depth_format
+        self.linear_depth = linear_depth
+        self.strict_depth = strict_depth
+        self.mesh_mode = mesh_mode
+
+        # Load the water shader for this clip mode if necessary
+        if clip_mode not in self.water_shaders:
+            WaterPlane.water_shaders[clip_mode] = load_shader(
+                "shaders/Water.vert.glsl",
+                "shaders/Water.frag.glsl",
+                clip_mode
+            )
+
+        # Initialize water material if necessary
+        if self.water_mat is None:
+            WaterPlane.water_mat = Material()
+            self.water_mat.set_base_color(Vec4(1, 1, 1, 1))
+            self.water_mat.set_metallic(0)
+            self.water_mat.set_emission(Vec4(0, 0, 0, 1))
+            self.water_mat.set_roughness(.2)
+            self.water_mat.set_refractive_index(1)
+
+        # Get the default camera lens
+        cam_lens = base.cam.node().get_lens()
+
+        # Create refraction buffer. Using (0, 0) for the size indicates that the size of the buffer should
+        # be synced with the main window. In main pass mode, the scene is rendered once into a shared
+        # main pass buffer and its color and depth are used for refraction instead.
+        self.refract_buf = None
+        self.refract_cam = None
+
+        if self.refraction_mode == self.RFM_separate_pass:
+            # In linear depth mode, the linear depth is stored in the alpha channel of the refraction texture,
+            # so the depth buffer doesn't need to be kept in a texture
+            self.refract_buf = self.make_scene_buffer(
+                "WaterRefractionBuffer",
+                None if self.linear_depth else "RefractionDepth"
+            )
+            self.refract_buf.set_sort(-100)
+            self.refract_tex = self.refract_buf.get_texture()
+            self.refract_tex.wrap_u = SamplerState.WM_repeat
+            self.refract_tex.wrap_v = SamplerState.WM_repeat
+
+            if self.linear_depth:
+                self.refract_depth_tex = self.refract_tex
+
+            else:
+                self.refract_depth_tex = self.refract_buf.get_texture(1)
+                self.refract_depth_tex.minfilter = SamplerState.FT_nearest
+                self.refract_depth_tex.magfilter = SamplerState.FT_nearest
+
+            # In oblique mode the water cameras need their own lenses since their projection matrices are
+            # changed every frame
+            self.refract_lens = MatrixLens() if self.clip_mode == self.CM_oblique else cam_lens
+            self.refract_cam = base.make_camera(self.refract_buf, lens=self.refract_lens)
+            self.refract_cam.node().set_camera_mask(self.water_camera_mask)
+            self.refract_cam.reparent_to(base.render)
+
+        else:
+            # Initialize main pass if necessary
+            if self.scene_buf is None:
+                self.setup_main_pass(cam_lens)
+
+            self.refract_tex = self.scene_tex
+            self.refract_depth_tex = self.scene_tex if self.linear_depth else self.scene_depth_tex
+
+        # Create reflection buffer. Using (0, 0) for the size indicates that the size of the buffer should
+        # be synced with the main window. Screen-space reflections are traced through the refraction
+        # buffer instead, so they don't need a reflection buffer or camera.
+        self.reflect_buf = None
+        self.reflect_cam = None
+
+        if self.reflection_mode == self.RM_planar:
+            self.reflect_buf = base.win.make_texture_buffer("WaterReflectionBuffer", 0, 0)
+            self.reflect_buf.set_sort(-100)
+            self.reflect_tex = self.reflect_buf.get_texture()
+            self.reflect_tex.wrap_u = SamplerState.WM_repeat
+            self.reflect_tex.wrap_v = SamplerState.WM_repeat
+
+            self.reflect_lens = MatrixLens() if self.clip_mode == self.CM_oblique else cam_lens
+            self.reflect_cam = base.make_camera(self.reflect_buf, lens=self.reflect_lens)
+            self.reflect_cam.node().set_camera_mask(self.water_camera_mask)
+            self.reflect_cam.reparent_to(base.render)
+
+        else:
+            self.reflect_tex = self.refract_tex
+
+        # Register water camera update task
+        base.task_mgr.add(self.update_cameras, "update_water_cameras")
+
+        # The actual format of a render texture is only known once its buffer has been rendered, so the
+        # refraction targets are checked after the first frame
+        base.task_mgr.add(self.check_refraction_targets, "check_water_refraction_targets", sort=51)
+
+        # Initialize plane mesh if necessary
+        if self.plane_mesh is None:
+            # Get V3N3T2 format
+            vtx_format = GeomVertexFormat.get_v3()
+
+            # Allocate vertex data
+            vertices = GeomVertexData("WaterPlane", vtx_format, Geom.UH_static)
+            vertices.reserve_num_rows(4)
+
+            # Write vertex data
+            vertex = GeomVertexWriter(vertices, "vertex")
+            vertex.add_data3(-1, 1, 0)
+            vertex.add_data3(1, 1, 0)
+            vertex.add_data3(-1, -1, 0)
+            vertex.add_data3(1, -1, 0)
+
+            # Allocate primitive data
+            triangles = GeomTriangles(Geom.UH_static)
+            triangles.reserve_num_vertices(6)
+
+            # Write primitive data
+            triangles.add_vertices(0, 2, 1)
+            triangles.add_vertices(1, 2, 3)
+
+            # Create plane mesh
+            WaterPlane.plane_mesh = Geom(vertices)
+            self.plane_mesh.add_primitive(triangles)
+
+        # Initialize projected grid mesh if necessary
+        if self.mesh_mode == self.MM_projected_grid and grid_size not in self.grid_meshes:
+            self.grid_meshes[grid_size] = self.make_grid_mesh(grid_size)
+
+        # Load textures
+        self.dudv_map_tex = base.loader.load_texture("images/WaterDUDV.png")
+        self.dudv_map_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.dudv_map_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.normal_map_tex = base.loader.load_texture("images/WaterNormal.png")
+        self.normal_map_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.normal_map_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        # Create water plane. The vertices of the projected grid are in screen space and are projected onto the
+        # water plane by the vertex shader, so the water plane must never be culled.
+        self.plane = base.render.attach_new_node(GeomNode("WaterPlane"))
+
+        if self.mesh_mode == self.MM_projected_grid:
+            self.plane.node().add_geom(self.grid_meshes[grid_size])
+            self.plane.node().set_bounds(OmniBoundingVolume())
+            self.plane.node().set_final(True)
+
+        else:
+            self.plane.node().add_geom(self.plane_mesh)
+
+        self.plane.set_pos(pos)
+        self.plane.set_h(heading)
+        self.plane.set_scale(scale)
+        self.plane.hide(self.water_camera_mask)
+        self.plane.show_through(self.composite_camera_mask)
+
+        self.plane.set_shader(self.water_shaders[self.clip_mode])
+        self.plane.set_shader_input("waveSpeed", .01)
+        self.plane.set_shader_input("ssrEnabled", self.reflection_mode == self.RM_screen_space)
+        self.plane.set_shader_input("ssrMaxSteps", 32)
+        self.plane.set_shader_input("ssrMaxDistance", 256.0)
+        self.plane.set_shader_input("ssrThickness", 2.0)
+        self.plane.set_shader_input("linearDepthEnabled", self.linear_depth)
+        self.plane.set_shader_input("depthCam", self.refract_cam if self.refract_cam is not None else base.cam)
+        self.plane.set_shader_input("softEdgeDepth", 2.0)
+        self.plane.set_shader_input("projectedGridEnabled", self.mesh_mode == self.MM_projected_grid)
+        self.plane.set_shader_input("gridMaxDistance", grid_max_distance / max(scale.x, scale.y))
+
+        stage1 = TextureStage("ReflectionTex")
+        stage2 = TextureStage("DUDVMap")
+        stage3 = TextureStage("NormalMap")
+        stage4 = TextureStage("RefractionDepth")
+
+        self.plane.set_texture(self.refract_tex)
+        self.plane.set_texture(stage1, self.reflect_tex)
+        self.plane.set_texture(stage2, self.dudv_map_tex)
+        self.plane.set_texture(stage3, self.normal_map_tex)
+        self.plane.set_texture(stage4, self.refract_depth_tex)
+
+        self.sky_map_stage = TextureStage("SkyMap")
+
+        # Screen-space rays that leave the screen fall back to the sky map. If no sky map was given, a
+        # single-texel cube map filled with the sky color is used instead.
+        if sky_map is not None:
+            self.set_sky_map(sky_map)
+
+        else:
+            self.set_sky_color(sky_color if sky_color is not None else base.win.get_clear_color())
+
+        self.plane.set_material(self.water_mat)
+
+        # Configure refraction clipping plane. In screen-space mode the refraction buffer doubles as
+        # the scene color and depth buffer the reflections are traced through, so it must not be
+        # clipped at the water surface.
+        self.refract_clip_plane = None
+        self.reflect_clip_plane = None
+
+        if self.reflection_mode == self.RM_planar and self.refract_cam is not None:
+            self.refract_clip_plane = Plane(0, 0, -1, -.001)
+
+        # Configure reflection clipping plane
+        if self.reflect_cam is not None:
+            self.reflect_clip_plane = Plane(0, 0, 1, -.001)
+
+        # In clip plane mode, the water cameras clip the scene with clipping planes attached to the water
+        # plane. In oblique mode, the clipping planes are turned into the near planes of the water cameras
+        # by update_cameras instead.
+        if self.clip_mode == self.CM_clip_plane:
+            if self.refract_clip_plane is not None:
+                clip_plane_np = self.plane.attach_new_node(PlaneNode(
+                    "WaterRefractClipPlane",
+                    self.refract_clip_plane
+                ))
+                clip_state = ClipPlaneAttrib.make_default().add_on_plane(clip_plane_np)
+                self.refract_cam.node().set_initial_state(clip_state)
+
+            if self.reflect_clip_plane is not None:
+                clip_plane_np = self.plane.attach_new_node(PlaneNode(
+                    "WaterReflectClipPlane",
+                    self.reflect_clip_plane
+                ))
+                clip_state = ClipPlaneAttrib.make_default().add_on_plane(clip_plane_np)
+                self.reflect_cam.node().set_initial_state(clip_state)
+
+    def make_grid_mesh(self, grid_size):
+        # Get V3 format
+        vtx_format = GeomVertexFormat.get_v3()
+
+        # Allocate vertex data
+        vertices = GeomVertexData("WaterGrid", vtx_format, Geom.UH_static)
+        vertices.reserve_num_rows((grid_size + 1) * (grid_size + 1))
+
+        # Write vertex data. The grid covers slightly more than the screen, so that the edges of the water
+        # stay off screen when the water is distorted.
+        vertex = GeomVertexWriter(vertices, "vertex")
+        extent = 1.05
+
+        for y in range(grid_size + 1):
+            for x in range(grid_size + 1):
+                vertex.add_data3(
+                    (x / grid_size * 2 - 1) * extent,
+                    (y / grid_size * 2 - 1) * extent,
+                    0
+                )
+
+        # Allocate primitive data
+        triangles = GeomTriangles(Geom.UH_static)
+        triangles.reserve_num_vertices(grid_size * grid_size * 6)
+
+        # Write primitive data
+        for y in range(grid_size):
+            for x in range(grid_size):
+                i = y * (grid_size + 1) + x
+                triangles.add_vertices(i, i + 1, i + grid_size + 1)
+                triangles.add_vertices(i + 1, i + grid_size + 2, i + grid_size + 1)
+
+        # Create grid mesh
+        grid_mesh = Geom(vertices)
+        grid_mesh.add_primitive(triangles)
+        return grid_mesh
+
+    def setup_main_pass(self, cam_lens):
+        # Create main pass buffer. The scene without water is rendered into this buffer once and then
+        # composited into the main window, after which the water planes are drawn on top of it.
+        # The depth texture is always needed here, since it is copied into the main window.
+        WaterPlane.scene_buf = self.make_scene_buffer("WaterMainPassBuffer", "MainPassDepth")
+        self.scene_buf.set_sort(-50)
+        WaterPlane.scene_tex = self.scene_buf.get_texture()
+        WaterPlane.scene_depth_tex = self.scene_buf.get_texture(1)
+        self.scene_tex.wrap_u = SamplerState.WM_repeat
+        self.scene_tex.wrap_v = SamplerState.WM_repeat
+        self.scene_depth_tex.minfilter = SamplerState.FT_nearest
+        self.scene_depth_tex.magfilter = SamplerState.FT_nearest
+
+        # The main pass camera follows the main camera, so it doesn't need to be updated every frame
+        WaterPlane.scene_cam = base.make_camera(self.scene_buf, lens=cam_lens)
+        self.scene_cam.node().set_camera_mask(self.water_camera_mask)
+        self.scene_cam.reparent_to(base.camera)
+
+        # Composite the main pass color and depth into the main window before the main camera's
+        # display region is drawn
+        cm = CardMaker("WaterComposite")
+        cm.set_frame_fullscreen_quad()
+        WaterPlane.composite_root = NodePath("WaterCompositeRoot")
+        composite = self.composite_root.attach_new_node(cm.generate())
+        composite.set_shader(self.composite_shader)
+        composite.set_texture(self.scene_tex)
+        composite.set_texture(TextureStage("MainPassDepth"), self.scene_depth_tex)
+        composite.set_attrib(DepthTestAttrib.make(DepthTestAttrib.M_always))
+        composite.set_depth_write(True)
+
+        composite_lens = OrthographicLens()
+        composite_lens.set_film_size(2, 2)
+        composite_lens.set_near_far(-1, 1)
+        composite_cam = self.composite_root.attach_new_node(Camera("WaterCompositeCam", composite_lens))
+
+        WaterPlane.composite_region = base.win.make_display_region()
+        self.composite_region.set_sort(-1)
+        self.composite_region.set_camera(composite_cam)
+
+        # From now on the main camera only draws the water planes
+        base.render.hide(self.composite_camera_mask)
+        base.cam.node().set_camera_mask(self.composite_camera_mask)
+
+    def make_scene_buffer(self, name, depth_tex_name):
+        # Request the depth format explicitly instead of inheriting it from the main window. In linear depth
+        # mode, a half float color buffer is used so that its alpha channel can hold the linear depth.
+        depth_bits, float_depth, depth_tex_format = self.depth_format_props[self.depth_format]
+        fb_props = FrameBufferProperties()
+        fb_props.set_rgb_color(True)
+        fb_props.set_depth_bits(depth_bits)
+        fb_props.set_float_depth(float_depth)
+
+        if self.linear_depth:
+            fb_props.set_float_color(True)
+            fb_props.set_rgba_bits(16, 16, 16, 16)
+
+        else:
+            fb_props.set_rgba_bits(8, 8, 8, 8)
+
+        # Using (0, 0) for the size indicates that the size of the buffer should be synced with the main
+        # window
+        buf = base.win.make_texture_buffer(name, 0, 0, None, False, fb_props)
+
+        if buf is None:
+            raise RuntimeError("Failed to create {} with {} depth".format(name, self.depth_format))
+
+        if self.linear_depth:
+            # Sky pixels are never written by the scene shaders, so they are cleared to the far distance
+            clear_color = Vec4(buf.get_clear_color())
+            clear_color.w = base.cam.node().get_lens().get_far()
+            buf.set_clear_color(clear_color)
+
+        if depth_tex_name is not None:
+            depth_tex = Texture(depth_tex_name)
+            depth_tex.set_format(depth_tex_format)
+            buf.add_render_texture(depth_tex, GraphicsOutput.RTM_bind_or_copy, GraphicsOutput.RTP_depth)
+
+        return buf
+
+    def check_refraction_targets(self, task):
+        # Find the buffer and textures used for refraction
+        buf = self.refract_buf if self.refract_buf is not None else self.scene_buf
+        expected = [(self.refract_tex, Texture.F_rgba16 if self.linear_depth else Texture.F_rgba8)]
+
+        if buf.count_textures() > 1:
+            expected.append((buf.get_texture(1), self.depth_format_props[self.depth_format][2]))
+
+        problems = []
+
+        # Buffers that can't render into textures directly are silently replaced with parasite buffers that
+        # render into the main window and copy the result into their textures every frame
+        if not buf.get_supports_render_texture():
+            problems.append("{} fell back to copying its textures ({})".format(
+                buf.get_name(),
+                buf.get_type().get_name()
+            ))
+
+        # Drivers may also give us a different format than the one we asked for
+        for tex, tex_format in expected:
+            self.notify.info("{} uses {}".format(tex.get_name(), Texture.format_format(tex.get_format())))
+
+            if tex.get_format() != tex_format:
+                problems.append("{} uses {} instead of {}".format(
+                    tex.get_name(),
+                    Texture.format_format(tex.get_format()),
+                    Texture.format_format(tex_format)
+                ))
+
+        for problem in problems:
+            self.notify.warning(problem)
+
+        if problems and self.strict_depth:
+            raise RuntimeError("Refraction targets don't match the requested formats")
+
+        return task.done
+
+    def set_sky_color(self, color):
+        sky_map = Texture("WaterSkyColor")
+        sky_map.setup_cube_map(1, Texture.T_unsigned_byte, Texture.F_rgba)
+        texel = bytes(int(round(min(max(c, 0), 1) * 255)) for c in (color[2], color[1], color[0], color[3]))
+        sky_map.set_ram_image(texel * 6)
+        self.set_sky_map(sky_map)
+
+    def set_sky_map(self, tex):
+        self.sky_map_tex = tex
+        self.plane.set_texture(self.sky_map_stage, tex)
+
+    def update_oblique_lens(self, cam, lens, clip_plane):
+        # The view frustum Panda3D derives from an oblique projection matrix is not usable for culling, so
+        # cull with the frustum of the main camera instead
+        cam_lens = base.cam.node().get_lens()
+        cam.node().set_cull_bounds(cam_lens.make_bounds())
+
+        # Transform the clipping plane into the coordinate space of the camera
+        proj_mat = Mat4(cam_lens.get_projection_mat())
+        plane = Vec4(clip_plane * self.plane.get_mat(cam))
+
+        # An oblique near plane only works if the camera is on the clipped side of the plane. Otherwise,
+        # fall back to the regular projection matrix.
+        if plane.w >= 0:
+            lens.set_user_mat(proj_mat)
+            return
+
+        # Find the corner of the view frustum opposite the clipping plane. Panda3D uses row vectors, so the
+        # plane is transformed into clip space with the transpose of the inverse projection matrix.
+        inv_proj_mat = Mat4(proj_mat)
+        inv_proj_mat.invert_in_place()
+        inv_proj_mat_t = Mat4()
+        inv_proj_mat_t.transpose_from(inv_proj_mat)
+        clip_plane = inv_proj_mat_t.xform(plane)
+        corner = inv_proj_mat.xform(Vec4(
+            math.copysign(1, clip_plane.x),
+            math.copysign(1, clip_plane.y),
+            1,
+            1
+        ))
+
+        # Replace the depth column of the projection matrix so that the clipping plane becomes the near plane
+        scaled_plane = plane * (2 / plane.dot(corner))
+
+        for i in range(4):
+            proj_mat.set_cell(i, 2, scaled_plane[i] - proj_mat.get_cell(i, 3))
+
+        lens.set_user_mat(proj_mat)
+
+    def update_cameras(self, task):
+        # Update refraction and reflection cameras
+        if self.refract_cam is not None:
+            self.refract_cam.set_transform(base.camera.get_transform())
+
+        if self.reflect_cam is not None:
+            self.reflect_cam.set_transform(base.camera.get_transform())
+            cam_height = base.camera.get_z()
+            dist = cam_height - self.plane.get_z()
+            self.reflect_cam.set_z(self.reflect_cam.get_z() - dist * 2)
+            self.reflect_cam.set_p(-self.reflect_cam.get_p())
+            self.reflect_cam.set_r(self.reflect_cam.get_r() + 180)
+
+        # Update oblique projection matrices
+        if self.clip_mode == self.CM_oblique:
+            if self.refract_clip_plane is not None:
+                self.update_oblique_lens(self.refract_cam, self.refract_lens, self.refract_clip_plane)
+
+            elif self.refract_cam is not None:
+                self.refract_lens.set_user_mat(base.cam.node().get_lens().get_projection_mat())
+
+            if self.reflect_clip_plane is not None:
+                self.update_oblique_lens(self.reflect_cam, self.reflect_lens, self.reflect_clip_plane)
+
+        # Update window size uniform
+        self.plane.set_shader_input("winSize", base.win.get_size())
+        return task.cont
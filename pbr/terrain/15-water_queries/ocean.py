@@ -0,0 +1,222 @@
+import math
+import threading
+import time
+
+import numpy as np
+from panda3d.core import (
+    ClockObject,
+    SamplerState,
+    Texture,
+    Vec2
+)
+
+
+# Classes
+# =======
+class OceanSimulation(object):
+    # Spectrum types
+    ST_phillips = "phillips"
+    ST_jonswap = "jonswap"
+
+    gravity = 9.81
+
+    def __init__(self, resolution=128, patch_size=256.0, tick_rate=30.0, spectrum=ST_phillips,
+        wind_speed=20.0, wind_dir=Vec2(1, 1), fetch=100000.0, wave_height=4.0, choppiness=1.0, seed=0):
+        if spectrum not in (self.ST_phillips, self.ST_jonswap):
+            raise ValueError("Unknown spectrum: {}".format(spectrum))
+
+        self.resolution = resolution
+        self.patch_size = patch_size
+        self.tick_rate = tick_rate
+
+        # Calculate the wave vector of each frequency in the FFT grid
+        k = np.fft.fftfreq(resolution, patch_size / resolution) * 2 * math.pi
+        kx, ky = np.meshgrid(k, k)
+        k_len = np.sqrt(kx * kx + ky * ky)
+        k_len[0, 0] = 1
+
+        # Calculate the energy of each wave vector and the initial wave amplitudes
+        wind_dir = Vec2(wind_dir).normalized()
+        cos_theta = (kx * wind_dir.x + ky * wind_dir.y) / k_len
+
+        if spectrum == self.ST_phillips:
+            energy = self.phillips(k_len, cos_theta, wind_speed)
+
+        else:
+            energy = self.jonswap(k_len, cos_theta, wind_speed, fetch)
+
+        energy[0, 0] = 0
+        rng = np.random.default_rng(seed)
+        noise = rng.standard_normal((resolution, resolution)) + 1j * rng.standard_normal((resolution, resolution))
+        h0 = noise * np.sqrt(energy / 2)
+
+        # The height field must be real, so each wave is paired with the conjugate of the wave travelling in
+        # the opposite direction
+        h0_minus_conj = np.conj(np.roll(np.flip(h0), 1, axis=(0, 1)))
+
+        # Scale the amplitudes so that the significant wave height, which is about 4 times the standard deviation
+        # of the height field, matches the requested wave height
+        std_dev = np.sqrt(np.sum(np.abs(h0) ** 2 + np.abs(h0_minus_conj) ** 2))
+
+        if std_dev > 0:
+            h0 *= wave_height / 4 / std_dev
+            h0_minus_conj *= wave_height / 4 / std_dev
+
+        self.h0 = h0
+        self.h0_minus_conj = h0_minus_conj
+        self.omega = np.sqrt(self.gravity * k_len)
+
+        # Precalculate the factors that turn the height spectrum into the horizontal displacement and slope
+        # spectra
+        self.disp_x = -1j * kx / k_len * choppiness
+        self.disp_y = -1j * ky / k_len * choppiness
+        self.slope_x = 1j * kx
+        self.slope_y = 1j * ky
+
+        # Create displacement and normal textures
+        self.displacement_tex = Texture("OceanDisplacement")
+        self.displacement_tex.setup_2d_texture(resolution, resolution, Texture.T_float, Texture.F_rgba32)
+        self.normal_tex = Texture("OceanNormal")
+        self.normal_tex.setup_2d_texture(resolution, resolution, Texture.T_unsigned_byte, Texture.F_rgba8)
+
+        for tex in (self.displacement_tex, self.normal_tex):
+            tex.wrap_u = SamplerState.WM_repeat
+            tex.wrap_v = SamplerState.WM_repeat
+            tex.minfilter = SamplerState.FT_linear
+            tex.magfilter = SamplerState.FT_linear
+
+        # Calculate the initial state, so the textures are valid before the first tick has finished
+        self.displacement = None
+        self.normal = None
+        self.pending = None
+        self.upload_textures(self.simulate(0))
+
+        # Initialize thread state
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.tick_count = 0
+        self.tick_time = 0.0
+        self.dropped_count = 0
+
+    def phillips(self, k_len, cos_theta, wind_speed):
+        # The largest waves that can be created by the wind and the smallest waves worth simulating
+        max_wave = wind_speed * wind_speed / self.gravity
+        min_wave = max_wave / 1000
+
+        # Waves travelling against the wind are suppressed
+        return (
+            np.exp(-1 / (k_len * max_wave) ** 2) / k_len ** 4
+            * np.maximum(cos_theta, 0) ** 2
+            * np.exp(-(k_len * min_wave) ** 2)
+        )
+
+    def jonswap(self, k_len, cos_theta, wind_speed, fetch):
+        # Calculate the peak frequency and energy scale of a sea that developed over the given fetch
+        omega = np.sqrt(self.gravity * k_len)
+        g = self.gravity
+        peak_omega = 22 * (g * g / (wind_speed * fetch)) ** (1 / 3)
+        alpha = .076 * (wind_speed * wind_speed / (fetch * g)) ** .22
+        sigma = np.where(omega <= peak_omega, .07, .09)
+        r = np.exp(-(omega - peak_omega) ** 2 / (2 * sigma * sigma * peak_omega * peak_omega))
+        energy = alpha * g * g / omega ** 5 * np.exp(-1.25 * (peak_omega / omega) ** 4) * 3.3 ** r
+
+        # Convert the frequency spectrum into a wave vector spectrum and spread it around the wind direction
+        d_omega = g / (2 * omega)
+        return energy * d_omega / k_len * np.maximum(cos_theta, 0) ** 2
+
+    def simulate(self, t):
+        # Advance each wave by its own frequency
+        phase = np.exp(1j * self.omega * t)
+        h = self.h0 * phase + self.h0_minus_conj * np.conj(phase)
+
+        # The height, displacement, and slope fields are all real, so pairs of them can share a single inverse
+        # FFT by packing one into the real part and the other into the imaginary part
+        fields = np.fft.ifft2(np.stack((
+            h + 1j * (self.disp_x * h),
+            self.disp_y * h + 1j * (self.slope_x * h),
+            self.slope_y * h
+        )), norm="forward")
+        height = fields[0].real
+        disp_x = fields[0].imag
+        disp_y = fields[1].real
+        slope_x = fields[1].imag
+        slope_y = fields[2].real
+
+        # Panda3D stores texels in BGRA order
+        displacement = np.empty((self.resolution, self.resolution, 4), np.float32)
+        displacement[..., 0] = height
+        displacement[..., 1] = disp_y
+        displacement[..., 2] = disp_x
+        displacement[..., 3] = 0
+
+        normal = np.empty((self.resolution, self.resolution, 4), np.float32)
+        normal[..., 0] = 1
+        normal[..., 1] = -slope_y
+        normal[..., 2] = -slope_x
+        normal[..., :3] /= np.linalg.norm(normal[..., :3], axis=2, keepdims=True)
+        normal[..., 3] = 1
+        normal = (normal * 127.5 + 127.5).astype(np.uint8)
+        return displacement, normal
+
+    def start(self):
+        # Start simulation thread and texture upload task
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="OceanSimulation", daemon=True)
+        self.thread.start()
+        base.task_mgr.add(self.update_textures, "update_ocean_textures", sort=-10)
+
+    def stop(self):
+        # Stop simulation thread and texture upload task
+        self.running = False
+        base.task_mgr.remove("update_ocean_textures")
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        clock = ClockObject.get_global_clock()
+        tick_length = 1 / self.tick_rate
+        next_tick = time.perf_counter()
+
+        while self.running:
+            # Simulate the ocean at the current frame time, so the waves stay in sync with the rest of the scene
+            start = time.perf_counter()
+            result = self.simulate(clock.get_frame_time())
+            end = time.perf_counter()
+
+            # Hand the result to the render thread. If the previous result was never uploaded, it is dropped.
+            with self.lock:
+                if self.pending is not None:
+                    self.dropped_count += 1
+
+                self.pending = result
+                self.tick_count += 1
+                self.tick_time += end - start
+
+            # Wait for the next tick. If the simulation fell behind, don't try to catch up.
+            next_tick = max(next_tick + tick_length, end)
+            time.sleep(max(next_tick - time.perf_counter(), 0))
+
+    def update_textures(self, task):
+        # Take the latest result while holding the lock, but upload it after releasing it, so the simulation
+        # thread is never blocked by the upload
+        with self.lock:
+            result = self.pending
+            self.pending = None
+
+        if result is not None:
+            self.upload_textures(result)
+
+        return task.cont
+
+    def upload_textures(self, result):
+        self.displacement = result[0]
+        self.normal = result[1]
+        self.displacement_tex.set_ram_image(result[0])
+        self.normal_tex.set_ram_image(result[1])
+
+    def get_average_tick_time(self):
+        with self.lock:
+            return self.tick_time / self.tick_count if self.tick_count > 0 else 0.0
@@ -0,0 +1,363 @@
+#version 140
+
+in vec3 fragPos;
+in vec2 uv;
+in vec2 oceanUV;
+in vec3 toCameraVec;
+
+uniform mat4 p3d_ViewMatrix;
+uniform struct p3d_LightModelParameters {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct p3d_LightSourceParameters {
+    // Primary light color.
+    vec4 color;
+
+    // Light color broken up into components, for compatibility with legacy
+    // shaders. These are now deprecated.
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 specular;
+
+    // View-space position. If w=0, this is a directional light, with the xyz
+    // being -direction.
+    vec4 position;
+
+    // Spotlight-only settings
+    vec3 spotDirection;
+    float spotExponent;
+    float spotCutoff;
+    float spotCosCutoff;
+
+    // Individual attenuation constants
+    float constantAttenuation;
+    float linearAttenuation;
+    float quadraticAttenuation;
+
+    // constant, linear, quadratic attenuation in one vector
+    vec3 attenuation;
+
+    // Shadow map for this light source
+    sampler2DShadow shadowMap;
+
+    // Transforms view-space coordinates to shadow map coordinates
+    mat4 shadowViewMatrix;
+} p3d_LightSource[2];
+uniform struct p3d_MaterialParameters {
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 emission;
+    vec3 specular;
+    float shininess;
+    
+    vec4 baseColor;
+    float roughness;
+    float metallic;
+    float refractiveIndex;
+} p3d_Material;
+uniform struct p3d_FogParameters {
+    vec4 color;
+    float density;
+    float start;
+    float end;
+    float scale; // 1.0 / (end - start)
+} p3d_Fog;
+uniform vec2 winSize;
+uniform sampler2D p3d_Texture0;
+uniform sampler2D p3d_Texture1;
+uniform sampler2D p3d_Texture2;
+uniform sampler2D p3d_Texture3;
+uniform sampler2D p3d_Texture4;
+uniform samplerCube p3d_Texture5;
+uniform sampler2D p3d_Texture7;
+uniform mat4 p3d_ProjectionMatrix;
+uniform mat4 trans_apiclip_of_depthCam_to_apiview;
+uniform mat4 p3d_ViewMatrixInverse;
+uniform mat3 p3d_NormalMatrix;
+uniform float osg_FrameTime;
+uniform float waveSpeed;
+uniform int ssrEnabled;
+uniform int ssrMaxSteps;
+uniform float ssrMaxDistance;
+uniform float ssrThickness;
+uniform int linearDepthEnabled;
+uniform float softEdgeDepth;
+uniform int oceanEnabled;
+uniform int ripplesEnabled;
+uniform sampler2D rippleMap;
+
+out vec4 p3d_FragColor;
+
+const float PI = 3.14159265359;
+
+
+float distributionGGX(vec3 N, vec3 H, float roughness) {
+    float a = roughness * roughness;
+    float a2 = a * a;
+    float NdotH = max(dot(N, H), 0.0);
+    float NdotH2 = NdotH * NdotH;
+
+    float num = a2;
+    float denom = (NdotH2 * (a2 - 1.0) + 1.0);
+    denom = PI * denom * denom;
+    return num / denom;
+}
+
+
+float geometrySchlickGGX(float NdotV, float roughness) {
+    float r = (roughness + 1.0);
+    float k = (r * r) / 8.0;
+
+    float num = NdotV;
+    float denom = NdotV * (1.0 - k) + k;
+
+    return num / denom;
+}
+
+
+float geometrySmith(vec3 N, vec3 V, vec3 L, float roughness) {
+    float NdotV = max(dot(N, V), 0.0);
+    float NdotL = max(dot(N, L), 0.0);
+    float ggx2 = geometrySchlickGGX(NdotV, roughness);
+    float ggx1 = geometrySchlickGGX(NdotL, roughness);
+
+    return ggx1 * ggx2;
+}
+
+
+vec3 fresnelSchlick(float cosTheta, vec3 F0) {
+    return F0 + (1.0 - F0) * pow(clamp(1.0 - cosTheta, 0.0, 1.0), 5.0);
+}
+
+
+vec4 applyLighting(vec4 albedo, float metallic, float emission, 
+    float roughness, vec3 normal) {
+    // Normalize normal and extract camera position from view matrix
+    vec3 N = normalize(normal);
+    vec3 cameraPos = p3d_ViewMatrix[3].xyz;
+
+    // Calculate view vector
+    vec3 V = normalize(cameraPos - fragPos);
+
+    // Calculate base reflectivity
+    vec3 F0 = vec3(.04);
+    F0 = mix(F0, albedo.rgb, metallic);
+
+    // Calculate total radiance
+    vec3 Lo = vec3(0.0);
+
+    for(int i = 0; i < p3d_LightSource.length(); i++) {
+        // Calculate per-light radiance
+        vec3 lightDir = p3d_LightSource[i].position.xyz - fragPos * 
+            p3d_LightSource[i].position.w;
+        vec3 L = normalize(lightDir);
+        vec3 H = normalize(V + L);
+        float dist = length(lightDir);
+        vec3 atten = p3d_LightSource[i].attenuation;
+        float attenuation = 1.0 / (atten.x + atten.y * dist + 
+            atten.z * dist * dist);
+        vec3 radiance = p3d_LightSource[i].color.rgb * attenuation;
+
+        // Cook-Torrance BRDF
+        float NDF = distributionGGX(N, H, roughness);
+        float G = geometrySmith(N, V, L, roughness);
+        vec3 F = fresnelSchlick(max(dot(H, V), 0.0), F0);
+
+        vec3 kS = F;
+        vec3 kD = vec3(1.0) - kS;
+        kD *= 1.0 - metallic;
+
+        vec3 num = NDF * G * F;
+        float denom = 4.0 * max(dot(N, V), 0.0) * max(dot(N, L), 0.0) + 
+            .0001;
+        vec3 specular = num / denom;
+
+        // Add to outgoing radiance Lo
+        float NdotL = max(dot(N, L), 0.0);
+        Lo += (kD * albedo.rgb / PI + specular) * radiance * NdotL;
+
+        // Add emission
+        Lo += p3d_Material.emission.rgb * emission;
+    }
+
+    // Apply lighting to initial color
+    vec3 ambient = p3d_LightModel.ambient.rgb * albedo.rgb * 
+        p3d_Material.refractiveIndex;
+    vec3 color = ambient + Lo;
+    color = color / (color + vec3(1.0));
+    return vec4(color, albedo.a);
+}
+
+
+vec4 applyFog(vec4 color) {
+    // If fog is disabled, skip fog calculations
+    if(p3d_Fog.start == p3d_Fog.end) {
+        return color;
+    }
+
+    // Calculate linear fog
+    float dist = length(fragPos);
+    float fogFactor = (p3d_Fog.end - dist) / (p3d_Fog.end - p3d_Fog.start);
+    fogFactor = clamp(fogFactor, 0, 1);
+    return mix(p3d_Fog.color, color, fogFactor);
+}
+
+
+float getSceneDist(vec2 screenUV, vec2 screenScale) {
+    // In linear depth mode, the distance to the scene is stored in the alpha channel of the depth texture
+    if(linearDepthEnabled != 0) {
+        return texelFetch(p3d_Texture4, ivec2(screenUV * winSize), 0).a;
+    }
+
+    // Otherwise, reconstruct the view-space position stored in the depth buffer. The depth buffer may have
+    // been rendered with an oblique projection matrix, so the projection matrix of the camera that rendered
+    // it is used.
+    float depth = texture(p3d_Texture4, screenUV * screenScale).r;
+    vec4 viewPos = trans_apiclip_of_depthCam_to_apiview * vec4(vec3(screenUV, depth) * 2 - 1, 1);
+    return length(viewPos.xyz / viewPos.w);
+}
+
+
+vec4 traceReflection(vec3 reflectDir, vec2 screenScale, vec2 distortion) {
+    // March the reflected ray through the depth buffer until it passes behind the scene
+    float stepSize = ssrMaxDistance / float(ssrMaxSteps);
+    vec3 rayPos = fragPos;
+    vec3 prevPos = fragPos;
+
+    for(int i = 0; i < ssrMaxSteps; i++) {
+        prevPos = rayPos;
+        rayPos += reflectDir * stepSize;
+
+        // Project the ray position onto the screen
+        vec4 clipPos = p3d_ProjectionMatrix * vec4(rayPos, 1);
+
+        if(clipPos.w <= 0) {
+            break;
+        }
+
+        vec2 screenUV = clipPos.xy / clipPos.w * .5 + .5;
+
+        if(any(lessThan(screenUV, vec2(0))) || any(greaterThan(screenUV, vec2(1)))) {
+            break;
+        }
+
+        // Check if the ray passed behind the scene
+        float sceneDist = getSceneDist(screenUV, screenScale);
+        float rayDist = length(rayPos);
+
+        if(rayDist > sceneDist && rayDist - sceneDist < ssrThickness + stepSize) {
+            // Refine the hit position with a binary search between the last 2 ray positions
+            for(int j = 0; j < 5; j++) {
+                vec3 midPos = (prevPos + rayPos) * .5;
+                clipPos = p3d_ProjectionMatrix * vec4(midPos, 1);
+                screenUV = clipPos.xy / clipPos.w * .5 + .5;
+
+                if(length(midPos) > getSceneDist(screenUV, screenScale)) {
+                    rayPos = midPos;
+                } else {
+                    prevPos = midPos;
+                }
+            }
+
+            // Fade out reflections near the edges of the screen
+            vec2 edgeDist = min(screenUV, 1 - screenUV);
+            float edgeFade = clamp(min(edgeDist.x, edgeDist.y) * 10, 0, 1);
+            vec2 hitUV = clamp(screenUV + distortion, .001, .999) * screenScale;
+            return vec4(texture(p3d_Texture0, hitUV).rgb, edgeFade);
+        }
+    }
+
+    return vec4(0);
+}
+
+
+void main() {
+    // Calculate refraction and reflection UV coordinates
+    vec2 texSize = textureSize(p3d_Texture0, 0).xy;
+    vec2 texelSize = 1 / texSize;
+    vec2 ndc = gl_FragCoord.xy * texelSize;
+    vec2 refractUV = vec2(ndc.x, ndc.y);
+    vec2 reflectUV = vec2(-((texSize.x - winSize.x) * texelSize.x + ndc.x), ndc.y);
+
+    // Apply distortion
+    vec2 distortedUV = texture(p3d_Texture2, vec2(uv.x + osg_FrameTime * waveSpeed, uv.y)).rg * .1;
+    distortedUV = uv + vec2(distortedUV.x, distortedUV.y + osg_FrameTime * waveSpeed);
+    vec2 totalDistortion = (texture(p3d_Texture2, distortedUV).rg * 2 - 1) * .02;
+
+    // The normals of the ocean simulation tilt the distortion of the larger waves
+    vec3 oceanNormal = texture(p3d_Texture7, oceanUV).rgb * 2 - 1;
+
+    if(oceanEnabled != 0) {
+        totalDistortion += oceanNormal.xy * .2;
+    }
+
+    // The ripples also distort the refraction and reflection
+    vec2 rippleSlope = texture(rippleMap, uv).rg;
+
+    if(ripplesEnabled != 0) {
+        totalDistortion += rippleSlope * .15;
+    }
+
+    // Calculate how deep the water is along the view ray and fade out the distortion near the shore
+    vec2 screenScale = winSize * texelSize;
+    float waterDepth = getSceneDist(gl_FragCoord.xy / winSize, screenScale) - length(fragPos);
+    float edgeFactor = clamp(waterDepth / softEdgeDepth, 0, 1);
+    totalDistortion *= edgeFactor;
+    
+    refractUV += totalDistortion;
+    refractUV = clamp(refractUV, .001, .999);
+
+    reflectUV += totalDistortion;
+    reflectUV.x = clamp(reflectUV.x, -.999, -.001);
+    reflectUV.y = clamp(reflectUV.y, .001, .999);
+
+    // Calculate base color
+    vec4 refractColor = texture(p3d_Texture0, refractUV);
+    vec4 reflectColor;
+
+    if(ssrEnabled != 0) {
+        // Trace the reflection through the scene color and depth buffers and fall back to the sky
+        // map for any part of the reflection that is not on screen
+        vec3 surfaceNormal = p3d_NormalMatrix * vec3(0, 0, 1);
+
+        if(oceanEnabled != 0) {
+            surfaceNormal = mat3(p3d_ViewMatrix) * oceanNormal;
+        }
+
+        vec3 reflectDir = reflect(normalize(fragPos), normalize(surfaceNormal));
+        vec4 hitColor = traceReflection(reflectDir, screenScale, totalDistortion);
+        vec4 skyColor = texture(p3d_Texture5, mat3(p3d_ViewMatrixInverse) * reflectDir);
+        reflectColor = vec4(mix(skyColor.rgb, hitColor.rgb, hitColor.a), 1);
+    } else {
+        reflectColor = texture(p3d_Texture1, reflectUV);
+    }
+
+    vec3 toCamVec = normalize(toCameraVec);
+    float refractFactor = abs(dot(toCamVec, vec3(0, 0, 1)));
+    refractFactor = pow(refractFactor, 20);
+    vec4 baseColor = mix(refractColor, reflectColor, refractFactor);
+
+    baseColor = mix(baseColor, vec4(0, .225, .5, 1), .2);
+    float metallic = p3d_Material.metallic;
+    float emission = 0.0;
+    float roughness = p3d_Material.roughness;
+
+    // Fetch normal from normal map and remap it
+    vec3 normal = texture(p3d_Texture3, distortedUV).xzy;
+    normal = vec3(normal.x * 2 - 1, normal.y, normal.z * 2 - 1);
+
+    // Add the slopes of the ripples
+    if(ripplesEnabled != 0) {
+        normal = normalize(vec3(normal.x + rippleSlope.x, normal.y, normal.z + rippleSlope.y));
+    }
+
+    // Combine the small waves of the normal map with the large waves of the ocean simulation
+    if(oceanEnabled != 0) {
+        normal = normalize(vec3(normal.x + oceanNormal.x, normal.y * oceanNormal.z, normal.z + oceanNormal.y));
+    }
+
+    // Calculate final color and blend it with the refraction near the shore to soften the edges of the water
+    vec4 color = applyFog(applyLighting(baseColor, metallic, emission, 
+        roughness, normal));
+    p3d_FragColor = vec4(mix(refractColor.rgb, color.rgb, edgeFactor), 1);
+}
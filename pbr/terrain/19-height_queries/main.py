@@ -0,0 +1,408 @@
+import numpy as np
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import (
+    AmbientLight,
+    ClockObject,
+    ConfigVariableBool,
+    ConfigVariableDouble,
+    ConfigVariableInt,
+    ConfigVariableString,
+    DirectionalLight,
+    GeoMipTerrain,
+    load_prc_file,
+    look_at,
+    Material,
+    Quat,
+    SamplerState,
+    TextureStage,
+    Vec2,
+    Vec3,
+    Vec4
+)
+
+from heightfield import HeightfieldSampler
+from lod import TerrainLODUpdater
+from ocean import OceanSimulation
+from ripples import RippleSimulation
+from tiles import TerrainTileManager
+from water import load_shader, WaterPlane
+
+
+# Config Variables
+# ================
+water_reflection_mode = ConfigVariableString(
+    "water-reflection-mode",
+    WaterPlane.RM_planar,
+    "Selects how the water plane renders reflections (planar or screen_space)."
+)
+water_refraction_mode = ConfigVariableString(
+    "water-refraction-mode",
+    WaterPlane.RFM_separate_pass,
+    "Selects where the water plane gets its refraction from (separate_pass or main_pass)."
+)
+water_clip_mode = ConfigVariableString(
+    "water-clip-mode",
+    WaterPlane.CM_clip_plane,
+    "Selects how the water cameras are clipped at the water surface (clip_plane or oblique)."
+)
+water_depth_format = ConfigVariableString(
+    "water-depth-format",
+    WaterPlane.DF_depth24,
+    "Selects the depth format of the water refraction buffer (depth16, depth24 or depth32f)."
+)
+water_linear_depth = ConfigVariableBool(
+    "water-linear-depth",
+    False,
+    "Stores linear depth in the alpha channel of the water refraction buffer."
+)
+water_depth_strict = ConfigVariableBool(
+    "water-depth-strict",
+    False,
+    "Raises an error if the water refraction buffer doesn't get the requested formats."
+)
+water_mesh_mode = ConfigVariableString(
+    "water-mesh-mode",
+    WaterPlane.MM_quad,
+    "Selects the mesh used for the water surface (quad or projected_grid)."
+)
+water_grid_size = ConfigVariableInt(
+    "water-grid-size",
+    128,
+    "Number of cells along each side of the projected water grid."
+)
+ocean_enabled = ConfigVariableBool(
+    "ocean-enabled",
+    False,
+    "Displaces the water surface with an FFT ocean simulation."
+)
+ocean_resolution = ConfigVariableInt(
+    "ocean-resolution",
+    128,
+    "Resolution of the ocean simulation grid."
+)
+ocean_tick_rate = ConfigVariableDouble(
+    "ocean-tick-rate",
+    30,
+    "Number of times per second the ocean simulation is updated."
+)
+ocean_spectrum = ConfigVariableString(
+    "ocean-spectrum",
+    OceanSimulation.ST_phillips,
+    "Selects the wave spectrum of the ocean simulation (phillips or jonswap)."
+)
+water_buoy_count = ConfigVariableInt(
+    "water-buoy-count",
+    0,
+    "Number of buoys floating on each side of a square grid on the water."
+)
+water_ripples_enabled = ConfigVariableBool(
+    "water-ripples-enabled",
+    False,
+    "Adds interactive ripples to the water surface."
+)
+water_ripple_resolution = ConfigVariableInt(
+    "water-ripple-resolution",
+    256,
+    "Resolution of the ripple simulation grid."
+)
+water_ripple_rain = ConfigVariableDouble(
+    "water-ripple-rain",
+    20,
+    "Number of rain drops per second that disturb the water when ripples are enabled."
+)
+terrain_tiles_enabled = ConfigVariableBool(
+    "terrain-tiles-enabled",
+    False,
+    "Splits the terrain into tiles which are generated in the background around the camera."
+)
+terrain_tile_size = ConfigVariableInt(
+    "terrain-tile-size",
+    128,
+    "Number of heightfield pixels along each side of a terrain tile."
+)
+terrain_tile_load_radius = ConfigVariableDouble(
+    "terrain-tile-load-radius",
+    512,
+    "Distance from the camera within which terrain tiles are loaded."
+)
+terrain_tile_memory_limit = ConfigVariableDouble(
+    "terrain-tile-memory-limit",
+    64,
+    "Maximum amount of memory in MB used by the geometry of the loaded terrain tiles."
+)
+terrain_lod_mode = ConfigVariableString(
+    "terrain-lod-mode",
+    TerrainLODUpdater.LM_main_thread,
+    "Selects where the LOD of the terrain is recalculated (main_thread or worker)."
+)
+terrain_lod_max_blocks = ConfigVariableInt(
+    "terrain-lod-max-blocks",
+    16,
+    "Maximum number of terrain blocks rebuilt per frame on average when the LOD is recalculated by a worker. "
+    "The worker skips frames after an update that rebuilt more blocks."
+)
+terrain_rock_count = ConfigVariableInt(
+    "terrain-rock-count",
+    0,
+    "Number of rocks scattered across the terrain above the water."
+)
+
+
+# Application Class
+# =================
+class TerrainDemo(ShowBase):
+    def __init__(self):
+        # Load config file
+        load_prc_file("settings.prc")
+
+        # Call base constructor
+        ShowBase.__init__(self)
+
+        # Load shaders
+        self.terrain_shader = load_shader(
+            "shaders/Terrain.vert.glsl",
+            "shaders/Terrain.frag.glsl",
+            water_clip_mode.get_value()
+        )
+
+        # Setup lighting
+        self.ambient_light = self.render.attach_new_node(AmbientLight("AmbientLight"))
+        self.ambient_light.node().set_color(Vec4(.2, .2, .2, 1))
+        self.render.set_light(self.ambient_light)
+
+        self.sun = self.render.attach_new_node(DirectionalLight("Sun"))
+        self.sun.set_hpr(45, -45, 0)
+        self.render.set_light(self.sun)
+
+        # Create materials
+        terrain_mat = Material("Terrain")
+        terrain_mat.set_base_color(Vec4(0, .5, 0, 1))
+        terrain_mat.set_metallic(0)
+        terrain_mat.set_emission(Vec4(0, 0, 0, 1))
+        terrain_mat.set_roughness(.8)
+        terrain_mat.set_refractive_index(1.5)
+
+        # Load textures
+        self.grass_tex = self.loader.load_texture("images/Grass.png")
+        self.grass_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.grass_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.dirt_tex = self.loader.load_texture("images/Dirt.png")
+        self.dirt_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.dirt_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.rock_tex = self.loader.load_texture("images/Rock.png")
+        self.rock_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.rock_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.blank_tex = self.loader.load_texture("images/Blank.png")
+        self.blank_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.blank_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.color_mask_tex = self.loader.load_texture("images/ColorMask.png")
+        self.color_mask_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.color_mask_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        # Create terrain root. The material, shader, and textures are shared by the terrain and all of its tiles.
+        self.terrain_root = self.render.attach_new_node("TerrainRoot")
+        self.terrain_root.set_material(terrain_mat)
+
+        self.terrain_root.set_shader(self.terrain_shader)
+        self.terrain_root.set_shader_input("texScale0", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale1", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale2", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale3", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("tileUVOffset", Vec2(0, 0))
+        self.terrain_root.set_shader_input("tileUVScale", Vec2(1, 1))
+
+        stage0 = TextureStage("Grass")
+        stage1 = TextureStage("Dirt")
+        stage2 = TextureStage("Rock")
+        stage3 = TextureStage("Blank")
+        stage4 = TextureStage("ColorMask")
+
+        self.terrain_root.set_texture(stage0, self.grass_tex)
+        self.terrain_root.set_texture(stage1, self.dirt_tex)
+        self.terrain_root.set_texture(stage2, self.rock_tex)
+        self.terrain_root.set_texture(stage3, self.blank_tex)
+        self.terrain_root.set_texture(stage4, self.color_mask_tex)
+
+        # Load terrain. Tiled terrain is split into tiles which are generated in the background around the camera.
+        self.terrain = None
+        self.terrain_lod = None
+        self.terrain_tiles = None
+
+        if terrain_tiles_enabled.get_value():
+            self.terrain_tiles = TerrainTileManager(
+                self.terrain_root,
+                self.camera,
+                heightfield="images/Heightmap.png",
+                tile_size=terrain_tile_size.get_value(),
+                load_radius=terrain_tile_load_radius.get_value(),
+                unload_radius=terrain_tile_load_radius.get_value() + terrain_tile_size.get_value() / 2,
+                memory_limit=terrain_tile_memory_limit.get_value() * 1024 * 1024
+            )
+
+        else:
+            self.terrain = GeoMipTerrain("Terrain")
+            self.terrain.set_heightfield("images/Heightmap.png")
+            self.terrain.set_block_size(32)
+            self.terrain.set_focal_point(self.camera)
+
+            self.terrain.get_root().set_sz(128)
+            self.terrain.get_root().set_pos(-256, 0, -64)
+
+            self.terrain.generate()
+            self.terrain.get_root().reparent_to(self.terrain_root)
+
+            # Start terrain LOD updates
+            self.terrain_lod = TerrainLODUpdater(
+                self.terrain,
+                self.camera,
+                mode=terrain_lod_mode.get_value(),
+                max_blocks_per_frame=terrain_lod_max_blocks.get_value()
+            )
+            self.terrain_lod.start()
+
+        # Create terrain sampler. It uses the same heightfield and transform as the terrain, so it can answer
+        # height and normal queries for many positions at once.
+        if self.terrain_tiles is not None:
+            self.terrain_sampler = HeightfieldSampler(
+                self.terrain_tiles.heightfield,
+                Vec3(self.terrain_tiles.pos.x, self.terrain_tiles.pos.y, self.terrain_tiles.height_offset),
+                Vec3(1, 1, self.terrain_tiles.height_scale)
+            )
+
+        else:
+            self.terrain_sampler = HeightfieldSampler(
+                self.terrain.heightfield(),
+                self.terrain.get_root().get_pos(self.render),
+                self.terrain.get_root().get_scale(self.render)
+            )
+
+        # Start ocean simulation
+        self.ocean = None
+
+        if ocean_enabled.get_value():
+            self.ocean = OceanSimulation(
+                resolution=ocean_resolution.get_value(),
+                tick_rate=ocean_tick_rate.get_value(),
+                spectrum=ocean_spectrum.get_value()
+            )
+            self.ocean.start()
+
+        # Start ripple simulation
+        self.ripples = None
+
+        if water_ripples_enabled.get_value():
+            self.ripples = RippleSimulation(resolution=water_ripple_resolution.get_value())
+            self.ripples.start()
+
+        # Load water plane
+        self.water = WaterPlane(
+            Vec3(0, 261, -20),
+            scale=Vec3(256, 256, 1),
+            reflection_mode=water_reflection_mode.get_value(),
+            refraction_mode=water_refraction_mode.get_value(),
+            clip_mode=water_clip_mode.get_value(),
+            depth_format=water_depth_format.get_value(),
+            linear_depth=water_linear_depth.get_value(),
+            strict_depth=water_depth_strict.get_value(),
+            mesh_mode=water_mesh_mode.get_value(),
+            grid_size=water_grid_size.get_value(),
+            ocean=self.ocean,
+            ripples=self.ripples
+        )
+
+        # Initialize rain. The random number generator uses a fixed seed, so every run looks the same.
+        self.rain_rng = np.random.default_rng(0)
+        self.rain_drops = 0.0
+
+        # Create buoys
+        buoy_count = water_buoy_count.get_value()
+        self.buoys = []
+        self.buoy_x, self.buoy_y = np.meshgrid(
+            np.linspace(-128, 128, buoy_count),
+            np.linspace(133, 389, buoy_count)
+        )
+
+        for i in range(buoy_count * buoy_count):
+            buoy = self.render.attach_new_node("Buoy")
+            box = self.loader.load_model("box")
+            box.reparent_to(buoy)
+            box.set_pos(-2, -2, -2)
+            box.set_scale(4)
+            box.set_texture_off(1)
+            buoy.set_color(Vec4(1, .4, 0, 1))
+            self.buoys.append(buoy)
+
+        # Scatter rocks across the terrain. All rocks are placed with a single query, and the ones that would end
+        # up under water are skipped. The rocks never move, so they are flattened into a single node.
+        rock_count = terrain_rock_count.get_value()
+
+        if rock_count > 0:
+            rock_rng = np.random.default_rng(1)
+            rock_x = rock_rng.uniform(-256, 256, rock_count)
+            rock_y = rock_rng.uniform(0, 512, rock_count)
+            heights, normals = self.terrain_sampler.get_surface(rock_x, rock_y)
+            rocks = self.render.attach_new_node("Rocks")
+            rocks.set_color(Vec4(.4, .4, .4, 1))
+            quat = Quat()
+
+            for x, y, z, normal, size in zip(rock_x, rock_y, heights, normals,
+                rock_rng.uniform(1, 3, rock_count)):
+                if z < self.water.plane.get_z():
+                    continue
+
+                up = Vec3(*normal)
+                look_at(quat, Vec3(0, 1, 0) - up * up.y, up)
+                rock = rocks.attach_new_node("Rock")
+                rock.set_pos_quat(Vec3(x, y, z), quat)
+                box = self.loader.load_model("box")
+                box.reparent_to(rock)
+                box.set_pos(-size / 2, -size / 2, -size / 2)
+                box.set_scale(size)
+                box.set_texture_off(1)
+
+            rocks.flatten_strong()
+
+        # Add update task
+        self.task_mgr.add(self.update, "update")
+
+        # Configure buffer viewer
+        self.bufferViewer.setPosition("ulcorner")
+        self.bufferViewer.setCardSize(.5, 0)
+        self.accept("v", self.bufferViewer.toggleEnable)
+
+    def update(self, task):
+        # Move the buoys to the water surface and align them with its normal. The surface is queried for all
+        # buoys at once.
+        if self.buoys:
+            heights, normals = self.water.get_surface(self.buoy_x, self.buoy_y)
+            quat = Quat()
+
+            for buoy, x, y, z, normal in zip(self.buoys, self.buoy_x.flat, self.buoy_y.flat, heights.flat,
+                normals.reshape(-1, 3)):
+                up = Vec3(*normal)
+                look_at(quat, Vec3(0, 1, 0) - up * up.y, up)
+                buoy.set_pos_quat(Vec3(x, y, z), quat)
+
+        # Let it rain on the lake
+        if self.ripples is not None:
+            self.rain_drops += water_ripple_rain.get_value() * ClockObject.get_global_clock().get_dt()
+
+            while self.rain_drops >= 1:
+                self.water.add_ripple(
+                    self.rain_rng.uniform(-256, 256),
+                    self.rain_rng.uniform(5, 517),
+                    self.rain_rng.uniform(5, 10)
+                )
+                self.rain_drops -= 1
+
+        return task.cont
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    TerrainDemo().run()
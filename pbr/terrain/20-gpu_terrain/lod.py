@@ -0,0 +1,163 @@
+import threading
+import time
+
+from panda3d.core import (
+    GeoMipTerrain,
+    LPoint3
+)
+
+
+# Classes
+# =======
+class TerrainLODUpdater(object):
+    # LOD Modes
+    LM_main_thread = "main_thread"
+    LM_worker = "worker"
+
+    def __init__(self, terrain, focal_point, mode=LM_main_thread, max_blocks_per_frame=16):
+        if mode not in (self.LM_main_thread, self.LM_worker):
+            raise ValueError("Invalid LOD mode: {}".format(mode))
+
+        self.terrain = terrain
+        self.focal_point = focal_point
+        self.mode = mode
+        self.max_blocks_per_frame = max_blocks_per_frame
+
+        # Initialize stats
+        self.update_count = 0
+        self.update_time = 0.0
+        self.max_update_time = 0.0
+        self.swap_count = 0
+        self.swap_time = 0.0
+        self.max_swap_time = 0.0
+        self.blocks_swapped = 0
+
+        if mode == self.LM_main_thread:
+            return
+
+        # The LOD is recalculated by a shadow copy of the terrain which is never rendered. The terrain that is
+        # rendered only receives the blocks that were rebuilt by the shadow copy.
+        block_size = terrain.get_block_size()
+        heightfield = terrain.heightfield()
+        self.num_blocks = (
+            (heightfield.get_x_size() - 1) // block_size,
+            (heightfield.get_y_size() - 1) // block_size
+        )
+
+        self.shadow = GeoMipTerrain(terrain.get_root().get_name() + "Shadow")
+        self.shadow.set_heightfield(heightfield)
+        self.shadow.set_block_size(block_size)
+        self.shadow.set_min_level(terrain.get_min_level())
+        self.shadow.set_focal_point(self.get_focal_pos())
+        self.shadow.generate()
+
+        # The worker only knows where the focal point was at the start of the last frame. Rebuilt blocks are
+        # handed to the main thread under a lock and are swapped in at the start of the next frame.
+        self.lock = threading.Lock()
+        self.focal_pos = self.get_focal_pos()
+        self.skip_frames = 0
+        self.blocks = {
+            (mx, my): self.shadow.get_block_node_path(mx, my).node()
+            for mx in range(self.num_blocks[0]) for my in range(self.num_blocks[1])
+        }
+        self.ready = {}
+
+    def start(self):
+        if self.mode == self.LM_main_thread:
+            base.task_mgr.add(self.update, "update_terrain_lod", sort=-5)
+            return
+
+        # The worker task chain runs once per frame, in parallel with the rest of the frame
+        base.task_mgr.setupTaskChain("terrain_lod", numThreads=1, frameSync=True)
+        base.task_mgr.add(self.update_shadow, "update_terrain_lod_shadow", taskChain="terrain_lod")
+        base.task_mgr.add(self.swap_blocks, "update_terrain_lod", sort=-5)
+
+    def stop(self):
+        base.task_mgr.remove("update_terrain_lod")
+        base.task_mgr.remove("update_terrain_lod_shadow")
+
+    def get_focal_pos(self):
+        return LPoint3(self.focal_point.get_pos(self.terrain.get_root()))
+
+    def add_update_time(self, update_time):
+        self.update_count += 1
+        self.update_time += update_time
+        self.max_update_time = max(self.max_update_time, update_time)
+
+    def update(self, task):
+        # Recalculate the LOD on the main thread
+        start = time.perf_counter()
+        self.terrain.update()
+        self.add_update_time(time.perf_counter() - start)
+        return task.cont
+
+    def update_shadow(self, task):
+        # GeoMipTerrain can't stop an update halfway, so an update that rebuilt more blocks than one frame may
+        # rebuild is paid for by skipping frames. The worker never rebuilds more blocks than that on average.
+        if self.skip_frames > 0:
+            self.skip_frames -= 1
+            return task.cont
+
+        with self.lock:
+            focal_pos = self.focal_pos
+
+        # Recalculate the LOD of the shadow copy. GeoMipTerrain replaces the node of each block it rebuilds, so
+        # the rebuilt blocks can be found by comparing their nodes with the ones from the last update.
+        start = time.perf_counter()
+        self.shadow.set_focal_point(focal_pos)
+
+        if not self.shadow.update():
+            return task.cont
+
+        changed = {}
+
+        for coords, node in self.blocks.items():
+            new_node = self.shadow.get_block_node_path(*coords).node()
+
+            if new_node != node:
+                changed[coords] = new_node
+
+        self.blocks.update(changed)
+        self.skip_frames = (len(changed) - 1) // self.max_blocks_per_frame
+        self.add_update_time(time.perf_counter() - start)
+
+        # Hand all rebuilt blocks to the main thread at once
+        with self.lock:
+            self.ready.update(changed)
+
+        return task.cont
+
+    def swap_blocks(self, task):
+        focal_pos = self.get_focal_pos()
+
+        with self.lock:
+            ready = self.ready
+            self.ready = {}
+            self.focal_pos = focal_pos
+
+        if not ready:
+            return task.cont
+
+        # Swap in all blocks of the finished updates at once. Each block stitches its edges to the levels of its
+        # neighbors, so a frame that only had some of them would show cracks between old and new blocks.
+        start = time.perf_counter()
+
+        for (mx, my), rebuilt in ready.items():
+            # The geoms of a rebuilt block are never modified again, so they can be shared with the rendered
+            # terrain. Only the geoms are replaced, so the state of the rendered terrain is kept.
+            node = self.terrain.get_block_node_path(mx, my).node()
+            node.remove_all_geoms()
+            node.add_geoms_from(rebuilt)
+
+        swap_time = time.perf_counter() - start
+        self.swap_count += 1
+        self.swap_time += swap_time
+        self.max_swap_time = max(self.max_swap_time, swap_time)
+        self.blocks_swapped += len(ready)
+        return task.cont
+
+    def get_average_update_time(self):
+        return self.update_time / self.update_count if self.update_count > 0 else 0.0
+
+    def get_average_swap_time(self):
+        return self.swap_time / self.swap_count if self.swap_count > 0 else 0.0
@@ -0,0 +1,105 @@
+import numpy as np
+from panda3d.core import (
+    Filename,
+    PNMImage,
+    Texture,
+    Vec3
+)
+
+
+# Functions
+# =========
+def load_heightfield(heightfield):
+    if not isinstance(heightfield, PNMImage):
+        heightfield = PNMImage(Filename(heightfield))
+
+    # Load the heightfield into an array through a texture. Row 0 of a texture is the bottom row of the image,
+    # which is also where GeoMipTerrain places row 0 of the terrain.
+    tex = Texture()
+    tex.load(heightfield)
+    dtype = np.uint16 if tex.get_component_type() == Texture.T_unsigned_short else np.uint8
+    data = np.frombuffer(tex.get_ram_image(), dtype).reshape(
+        tex.get_y_size(),
+        tex.get_x_size(),
+        tex.get_num_components()
+    ).astype(np.float32) / heightfield.get_maxval()
+
+    # GeoMipTerrain uses the brightness of color heightfields. Texels are stored in BGR order.
+    if data.shape[2] >= 3:
+        return data[..., 2] * .299 + data[..., 1] * .587 + data[..., 0] * .114
+
+    return data[..., 0]
+
+
+# Classes
+# =======
+class HeightfieldSampler(object):
+    def __init__(self, heightfield, pos=Vec3(0, 0, 0), scale=Vec3(1, 1, 1)):
+        self.pos = Vec3(pos)
+        self.scale = Vec3(scale)
+
+        # Convert the heightfield to world space heights
+        data = load_heightfield(heightfield)
+        self.heights = np.ascontiguousarray(data * self.scale.z + self.pos.z, np.float32)
+        self.y_size, self.x_size = self.heights.shape
+
+        # Calculate the normal of each vertex the same way GeoMipTerrain does, with central differences that
+        # are clamped at the edges. The normals are calculated from world space heights, so they already include
+        # the scale of the terrain.
+        padded = np.pad(self.heights, 1, mode="edge")
+        normals = np.empty((self.y_size, self.x_size, 3), np.float32)
+        normals[..., 0] = (padded[1:-1, :-2] - padded[1:-1, 2:]) * .5 / self.scale.x
+        normals[..., 1] = (padded[:-2, 1:-1] - padded[2:, 1:-1]) * .5 / self.scale.y
+        normals[..., 2] = 1
+        self.normals = normals / np.linalg.norm(normals, axis=2, keepdims=True)
+
+    def get_coords(self, x, y):
+        # Convert world space positions to heightfield coordinates. The coordinates can be arrays of any shape.
+        fx = (np.asarray(x, np.float32) - self.pos.x) / self.scale.x
+        fy = (np.asarray(y, np.float32) - self.pos.y) / self.scale.y
+        outside = (fx < 0) | (fx > self.x_size - 1) | (fy < 0) | (fy > self.y_size - 1)
+
+        # Find the cell each position is in. Positions on the far edges belong to the last cell.
+        x0 = np.clip(np.floor(fx), 0, self.x_size - 2)
+        y0 = np.clip(np.floor(fy), 0, self.y_size - 2)
+        tx = fx - x0
+        ty = fy - y0
+        index = y0.astype(np.intp) * self.x_size + x0.astype(np.intp)
+        return index, tx, ty, outside
+
+    def sample(self, grid, index, tx, ty):
+        # Blend the 4 corners of each cell. Fetching values from a flat array is a lot faster than indexing
+        # the grid with 2 index arrays.
+        values = grid.reshape(self.y_size * self.x_size, -1)
+        bottom = values.take(index, axis=0)
+        bottom += (values.take(index + 1, axis=0) - bottom) * tx[..., None]
+        top = values.take(index + self.x_size, axis=0)
+        top += (values.take(index + self.x_size + 1, axis=0) - top) * tx[..., None]
+        return bottom + (top - bottom) * ty[..., None]
+
+    def get_height(self, x, y):
+        # Calculate the height of the terrain at the given positions. Positions outside of the terrain have no
+        # height.
+        index, tx, ty, outside = self.get_coords(x, y)
+        heights = self.sample(self.heights, index, tx, ty)[..., 0]
+        heights[outside] = np.nan
+        return heights
+
+    def get_normal(self, x, y):
+        # Calculate the normal of the terrain at the given positions. Positions outside of the terrain have no
+        # normal.
+        index, tx, ty, outside = self.get_coords(x, y)
+        normals = self.sample(self.normals, index, tx, ty)
+        normals /= np.sqrt(np.einsum("...i,...i->...", normals, normals))[..., None]
+        normals[outside] = np.nan
+        return normals
+
+    def get_surface(self, x, y):
+        # Calculate both the heights and normals of the terrain at the given positions
+        index, tx, ty, outside = self.get_coords(x, y)
+        heights = self.sample(self.heights, index, tx, ty)[..., 0]
+        heights[outside] = np.nan
+        normals = self.sample(self.normals, index, tx, ty)
+        normals /= np.sqrt(np.einsum("...i,...i->...", normals, normals))[..., None]
+        normals[outside] = np.nan
+        return heights, normals
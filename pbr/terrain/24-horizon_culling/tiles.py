@@ -0,0 +1,262 @@
+import queue
+import threading
+import time
+
+from panda3d.core import (
+    GeoMipTerrain,
+    PNMImage,
+    Point2,
+    Vec2
+)
+
+from heightfield import load_heightfield_image
+
+
+# Classes
+# =======
+class TerrainTile(object):
+    def __init__(self, coords, terrain, memory, latency):
+        self.coords = coords
+        self.terrain = terrain
+        self.memory = memory
+        self.latency = latency
+
+
+class TerrainTileManager(object):
+    def __init__(self, parent, focal_point, heightfield=None, tile_files=None, tile_size=128,
+        pos=Vec2(-256, 0), height_scale=128, height_offset=-64, block_size=32, load_radius=384.0,
+        unload_radius=448.0, memory_limit=64 * 1024 * 1024):
+        if (heightfield is None) == (tile_files is None):
+            raise ValueError("Either a heightfield or tile files must be given")
+
+        self.parent = parent
+        self.focal_point = focal_point
+        self.tile_size = tile_size
+        self.pos = Vec2(pos)
+        self.height_scale = height_scale
+        self.height_offset = height_offset
+        self.block_size = block_size
+        self.load_radius = load_radius
+        self.unload_radius = max(unload_radius, load_radius)
+        self.memory_limit = memory_limit
+
+        # A large heightfield is loaded once and split into tiles. Neighboring tiles share their edge, so the
+        # heightfield should be a multiple of the tile size plus 1 pixel wide.
+        self.heightfield = None
+        self.tile_files = None
+
+        if heightfield is not None:
+            self.heightfield = load_heightfield_image(heightfield)
+            self.num_tiles = (
+                (self.heightfield.get_x_size() - 1) // tile_size,
+                (self.heightfield.get_y_size() - 1) // tile_size
+            )
+
+        else:
+            self.tile_files = dict(tile_files)
+            self.num_tiles = (
+                max(x for x, y in self.tile_files) + 1,
+                max(y for x, y in self.tile_files) + 1
+            )
+
+        # Initialize tile state. Tiles are requested by the main thread, generated by the worker thread, and
+        # attached by the main thread once they are finished.
+        self.tiles = {}
+        self.pending = set()
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.finished = []
+
+        # Initialize stats
+        self.memory_used = 0
+        self.generated_count = 0
+        self.unloaded_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+        # Start worker thread and update task
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="TerrainTileWorker", daemon=True)
+        self.thread.start()
+        base.task_mgr.add(self.update, "update_terrain_tiles", sort=-5)
+
+    def stop(self):
+        # Stop worker thread and update task
+        self.running = False
+        self.requests.put(None)
+        base.task_mgr.remove("update_terrain_tiles")
+        self.thread.join()
+
+    def get_tile_origin(self, coords):
+        return Vec2(
+            self.pos.x + coords[0] * self.tile_size,
+            self.pos.y + coords[1] * self.tile_size
+        )
+
+    def get_tile_distance(self, coords, focal_pos):
+        # Calculate the distance between the focal point and the closest point of a tile
+        origin = self.get_tile_origin(coords)
+        dx = max(origin.x - focal_pos.x, 0, focal_pos.x - origin.x - self.tile_size)
+        dy = max(origin.y - focal_pos.y, 0, focal_pos.y - origin.y - self.tile_size)
+        return (dx * dx + dy * dy) ** .5
+
+    def load_tile_image(self, coords):
+        # Tile files are read from disk by the worker thread
+        if self.tile_files is not None:
+            filename = self.tile_files.get(coords)
+            return load_heightfield_image(filename) if filename is not None else None
+
+        # Copy the part of the heightfield covered by the tile. The rows of an image go from top to bottom, but
+        # GeoMipTerrain places the first row at the far end of the terrain.
+        size = self.tile_size + 1
+        image = PNMImage(size, size, 1, self.heightfield.get_maxval())
+        image.copy_sub_image(
+            self.heightfield,
+            0,
+            0,
+            coords[0] * self.tile_size,
+            self.heightfield.get_y_size() - size - coords[1] * self.tile_size,
+            size,
+            size
+        )
+        return image
+
+    def generate_tile(self, coords, focal_pos, request_time):
+        image = self.load_tile_image(coords)
+
+        if image is None:
+            return None
+
+        # Generate the tile with the LOD of the focal point at the time it was requested. The terrain isn't
+        # attached to the scene graph yet, so the worker thread is the only one touching it.
+        terrain = GeoMipTerrain("TerrainTile{}_{}".format(*coords))
+        terrain.set_heightfield(image)
+        terrain.set_block_size(self.block_size)
+        # Each tile is a terrain of its own, so it can't stitch its edges to the levels of its neighbors. Border
+        # stitching builds the edges of every tile at the lowest level of detail, so neighboring tiles always meet.
+        terrain.set_border_stitching(True)
+        origin = self.get_tile_origin(coords)
+        terrain.set_focal_point(Point2(focal_pos.x - origin.x, focal_pos.y - origin.y))
+        terrain.generate()
+
+        root = terrain.get_root()
+        root.set_pos(origin.x, origin.y, self.height_offset)
+        root.set_sz(self.height_scale)
+
+        # The texture coordinates of each tile go from 0 to 1, so tell the shader which part of the whole
+        # terrain the tile covers
+        root.set_shader_input("tileUVOffset", Vec2(coords[0] / self.num_tiles[0], coords[1] / self.num_tiles[1]))
+        root.set_shader_input("tileUVScale", Vec2(1 / self.num_tiles[0], 1 / self.num_tiles[1]))
+
+        # Estimate the memory used by the tile from the size of its vertex and index data
+        memory = 0
+
+        for geom_np in root.find_all_matches("**/+GeomNode"):
+            for geom in geom_np.node().get_geoms():
+                vertex_data = geom.get_vertex_data()
+
+                for i in range(vertex_data.get_num_arrays()):
+                    memory += vertex_data.get_array(i).get_data_size_bytes()
+
+                for prim in geom.get_primitives():
+                    if prim.get_vertices() is not None:
+                        memory += prim.get_vertices().get_data_size_bytes()
+
+        return TerrainTile(coords, terrain, memory, time.perf_counter() - request_time)
+
+    def run(self):
+        while self.running:
+            request = self.requests.get()
+
+            if request is None:
+                break
+
+            tile = self.generate_tile(*request)
+
+            # Hand the tile to the main thread
+            with self.lock:
+                self.finished.append((request[0], tile))
+
+    def unload_tile(self, coords):
+        tile = self.tiles.pop(coords)
+        tile.terrain.get_root().remove_node()
+        self.memory_used -= tile.memory
+        self.unloaded_count += 1
+
+    def update(self, task):
+        focal_pos = self.focal_point.get_pos(self.parent)
+
+        # Attach the tiles that were finished since the last frame
+        with self.lock:
+            finished = self.finished
+            self.finished = []
+
+        for coords, tile in finished:
+            self.pending.discard(coords)
+
+            if tile is None:
+                continue
+
+            tile.terrain.set_focal_point(self.focal_point)
+            tile.terrain.get_root().reparent_to(self.parent)
+            self.tiles[coords] = tile
+            self.memory_used += tile.memory
+            self.generated_count += 1
+            self.total_latency += tile.latency
+            self.max_latency = max(self.max_latency, tile.latency)
+
+        # Unload tiles that are too far away. If the memory limit is still exceeded, also unload the tiles that
+        # are furthest away.
+        for coords in list(self.tiles):
+            if self.get_tile_distance(coords, focal_pos) > self.unload_radius:
+                self.unload_tile(coords)
+
+        while self.memory_used > self.memory_limit and len(self.tiles) > 1:
+            self.unload_tile(self.get_furthest_tile(focal_pos))
+
+        # Request the missing tiles around the focal point, starting with the closest one. The memory used by the
+        # requested tiles is estimated from the tiles generated so far.
+        missing = [
+            (x, y) for x in range(self.num_tiles[0]) for y in range(self.num_tiles[1])
+            if (x, y) not in self.tiles and (x, y) not in self.pending
+            and self.get_tile_distance((x, y), focal_pos) <= self.load_radius
+        ]
+        missing.sort(key=lambda coords: self.get_tile_distance(coords, focal_pos))
+        tile_memory = self.get_average_tile_memory()
+
+        for coords in missing:
+            # Only 1 tile is requested until the memory used by a tile is known
+            if tile_memory == 0 and self.pending:
+                break
+
+            # When the memory limit is reached, a tile is only loaded if a tile that is clearly further away can
+            # be unloaded to make room for it. Otherwise the same tiles would be loaded and unloaded over and over.
+            if self.memory_used + (len(self.pending) + 1) * tile_memory > self.memory_limit:
+                furthest = self.get_furthest_tile(focal_pos)
+
+                if (furthest is None or self.get_tile_distance(furthest, focal_pos)
+                    <= self.get_tile_distance(coords, focal_pos) + self.tile_size / 2):
+                    break
+
+                self.unload_tile(furthest)
+
+            self.pending.add(coords)
+            self.requests.put((coords, Vec2(focal_pos.x, focal_pos.y), time.perf_counter()))
+
+        # Update the LOD of the loaded tiles
+        for tile in self.tiles.values():
+            tile.terrain.update()
+
+        return task.cont
+
+    def get_furthest_tile(self, focal_pos):
+        if not self.tiles:
+            return None
+
+        return max(self.tiles, key=lambda coords: self.get_tile_distance(coords, focal_pos))
+
+    def get_average_tile_memory(self):
+        return self.memory_used // len(self.tiles) if self.tiles else 0
+
+    def get_average_latency(self):
+        return self.total_latency / self.generated_count if self.generated_count > 0 else 0.0
@@ -0,0 +1,236 @@
+import os
+
+import numpy as np
+from panda3d.core import (
+    Filename,
+    PNMImage,
+    Texture,
+    Vec3
+)
+
+
+# Functions
+# =========
+def is_raw_heightfield(heightfield):
+    return isinstance(heightfield, RawHeightfield) or (isinstance(heightfield, str)
+        and os.path.splitext(heightfield)[1].lower() == RawHeightfield.extension)
+
+
+def load_heightfield_image(heightfield):
+    # Create an image of the heightfield for GeoMipTerrain. Raw heightfields don't need to be decoded.
+    if isinstance(heightfield, PNMImage):
+        return heightfield
+
+    if is_raw_heightfield(heightfield):
+        if not isinstance(heightfield, RawHeightfield):
+            heightfield = RawHeightfield(heightfield)
+
+        return heightfield.get_image()
+
+    return PNMImage(Filename(heightfield))
+
+
+def load_heightfield(heightfield):
+    # Raw heightfields are memory-mapped instead of decoded
+    if is_raw_heightfield(heightfield):
+        if not isinstance(heightfield, RawHeightfield):
+            heightfield = RawHeightfield(heightfield)
+
+        return heightfield.get_heights()
+
+    if not isinstance(heightfield, PNMImage):
+        heightfield = PNMImage(Filename(heightfield))
+
+    # Load the heightfield into an array through a texture. Row 0 of a texture is the bottom row of the image,
+    # which is also where GeoMipTerrain places row 0 of the terrain.
+    tex = Texture()
+    tex.load(heightfield)
+    dtype = np.uint16 if tex.get_component_type() == Texture.T_unsigned_short else np.uint8
+    data = np.frombuffer(tex.get_ram_image(), dtype).reshape(
+        tex.get_y_size(),
+        tex.get_x_size(),
+        tex.get_num_components()
+    ).astype(np.float32) / heightfield.get_maxval()
+
+    # GeoMipTerrain uses the brightness of color heightfields. Texels are stored in BGR order.
+    if data.shape[2] >= 3:
+        return data[..., 2] * .299 + data[..., 1] * .587 + data[..., 0] * .114
+
+    return data[..., 0]
+
+
+# Classes
+# =======
+class RawHeightfield(object):
+    # Formats
+    F_uint16 = "uint16"
+    F_float32 = "float32"
+
+    extension = ".hf"
+    magic = b"P3HF"
+    version = 1
+
+    # The header is padded to 32 bytes, so that the heights that follow it are aligned
+    header_dtype = np.dtype([
+        ("magic", "S4"),
+        ("version", "<u2"),
+        ("format", "<u2"),
+        ("x_size", "<u4"),
+        ("y_size", "<u4"),
+        ("reserved", "V16")
+    ])
+    formats = (F_uint16, F_float32)
+    dtypes = {F_uint16: np.dtype("<u2"), F_float32: np.dtype("<f4")}
+
+    def __init__(self, path):
+        # Read and check the header
+        header = np.fromfile(path, self.header_dtype, 1)
+
+        if len(header) < 1 or header["magic"][0] != self.magic:
+            raise ValueError("Not a raw heightfield: {}".format(path))
+
+        if header["version"][0] != self.version:
+            raise ValueError("Unsupported raw heightfield version: {}".format(header["version"][0]))
+
+        if header["format"][0] >= len(self.formats):
+            raise ValueError("Invalid raw heightfield format: {}".format(header["format"][0]))
+
+        self.path = path
+        self.format = self.formats[header["format"][0]]
+        self.x_size = int(header["x_size"][0])
+        self.y_size = int(header["y_size"][0])
+
+        # Map the heights into memory. Row 0 is the bottom row, just like row 0 of GeoMipTerrain.
+        self.data = np.memmap(
+            path,
+            self.dtypes[self.format],
+            mode="r",
+            offset=self.header_dtype.itemsize,
+            shape=(self.y_size, self.x_size)
+        )
+
+    @classmethod
+    def write(cls, path, heights, format=F_uint16):
+        if format not in cls.formats:
+            raise ValueError("Invalid raw heightfield format: {}".format(format))
+
+        # Heights go from 0 to 1, just like the heights of a heightfield image
+        heights = np.asarray(heights, np.float32)
+
+        if heights.ndim != 2 or heights.min() < 0 or heights.max() > 1:
+            raise ValueError("Heights must be a 2D array of values from 0 to 1")
+
+        if format == cls.F_uint16:
+            heights = np.round(heights * 65535)
+
+        header = np.zeros(1, cls.header_dtype)
+        header["magic"] = cls.magic
+        header["version"] = cls.version
+        header["format"] = cls.formats.index(format)
+        header["x_size"] = heights.shape[1]
+        header["y_size"] = heights.shape[0]
+
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+            f.write(np.ascontiguousarray(heights, cls.dtypes[format]).tobytes())
+
+    @classmethod
+    def convert(cls, src, dst, format=F_uint16):
+        # Convert a heightfield image into a raw heightfield. A 16-bit heightfield survives the trip through
+        # floats unchanged, since a float has enough precision for all of its values.
+        cls.write(dst, load_heightfield(src), format)
+
+    def get_heights(self):
+        # Float heights are used as they are, without reading them into memory
+        if self.format == self.F_float32:
+            return self.data
+
+        return self.data.astype(np.float32) / 65535
+
+    def get_image(self):
+        # GeoMipTerrain only accepts images, so the heights are copied into a 16-bit image through a texture.
+        # Float heights lose some of their precision here.
+        if self.format == self.F_float32:
+            data = np.round(np.clip(self.data, 0, 1) * 65535).astype(np.uint16)
+
+        else:
+            data = np.ascontiguousarray(self.data, np.uint16)
+
+        tex = Texture()
+        tex.setup_2d_texture(self.x_size, self.y_size, Texture.T_unsigned_short, Texture.F_luminance)
+        tex.set_ram_image(data)
+        image = PNMImage()
+        tex.store(image)
+        return image
+
+
+class HeightfieldSampler(object):
+    def __init__(self, heightfield, pos=Vec3(0, 0, 0), scale=Vec3(1, 1, 1)):
+        self.pos = Vec3(pos)
+        self.scale = Vec3(scale)
+
+        # Convert the heightfield to world space heights
+        data = load_heightfield(heightfield)
+        self.heights = np.ascontiguousarray(data * self.scale.z + self.pos.z, np.float32)
+        self.y_size, self.x_size = self.heights.shape
+
+        # Calculate the normal of each vertex the same way GeoMipTerrain does, with central differences that
+        # are clamped at the edges. The normals are calculated from world space heights, so they already include
+        # the scale of the terrain.
+        padded = np.pad(self.heights, 1, mode="edge")
+        normals = np.empty((self.y_size, self.x_size, 3), np.float32)
+        normals[..., 0] = (padded[1:-1, :-2] - padded[1:-1, 2:]) * .5 / self.scale.x
+        normals[..., 1] = (padded[:-2, 1:-1] - padded[2:, 1:-1]) * .5 / self.scale.y
+        normals[..., 2] = 1
+        self.normals = normals / np.linalg.norm(normals, axis=2, keepdims=True)
+
+    def get_coords(self, x, y):
+        # Convert world space positions to heightfield coordinates. The coordinates can be arrays of any shape.
+        fx = (np.asarray(x, np.float32) - self.pos.x) / self.scale.x
+        fy = (np.asarray(y, np.float32) - self.pos.y) / self.scale.y
+        outside = (fx < 0) | (fx > self.x_size - 1) | (fy < 0) | (fy > self.y_size - 1)
+
+        # Find the cell each position is in. Positions on the far edges belong to the last cell.
+        x0 = np.clip(np.floor(fx), 0, self.x_size - 2)
+        y0 = np.clip(np.floor(fy), 0, self.y_size - 2)
+        tx = fx - x0
+        ty = fy - y0
+        index = y0.astype(np.intp) * self.x_size + x0.astype(np.intp)
+        return index, tx, ty, outside
+
+    def sample(self, grid, index, tx, ty):
+        # Blend the 4 corners of each cell. Fetching values from a flat array is a lot faster than indexing
+        # the grid with 2 index arrays.
+        values = grid.reshape(self.y_size * self.x_size, -1)
+        bottom = values.take(index, axis=0)
+        bottom += (values.take(index + 1, axis=0) - bottom) * tx[..., None]
+        top = values.take(index + self.x_size, axis=0)
+        top += (values.take(index + self.x_size + 1, axis=0) - top) * tx[..., None]
+        return bottom + (top - bottom) * ty[..., None]
+
+    def get_height(self, x, y):
+        # Calculate the height of the terrain at the given positions. Positions outside of the terrain have no
+        # height.
+        index, tx, ty, outside = self.get_coords(x, y)
+        heights = self.sample(self.heights, index, tx, ty)[..., 0]
+        heights[outside] = np.nan
+        return heights
+
+    def get_normal(self, x, y):
+        # Calculate the normal of the terrain at the given positions. Positions outside of the terrain have no
+        # normal.
+        index, tx, ty, outside = self.get_coords(x, y)
+        normals = self.sample(self.normals, index, tx, ty)
+        normals /= np.sqrt(np.einsum("...i,...i->...", normals, normals))[..., None]
+        normals[outside] = np.nan
+        return normals
+
+    def get_surface(self, x, y):
+        # Calculate both the heights and normals of the terrain at the given positions
+        index, tx, ty, outside = self.get_coords(x, y)
+        heights = self.sample(self.heights, index, tx, ty)[..., 0]
+        heights[outside] = np.nan
+        normals = self.sample(self.normals, index, tx, ty)
+        normals /= np.sqrt(np.einsum("...i,...i->...", normals, normals))[..., None]
+        normals[outside] = np.nan
+        return heights, normals
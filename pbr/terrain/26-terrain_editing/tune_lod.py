@@ -0,0 +1,171 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+from panda3d.core import load_prc_file_data
+
+from benchmark import compare_images, keyframes, load_camera_path, run_variant
+
+
+# Functions
+# =========
+def parse_near_far(value):
+    try:
+        near, far = (float(x) for x in value.split(":"))
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected near:far, got {}".format(value))
+
+    if not 0 <= near < far:
+        raise argparse.ArgumentTypeError("near must be less than far: {}".format(value))
+
+    return near, far
+
+
+def get_settings_name(block_size, near, far, min_level):
+    return "b{}_n{:g}_f{:g}_m{}".format(block_size, near, far, min_level)
+
+
+def get_settings_config(block_size, near, far, min_level):
+    return "\n".join((
+        "terrain-block-size {}".format(block_size),
+        "terrain-lod-near {}".format(near),
+        "terrain-lod-far {}".format(far),
+        "terrain-min-level {}".format(min_level)
+    ))
+
+
+def dominates(a, b):
+    # A result dominates another one if it is at least as fast and looks at least as close to the reference,
+    # and is better in at least one of them
+    return (a["p95_ms"] <= b["p95_ms"] and a["psnr"] >= b["psnr"]
+        and (a["p95_ms"] < b["p95_ms"] or a["psnr"] > b["psnr"]))
+
+
+def get_pareto_front(results):
+    # Keep the results that no other result dominates, from the fastest to the slowest
+    front = [result for result in results if not any(dominates(other, result) for other in results)]
+    return sorted(front, key=lambda result: result["p95_ms"])
+
+
+def main():
+    # Parse command line
+    parser = argparse.ArgumentParser(description="Find the best GeoMipTerrain LOD settings for a frame budget.")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=(16, 32, 64), help="block sizes to try")
+    parser.add_argument("--near-far", type=parse_near_far, nargs="+", default=((0, 500), (16, 128), (64, 512)),
+        help="near and far LOD distances to try, given as near:far")
+    parser.add_argument("--min-levels", type=int, nargs="+", default=(0, 1), help="minimum levels to try")
+    parser.add_argument("--budget", type=float, default=1000 / 60, help="frame budget for the 95th percentile in ms")
+    parser.add_argument("--frames", type=int, default=120, help="number of measured frames")
+    parser.add_argument("--warmup", type=int, default=30, help="number of frames to skip before measuring")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), help="window size")
+    parser.add_argument("--output-dir", default="tuning_results", help="directory for results and screenshots")
+    parser.add_argument("--path", help="camera path recorded with the demo instead of the circle around the lake")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Run a single set of settings in this process
+    if args.run is not None:
+        camera_path = load_camera_path(args.path) if args.path is not None else None
+        result = run_variant(args.run, args.frames, args.warmup, args.size, args.output_dir, args.config,
+            camera_path)
+
+        with open(os.path.join(args.output_dir, args.run + ".json"), "w") as f:
+            json.dump(result, f, indent=4)
+
+        return
+
+    # The reference renders the whole terrain at full detail. Each set of settings is run in a separate process,
+    # just like the variants of the benchmark.
+    settings = [("reference", "terrain-bruteforce 1", None)]
+
+    for block_size, (near, far), min_level in itertools.product(args.block_sizes, args.near_far, args.min_levels):
+        settings.append((
+            get_settings_name(block_size, near, far, min_level),
+            get_settings_config(block_size, near, far, min_level),
+            (block_size, near, far, min_level)
+        ))
+
+    results = []
+
+    for name, config, params in settings:
+        subprocess.run([
+            sys.executable, __file__, "--run", name, "--config", config,
+            "--frames", str(args.frames),
+            "--warmup", str(args.warmup),
+            "--size", str(args.size[0]), str(args.size[1]),
+            "--output-dir", args.output_dir
+        ] + (["--path", args.path] if args.path is not None else []), check=True)
+
+        with open(os.path.join(args.output_dir, name + ".json")) as f:
+            result = json.load(f)
+
+        result["params"] = params
+        results.append(result)
+
+    # Compare each set of settings against the reference. Screenshots must be loaded at their original size.
+    load_prc_file_data("tune_lod", "textures-power-2 none")
+
+    for result in results:
+        result["psnr"] = min(
+            compare_images(
+                os.path.join(args.output_dir, "reference-{:04d}.png".format(int(args.frames * keyframe))),
+                os.path.join(args.output_dir, "{}-{:04d}.png".format(result["name"], int(args.frames * keyframe)))
+            ) for keyframe in keyframes
+        )
+
+    print("{:<18} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}".format(
+        "settings", "mean ms", "p50 ms", "p95 ms", "p99 ms", "lod ms", "triangles", "PSNR dB"
+    ))
+
+    for result in results:
+        print("{:<18} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.0f} {:>10.2f}".format(
+            result["name"],
+            result["mean_ms"],
+            result["p50_ms"],
+            result["p95_ms"],
+            result["p99_ms"],
+            result["lod_ms"],
+            result["triangles"],
+            result["psnr"]
+        ))
+
+    # Find the settings that fit into the budget and can't be made faster without looking worse
+    candidates = [result for result in results[1:] if result["p95_ms"] <= args.budget]
+    front = get_pareto_front(candidates)
+
+    with open(os.path.join(args.output_dir, "pareto.json"), "w") as f:
+        json.dump({"budget_ms": args.budget, "front": front}, f, indent=4)
+
+    print()
+
+    if not front:
+        fastest = min(results[1:], key=lambda result: result["p95_ms"])
+        print("No settings fit into a budget of {:.2f} ms. The fastest settings are {} with {:.2f} ms.".format(
+            args.budget, fastest["name"], fastest["p95_ms"]))
+        return
+
+    print("Pareto-optimal settings within a budget of {:.2f} ms:".format(args.budget))
+
+    for result in front:
+        block_size, near, far, min_level = result["params"]
+        print("    block size {:>3}, near {:>5g}, far {:>5g}, min level {}: {:.2f} ms, {:.2f} dB".format(
+            block_size, near, far, min_level, result["p95_ms"], result["psnr"]))
+
+    # The slowest settings on the front look closest to the reference
+    block_size, near, far, min_level = front[-1]["params"]
+    print()
+    print("Recommended settings:")
+    print(get_settings_config(block_size, near, far, min_level))
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#version 140
+
+in vec4 p3d_Vertex;
+
+uniform mat4 p3d_ModelMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat3 p3d_NormalMatrix;
+// The water cameras of oblique clipping mode are clipped by their near planes instead of clip planes. Variants
+// of this shader for it are created by defining WATER_OBLIQUE_CLIPPING before the shader is compiled.
+#ifndef WATER_OBLIQUE_CLIPPING
+uniform vec4 p3d_ClipPlane[1];
+#endif
+uniform sampler2D heightMap;
+uniform samplerBuffer patchData;
+uniform vec2 morphRanges[16];
+uniform float patchSize;
+uniform float terrainSize;
+uniform vec3 focalPos;
+
+out vec3 fragPos;
+out vec3 normal;
+out vec2 uv;
+
+
+float getHeight(vec2 pos) {
+    // Sample the height at the given pixel coordinates. Linear filtering blends the heights between pixels.
+    return texture(heightMap, (pos + .5) / (terrainSize + 1)).r;
+}
+
+
+void main() {
+    // Fetch the origin, size, and level of the patch and move the vertex into it
+    vec4 patch = texelFetch(patchData, gl_InstanceID);
+    float spacing = patch.z / patchSize;
+    vec2 gridPos = p3d_Vertex.xy;
+    vec2 pos = patch.xy + gridPos * spacing;
+
+    // Morph the odd vertices of the patch onto the grid of the next level as the vertex approaches the end of
+    // the range of its level. At the end of the range, the patch looks exactly like a patch of the next level,
+    // so it meets its coarser neighbors without cracks.
+    vec3 worldPos = vec3(p3d_ModelMatrix * vec4(pos, getHeight(pos), 1));
+    vec2 morphRange = morphRanges[int(patch.w)];
+    float morph = clamp((distance(worldPos, focalPos) - morphRange.x) / (morphRange.y - morphRange.x), 0, 1);
+    pos -= mod(gridPos, 2) * spacing * morph;
+    vec4 vertex = vec4(pos, getHeight(pos), 1);
+
+    // Calculate the normal the same way GeoMipTerrain does
+    vec3 localNormal = vec3(
+        (getHeight(pos - vec2(1, 0)) - getHeight(pos + vec2(1, 0))) * .5,
+        (getHeight(pos - vec2(0, 1)) - getHeight(pos + vec2(0, 1))) * .5,
+        1
+    );
+
+    // Calculate vertex position, fragment position, and surface normal
+    gl_Position = p3d_ModelViewProjectionMatrix * vertex;
+    fragPos = vec3(p3d_ModelViewMatrix * vertex);
+    normal = p3d_NormalMatrix * localNormal;
+
+    // Calculate UV
+    uv = pos / terrainSize;
+
+#ifndef WATER_OBLIQUE_CLIPPING
+    // Calculate clip distance
+    gl_ClipDistance[0] = dot(vec4(fragPos, 1), p3d_ClipPlane[0]);
+#endif
+}
@@ -0,0 +1,281 @@
+import math
+import time
+
+import numpy as np
+from panda3d.core import (
+    GeoMipTerrain,
+    LPoint3,
+    PNMImage,
+    Texture
+)
+
+from heightfield import load_heightfield, make_heightfield_image
+
+
+# Classes
+# =======
+class TerrainEditor(object):
+    # Brush Modes
+    BM_raise = "raise"
+    BM_flatten = "flatten"
+    BM_smooth = "smooth"
+
+    def __init__(self, terrain, focal_point, lod=None, sampler=None, splat_generator=None, splat_tex=None,
+        splat_culler=None, horizon_culler=None, raycaster=None, vegetation=None, time_budget=.004):
+        self.terrain = terrain
+        self.focal_point = focal_point
+        self.lod = lod
+        self.sampler = sampler
+        self.splat_generator = splat_generator
+        self.splat_tex = splat_tex
+        self.splat_culler = splat_culler
+        self.horizon_culler = horizon_culler
+        self.raycaster = raycaster
+        self.vegetation = vegetation
+        self.time_budget = time_budget
+
+        # The heights are edited in memory and copied into the heightfield of the terrain afterwards. They are
+        # rounded to the precision of the heightfield, so that they always match the heights of the terrain.
+        heightfield = terrain.heightfield()
+        self.block_size = terrain.get_block_size()
+        self.maxval = heightfield.get_maxval()
+        self.heights = np.array(load_heightfield(heightfield), np.float32)
+        self.y_size, self.x_size = self.heights.shape
+        self.num_blocks = (
+            (self.x_size - 1) // self.block_size,
+            (self.y_size - 1) // self.block_size
+        )
+
+        # A generated splat mask is generated again wherever the heights change, while a painted mask is left
+        # alone. The loader may have scaled the mask to a power of 2, so it is copied into the texture again at the
+        # size of the heightfield and kept in memory, so that it can be edited.
+        if splat_generator is not None:
+            mask = splat_generator.generate_region(self.heights, 0, 0, self.x_size, self.y_size)
+            splat_tex.setup_2d_texture(self.x_size, self.y_size, Texture.T_unsigned_byte, Texture.F_rgb8)
+            splat_tex.set_ram_image(np.ascontiguousarray(mask[..., ::-1]))
+            splat_tex.set_keep_ram_image(True)
+
+        # Edited blocks are rebuilt in small windows of the terrain. GeoMipTerrain only accepts heightfields that
+        # are a power of 2 plus 1 pixels wide, so each window is 4 blocks wide unless the terrain is smaller.
+        self.window_size = (min(self.num_blocks[0], 4), min(self.num_blocks[1], 4))
+        self.dirty = set()
+
+        # Initialize stats
+        self.edit_count = 0
+        self.edit_time = 0.0
+        self.rebuild_count = 0
+        self.rebuild_time = 0.0
+        self.max_rebuild_time = 0.0
+        self.blocks_rebuilt = 0
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_terrain_editor", sort=-4)
+
+    def stop(self):
+        base.task_mgr.remove("update_terrain_editor")
+
+    def get_heightfield_pos(self, pos):
+        # Convert a world space position to heightfield coordinates
+        pos = self.terrain.get_root().get_relative_point(base.render, LPoint3(pos[0], pos[1], 0))
+        return pos.x, pos.y
+
+    def paint(self, pos, radius, amount, mode=BM_raise):
+        # Apply the brush at the given world space position. Raising adds the given amount to the height of the
+        # terrain at the center of the brush, and a negative amount lowers it. Flattening and smoothing move the
+        # heights by the given fraction towards the height at the center and the average of their neighbors.
+        if mode not in (self.BM_raise, self.BM_flatten, self.BM_smooth):
+            raise ValueError("Invalid brush mode: {}".format(mode))
+
+        root = self.terrain.get_root()
+        cx, cy = self.get_heightfield_pos(pos)
+        radius /= root.get_sx(base.render)
+        x0 = max(int(math.floor(cx - radius)), 0)
+        y0 = max(int(math.floor(cy - radius)), 0)
+        x1 = min(int(math.ceil(cx + radius)) + 1, self.x_size)
+        y1 = min(int(math.ceil(cy + radius)) + 1, self.y_size)
+
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        # The brush fades out smoothly towards its edge
+        y, x = np.mgrid[y0:y1, x0:x1]
+        dist = np.hypot(x - cx, y - cy) / radius
+        weights = np.clip(1 - dist * dist, 0, 1) ** 2
+        heights = self.heights[y0:y1, x0:x1]
+
+        if mode == self.BM_raise:
+            self.set_heights(x0, y0, heights + weights * amount / root.get_sz(base.render))
+            return
+
+        if mode == self.BM_flatten:
+            target = self.heights[
+                min(max(int(round(cy)), 0), self.y_size - 1),
+                min(max(int(round(cx)), 0), self.x_size - 1)
+            ]
+
+        else:
+            # Average each height with its 8 neighbors. The neighbors are clamped at the edges of the heightfield.
+            xs = np.clip(np.arange(x0 - 1, x1 + 1), 0, self.x_size - 1)
+            ys = np.clip(np.arange(y0 - 1, y1 + 1), 0, self.y_size - 1)
+            padded = self.heights[ys[:, None], xs]
+            target = sum(
+                padded[dy:dy + y1 - y0, dx:dx + x1 - x0] for dy in range(3) for dx in range(3)
+            ) / 9
+
+        self.set_heights(x0, y0, heights + (target - heights) * weights * min(amount, 1))
+
+    def set_heights(self, x, y, heights):
+        # Replace the heights of a region that starts at the given column and row. The heights go from 0 to 1.
+        start = time.perf_counter()
+        heights = np.round(np.clip(heights, 0, 1) * self.maxval) / self.maxval
+        x1 = x + heights.shape[1]
+        y1 = y + heights.shape[0]
+        self.heights[y:y1, x:x1] = heights
+
+        # The normals of the pixels next to the region depend on its heights too, and a pixel on the edge of a
+        # block is shared with the next block. Each block that contains one of these pixels has to be rebuilt.
+        mx0 = max((x - 2) // self.block_size, 0)
+        my0 = max((y - 2) // self.block_size, 0)
+        mx1 = min(x1 // self.block_size + 1, self.num_blocks[0])
+        my1 = min(y1 // self.block_size + 1, self.num_blocks[1])
+        blocks = [(mx, my) for my in range(my0, my1) for mx in range(mx0, mx1)]
+        self.dirty.update(blocks)
+
+        # Copy the heights into the heightfield of the terrain. Row 0 is the bottom row of the image.
+        image = make_heightfield_image(heights)
+
+        if self.lod is not None:
+            self.lod.set_heights(x, self.y_size - y1, image, blocks)
+
+        else:
+            self.terrain.heightfield().copy_sub_image(image, x, self.y_size - y1)
+
+        # Update everything else that was calculated from the heights
+        if self.sampler is not None:
+            self.sampler.set_heights(x, y, heights)
+
+        if self.horizon_culler is not None:
+            self.horizon_culler.update_heights(self.heights, x, y, x1, y1)
+
+        if self.raycaster is not None:
+            self.raycaster.update_heights(x, y, x1, y1)
+
+        # The mask around the region changes too, so the vegetation is scattered again in the same region
+        x0 = max(x - 1, 0)
+        y0 = max(y - 1, 0)
+        x1 = min(x1 + 1, self.x_size)
+        y1 = min(y1 + 1, self.y_size)
+        region = self.update_splat_mask(x0, y0, x1, y1) if self.splat_generator is not None else None
+
+        if self.vegetation is not None:
+            self.vegetation.update_region(x0, y0, x1, y1, region)
+
+        self.edit_count += 1
+        self.edit_time += time.perf_counter() - start
+
+    def update_splat_mask(self, x0, y0, x1, y1):
+        # The slope of a pixel depends on its neighbors, so the mask is generated again for the edited region and
+        # the pixels around it. Row 0 of the texture is the bottom row, and texels are stored in BGR order.
+        region = self.splat_generator.generate_region(self.heights, x0, y0, x1, y1)
+        num_components = self.splat_tex.get_num_components()
+        texels = np.asarray(memoryview(self.splat_tex.modify_ram_image())).reshape(
+            self.y_size,
+            self.x_size,
+            num_components
+        )
+        texels[y0:y1, x0:x1, 2::-1] = region
+        region = region.astype(np.float32) / 255
+
+        if self.splat_culler is not None:
+            self.splat_culler.set_mask_region(x0, y0, region)
+
+        return region
+
+    def rebuild_window(self, mx, my, focal_pos):
+        # Find a window of blocks around the given block. A block is built exactly like in the terrain as long as
+        # all of its neighbors are in the window, since its edges are stitched to the levels of its neighbors.
+        # The blocks on the edge of the terrain have no neighbors there.
+        wx = min(max(mx - 1, 0), self.num_blocks[0] - self.window_size[0])
+        wy = min(max(my - 1, 0), self.num_blocks[1] - self.window_size[1])
+        inner_x = range(wx if wx == 0 else wx + 1,
+            wx + self.window_size[0] - (1 if wx + self.window_size[0] < self.num_blocks[0] else 0))
+        inner_y = range(wy if wy == 0 else wy + 1,
+            wy + self.window_size[1] - (1 if wy + self.window_size[1] < self.num_blocks[1] else 0))
+        blocks = [(bx, by) for by in inner_y for bx in inner_x if (bx, by) in self.dirty]
+
+        # Generate the window with the same settings and focal point as the terrain. The focal point is given in
+        # the space of the terrain root, which has no scale in the window.
+        heightfield = self.terrain.heightfield()
+        x_size = self.window_size[0] * self.block_size + 1
+        y_size = self.window_size[1] * self.block_size + 1
+        image = PNMImage(x_size, y_size, heightfield.get_num_channels(), heightfield.get_maxval())
+        image.copy_sub_image(heightfield, 0, 0, wx * self.block_size, self.y_size - wy * self.block_size - y_size,
+            x_size, y_size)
+
+        window = GeoMipTerrain("TerrainEditWindow")
+        window.set_heightfield(image)
+        window.set_block_size(self.block_size)
+        window.set_near_far(self.terrain.get_near(), self.terrain.get_far())
+        window.set_min_level(self.terrain.get_min_level())
+        window.set_bruteforce(self.terrain.get_bruteforce())
+        window.set_focal_point(LPoint3(
+            focal_pos.x - wx * self.block_size,
+            focal_pos.y - wy * self.block_size,
+            focal_pos.z
+        ))
+        window.generate()
+
+        for bx, by in blocks:
+            node = window.get_block_node_path(bx - wx, by - wy).node()
+
+            # The texture coordinates of the window go from 0 to 1 across the window instead of the terrain
+            for i in range(node.get_num_geoms()):
+                vdata = node.modify_geom(i).modify_vertex_data()
+                vformat = vdata.get_format()
+                array = vformat.get_array_with("texcoord")
+                column = vformat.get_column("texcoord").get_start() // 4
+                data = np.asarray(memoryview(vdata.modify_array(array))).view(np.float32).reshape(
+                    vdata.get_num_rows(),
+                    -1
+                )
+                data[:, column] = (data[:, column] * (x_size - 1) + wx * self.block_size) / (self.x_size - 1)
+                data[:, column + 1] = (data[:, column + 1] * (y_size - 1) + wy * self.block_size) / (self.y_size - 1)
+
+            # Only the geoms are replaced, so the state of the block is kept
+            target = self.terrain.get_block_node_path(bx, by).node()
+            target.remove_all_geoms()
+            target.add_geoms_from(node)
+            self.dirty.discard((bx, by))
+
+        return len(blocks)
+
+    def update(self, task):
+        if not self.dirty:
+            return task.cont
+
+        # Rebuild the dirty blocks closest to the focal point first, until the time budget of this frame is
+        # used up. At least one window is rebuilt each frame, so the edits always show up eventually.
+        start = time.perf_counter()
+        focal_pos = LPoint3(self.focal_point.get_pos(self.terrain.get_root()))
+
+        while self.dirty:
+            mx, my = min(self.dirty, key=lambda coords: (
+                ((coords[0] + .5) * self.block_size - focal_pos.x) ** 2
+                + ((coords[1] + .5) * self.block_size - focal_pos.y) ** 2
+            ))
+            self.blocks_rebuilt += self.rebuild_window(mx, my, focal_pos)
+
+            if time.perf_counter() - start >= self.time_budget:
+                break
+
+        rebuild_time = time.perf_counter() - start
+        self.rebuild_count += 1
+        self.rebuild_time += rebuild_time
+        self.max_rebuild_time = max(self.max_rebuild_time, rebuild_time)
+        return task.cont
+
+    def get_average_edit_time(self):
+        return self.edit_time / self.edit_count if self.edit_count > 0 else 0.0
+
+    def get_average_rebuild_time(self):
+        return self.rebuild_time / self.rebuild_count if self.rebuild_count > 0 else 0.0
@@ -0,0 +1,48 @@
+import argparse
+
+import numpy as np
+
+from heightfield import RawHeightfield
+
+
+# Functions
+# =========
+def generate_hills(size=513, seed=0, octaves=6):
+    # Add up waves running in random directions. Each octave has twice the frequency and half the amplitude of
+    # the previous one.
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:size, :size].astype(np.float64)
+    noise = np.zeros((size, size))
+
+    for octave in range(octaves):
+        frequency = 2 ** octave / 128
+
+        for i in range(3):
+            angle, phase = rng.uniform(0, np.pi * 2, 2)
+            noise += np.sin((x * np.cos(angle) + y * np.sin(angle)) * frequency * np.pi * 2 + phase) / 2 ** octave
+
+    noise = (noise - noise.min()) / (noise.max() - noise.min())
+
+    # Carve a valley along the circle the benchmark camera flies around the lake, so that the camera never ends
+    # up inside a hill
+    dist = np.abs(np.hypot(x - 256, y - 261) - 120)
+    valley = np.clip((dist - 12) / 60, 0, 1)
+    valley = valley * valley * (3 - 2 * valley)
+    return np.clip(.36 + valley * (.25 + .45 * noise), 0, 1)
+
+
+def main():
+    # Parse command line
+    parser = argparse.ArgumentParser(description="Generate a hilly raw heightfield for testing.")
+    parser.add_argument("output", help="raw heightfield, usually with the extension " + RawHeightfield.extension)
+    parser.add_argument("--size", type=int, default=513, help="number of pixels along each side")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random number generator")
+    args = parser.parse_args()
+
+    RawHeightfield.write(args.output, generate_hills(args.size, args.seed))
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,737 @@
+import json
+
+import numpy as np
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import (
+    AmbientLight,
+    ClockObject,
+    ConfigVariableBool,
+    ConfigVariableDouble,
+    ConfigVariableInt,
+    ConfigVariableString,
+    DirectionalLight,
+    Filename,
+    GeoMipTerrain,
+    KeyboardButton,
+    load_prc_file,
+    look_at,
+    Material,
+    Point3,
+    Quat,
+    SamplerState,
+    TextureStage,
+    Vec2,
+    Vec3,
+    Vec4
+)
+
+from editing import TerrainEditor
+from gpu_terrain import GPUTerrain
+from heightfield import HeightfieldSampler, is_raw_heightfield, load_heightfield_image
+from horizon import HorizonCuller
+from lod import TerrainLODUpdater
+from ocean import OceanSimulation
+from raycast import HeightfieldRaycaster
+from ripples import RippleSimulation
+from splatlayers import SplatLayerCuller
+from splatmask import SplatMaskGenerator
+from tiles import TerrainTileManager
+from vegetation import make_grass_tuft, make_rock, VegetationScatter
+from water import load_shader, WaterPlane
+
+
+# Config Variables
+# ================
+water_reflection_mode = ConfigVariableString(
+    "water-reflection-mode",
+    WaterPlane.RM_planar,
+    "Selects how the water plane renders reflections (planar or screen_space)."
+)
+water_refraction_mode = ConfigVariableString(
+    "water-refraction-mode",
+    WaterPlane.RFM_separate_pass,
+    "Selects where the water plane gets its refraction from (separate_pass or main_pass)."
+)
+water_clip_mode = ConfigVariableString(
+    "water-clip-mode",
+    WaterPlane.CM_clip_plane,
+    "Selects how the water cameras are clipped at the water surface (clip_plane or oblique)."
+)
+water_depth_format = ConfigVariableString(
+    "water-depth-format",
+    WaterPlane.DF_depth24,
+    "Selects the depth format of the water refraction buffer (depth16, depth24 or depth32f)."
+)
+water_linear_depth = ConfigVariableBool(
+    "water-linear-depth",
+    False,
+    "Stores linear depth in the alpha channel of the water refraction buffer."
+)
+water_depth_strict = ConfigVariableBool(
+    "water-depth-strict",
+    False,
+    "Raises an error if the water refraction buffer doesn't get the requested formats."
+)
+water_mesh_mode = ConfigVariableString(
+    "water-mesh-mode",
+    WaterPlane.MM_quad,
+    "Selects the mesh used for the water surface (quad or projected_grid)."
+)
+water_grid_size = ConfigVariableInt(
+    "water-grid-size",
+    128,
+    "Number of cells along each side of the projected water grid."
+)
+ocean_enabled = ConfigVariableBool(
+    "ocean-enabled",
+    False,
+    "Displaces the water surface with an FFT ocean simulation."
+)
+ocean_resolution = ConfigVariableInt(
+    "ocean-resolution",
+    128,
+    "Resolution of the ocean simulation grid."
+)
+ocean_tick_rate = ConfigVariableDouble(
+    "ocean-tick-rate",
+    30,
+    "Number of times per second the ocean simulation is updated."
+)
+ocean_spectrum = ConfigVariableString(
+    "ocean-spectrum",
+    OceanSimulation.ST_phillips,
+    "Selects the wave spectrum of the ocean simulation (phillips or jonswap)."
+)
+water_buoy_count = ConfigVariableInt(
+    "water-buoy-count",
+    0,
+    "Number of buoys floating on each side of a square grid on the water."
+)
+water_ripples_enabled = ConfigVariableBool(
+    "water-ripples-enabled",
+    False,
+    "Adds interactive ripples to the water surface."
+)
+water_ripple_resolution = ConfigVariableInt(
+    "water-ripple-resolution",
+    256,
+    "Resolution of the ripple simulation grid."
+)
+water_ripple_rain = ConfigVariableDouble(
+    "water-ripple-rain",
+    20,
+    "Number of rain drops per second that disturb the water when ripples are enabled."
+)
+terrain_heightfield = ConfigVariableString(
+    "terrain-heightfield",
+    "images/Heightmap.png",
+    "Heightfield of the terrain. Raw heightfields with the extension .hf are loaded without decoding them."
+)
+terrain_tiles_enabled = ConfigVariableBool(
+    "terrain-tiles-enabled",
+    False,
+    "Splits the terrain into tiles which are generated in the background around the camera."
+)
+terrain_tile_size = ConfigVariableInt(
+    "terrain-tile-size",
+    128,
+    "Number of heightfield pixels along each side of a terrain tile."
+)
+terrain_tile_load_radius = ConfigVariableDouble(
+    "terrain-tile-load-radius",
+    512,
+    "Distance from the camera within which terrain tiles are loaded."
+)
+terrain_tile_memory_limit = ConfigVariableDouble(
+    "terrain-tile-memory-limit",
+    64,
+    "Maximum amount of memory in MB used by the geometry of the loaded terrain tiles."
+)
+terrain_block_size = ConfigVariableInt(
+    "terrain-block-size",
+    32,
+    "Number of heightfield pixels along each side of a GeoMipTerrain block."
+)
+terrain_lod_near = ConfigVariableDouble(
+    "terrain-lod-near",
+    0,
+    "Distance from the camera within which GeoMipTerrain blocks are rendered at full detail."
+)
+terrain_lod_far = ConfigVariableDouble(
+    "terrain-lod-far",
+    500,
+    "Distance from the camera beyond which GeoMipTerrain blocks are rendered at the lowest detail. The default "
+    "matches the default LOD of GeoMipTerrain for blocks of 32."
+)
+terrain_min_level = ConfigVariableInt(
+    "terrain-min-level",
+    0,
+    "Finest level of detail of GeoMipTerrain blocks. 0 is full detail, and each level halves the vertices."
+)
+terrain_lod_mode = ConfigVariableString(
+    "terrain-lod-mode",
+    TerrainLODUpdater.LM_main_thread,
+    "Selects where the LOD of the terrain is recalculated (main_thread or worker)."
+)
+terrain_lod_max_blocks = ConfigVariableInt(
+    "terrain-lod-max-blocks",
+    16,
+    "Maximum number of terrain blocks rebuilt per frame on average when the LOD is recalculated by a worker. "
+    "The worker skips frames after an update that rebuilt more blocks."
+)
+terrain_gpu_enabled = ConfigVariableBool(
+    "terrain-gpu-enabled",
+    False,
+    "Renders the terrain with instanced patches that are displaced on the GPU instead of GeoMipTerrain."
+)
+terrain_gpu_lod_distance = ConfigVariableDouble(
+    "terrain-gpu-lod-distance",
+    160,
+    "Distance from the camera within which the GPU terrain is rendered at full detail."
+)
+terrain_bruteforce = ConfigVariableBool(
+    "terrain-bruteforce",
+    False,
+    "Renders the whole GeoMipTerrain at full detail."
+)
+terrain_splat_generate = ConfigVariableBool(
+    "terrain-splat-generate",
+    False,
+    "Generates the splat mask of the terrain from the heights and slopes of the heightfield."
+)
+terrain_splat_workers = ConfigVariableInt(
+    "terrain-splat-workers",
+    0,
+    "Number of worker processes used to generate the splat mask. 0 generates it on the main thread."
+)
+terrain_splat_cache_dir = ConfigVariableString(
+    "terrain-splat-cache-dir",
+    "cache",
+    "Directory in which generated splat masks are cached."
+)
+terrain_splat_culling = ConfigVariableBool(
+    "terrain-splat-culling",
+    False,
+    "Renders each terrain block with a shader variant that only samples the layers its part of the mask uses."
+)
+terrain_horizon_culling = ConfigVariableBool(
+    "terrain-horizon-culling",
+    False,
+    "Hides the terrain blocks that are below the horizon formed by the terrain in front of them."
+)
+terrain_editing = ConfigVariableBool(
+    "terrain-editing",
+    False,
+    "Lets the terrain under the mouse be sculpted. Hold e to raise, q to lower, f to flatten and g to smooth it."
+)
+terrain_brush_radius = ConfigVariableDouble(
+    "terrain-brush-radius",
+    12,
+    "Radius of the brush used to sculpt the terrain."
+)
+terrain_brush_strength = ConfigVariableDouble(
+    "terrain-brush-strength",
+    8,
+    "Height per second by which the brush raises or lowers the center of the brush."
+)
+terrain_edit_budget = ConfigVariableDouble(
+    "terrain-edit-budget",
+    4,
+    "Time in ms spent per frame on rebuilding the terrain blocks that were sculpted."
+)
+terrain_rock_count = ConfigVariableInt(
+    "terrain-rock-count",
+    0,
+    "Number of rocks scattered across the terrain above the water."
+)
+terrain_vegetation = ConfigVariableBool(
+    "terrain-vegetation",
+    False,
+    "Scatters grass and rocks across the terrain where the splat mask shows their layers, with one instanced "
+    "draw for each type."
+)
+terrain_grass_density = ConfigVariableDouble(
+    "terrain-grass-density",
+    .25,
+    "Number of grass tufts per square unit where the base layer of the terrain is fully visible."
+)
+terrain_vegetation_rock_density = ConfigVariableDouble(
+    "terrain-vegetation-rock-density",
+    .02,
+    "Number of instanced rocks per square unit where the rock layer of the terrain is fully visible."
+)
+terrain_vegetation_fade_start = ConfigVariableDouble(
+    "terrain-vegetation-fade-start",
+    64,
+    "Distance from the camera at which the density of the vegetation starts to fall off."
+)
+terrain_vegetation_fade_end = ConfigVariableDouble(
+    "terrain-vegetation-fade-end",
+    160,
+    "Distance from the camera beyond which no vegetation is drawn."
+)
+camera_path_file = ConfigVariableString(
+    "camera-path-file",
+    "camera_path.json",
+    "File the camera path is written to when it is recorded. Press r to start and stop recording."
+)
+
+
+# Application Class
+# =================
+class TerrainDemo(ShowBase):
+    def __init__(self):
+        # Load config file
+        load_prc_file("settings.prc")
+
+        # Call base constructor
+        ShowBase.__init__(self)
+
+        # Load shaders
+        self.terrain_shader = load_shader(
+            "shaders/Terrain.vert.glsl",
+            "shaders/Terrain.frag.glsl",
+            water_clip_mode.get_value()
+        )
+
+        # Setup lighting
+        self.ambient_light = self.render.attach_new_node(AmbientLight("AmbientLight"))
+        self.ambient_light.node().set_color(Vec4(.2, .2, .2, 1))
+        self.render.set_light(self.ambient_light)
+
+        self.sun = self.render.attach_new_node(DirectionalLight("Sun"))
+        self.sun.set_hpr(45, -45, 0)
+        self.render.set_light(self.sun)
+
+        # Create materials
+        terrain_mat = Material("Terrain")
+        terrain_mat.set_base_color(Vec4(0, .5, 0, 1))
+        terrain_mat.set_metallic(0)
+        terrain_mat.set_emission(Vec4(0, 0, 0, 1))
+        terrain_mat.set_roughness(.8)
+        terrain_mat.set_refractive_index(1.5)
+
+        # Load textures
+        self.grass_tex = self.loader.load_texture("images/Grass.png")
+        self.grass_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.grass_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.dirt_tex = self.loader.load_texture("images/Dirt.png")
+        self.dirt_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.dirt_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.rock_tex = self.loader.load_texture("images/Rock.png")
+        self.rock_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.rock_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        self.blank_tex = self.loader.load_texture("images/Blank.png")
+        self.blank_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.blank_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        # The splat mask can be generated from the heightfield instead of painted by hand. Generated masks are
+        # cached, so they are only generated again when the heightfield or the rules change.
+        if terrain_splat_generate.get_value():
+            self.splat_generator = SplatMaskGenerator(
+                num_workers=terrain_splat_workers.get_value(),
+                cache_dir=terrain_splat_cache_dir.get_value()
+            )
+            color_mask_path = self.splat_generator.get_mask(terrain_heightfield.get_value())
+
+        else:
+            self.splat_generator = None
+            color_mask_path = "images/ColorMask.png"
+
+        self.color_mask_tex = self.loader.load_texture(Filename.from_os_specific(color_mask_path))
+        self.color_mask_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.color_mask_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+
+        # Create terrain root. The material, shader, and textures are shared by the terrain and all of its tiles.
+        self.terrain_root = self.render.attach_new_node("TerrainRoot")
+        self.terrain_root.set_material(terrain_mat)
+
+        self.terrain_root.set_shader(self.terrain_shader)
+        self.terrain_root.set_shader_input("texScale0", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale1", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale2", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("texScale3", Vec2(.1, .1))
+        self.terrain_root.set_shader_input("tileUVOffset", Vec2(0, 0))
+        self.terrain_root.set_shader_input("tileUVScale", Vec2(1, 1))
+
+        stage0 = TextureStage("Grass")
+        stage1 = TextureStage("Dirt")
+        stage2 = TextureStage("Rock")
+        stage3 = TextureStage("Blank")
+        stage4 = TextureStage("ColorMask")
+
+        self.terrain_root.set_texture(stage0, self.grass_tex)
+        self.terrain_root.set_texture(stage1, self.dirt_tex)
+        self.terrain_root.set_texture(stage2, self.rock_tex)
+        self.terrain_root.set_texture(stage3, self.blank_tex)
+        self.terrain_root.set_texture(stage4, self.color_mask_tex)
+
+        # Load terrain. Tiled terrain is split into tiles which are generated in the background around the camera.
+        # GPU terrain is displaced by the vertex shader, so it only needs the sampler for its heights.
+        self.terrain = None
+        self.splat_culler = None
+        self.horizon_culler = None
+        self.terrain_lod = None
+        self.terrain_tiles = None
+        self.gpu_terrain = None
+
+        if terrain_tiles_enabled.get_value():
+            self.terrain_tiles = TerrainTileManager(
+                self.terrain_root,
+                self.camera,
+                heightfield=terrain_heightfield.get_value(),
+                tile_size=terrain_tile_size.get_value(),
+                load_radius=terrain_tile_load_radius.get_value(),
+                unload_radius=terrain_tile_load_radius.get_value() + terrain_tile_size.get_value() / 2,
+                memory_limit=terrain_tile_memory_limit.get_value() * 1024 * 1024
+            )
+
+        elif terrain_gpu_enabled.get_value():
+            self.terrain_sampler = HeightfieldSampler(
+                terrain_heightfield.get_value(),
+                Vec3(-256, 0, -64),
+                Vec3(1, 1, 128)
+            )
+            self.gpu_terrain = GPUTerrain(
+                self.terrain_sampler,
+                self.camera,
+                lod_distance=terrain_gpu_lod_distance.get_value(),
+                clip_mode=water_clip_mode.get_value()
+            )
+            self.gpu_terrain.root.reparent_to(self.terrain_root)
+            self.gpu_terrain.add_camera(self.cam)
+            self.gpu_terrain.start()
+
+        else:
+            self.terrain = GeoMipTerrain("Terrain")
+            self.terrain.set_heightfield(load_heightfield_image(terrain_heightfield.get_value()))
+            self.terrain.set_block_size(terrain_block_size.get_value())
+            self.terrain.set_near_far(terrain_lod_near.get_value(), terrain_lod_far.get_value())
+            self.terrain.set_min_level(terrain_min_level.get_value())
+            self.terrain.set_bruteforce(terrain_bruteforce.get_value())
+            self.terrain.set_focal_point(self.camera)
+
+            self.terrain.get_root().set_sz(128)
+            self.terrain.get_root().set_pos(-256, 0, -64)
+
+            self.terrain.generate()
+            self.terrain.get_root().reparent_to(self.terrain_root)
+
+            # Skip the layers each block doesn't need
+            if terrain_splat_culling.get_value():
+                self.splat_culler = SplatLayerCuller(
+                    self.terrain,
+                    color_mask_path,
+                    clip_mode=water_clip_mode.get_value()
+                )
+                self.splat_culler.apply()
+
+            # Hide the blocks behind the horizon
+            if terrain_horizon_culling.get_value():
+                self.horizon_culler = HorizonCuller(self.terrain, self.camera)
+                self.horizon_culler.start()
+
+            # Start terrain LOD updates
+            self.terrain_lod = TerrainLODUpdater(
+                self.terrain,
+                self.camera,
+                mode=terrain_lod_mode.get_value(),
+                max_blocks_per_frame=terrain_lod_max_blocks.get_value()
+            )
+            self.terrain_lod.start()
+
+        # Create terrain sampler. It uses the same heightfield and transform as the terrain, so it can answer
+        # height and normal queries for many positions at once. Raw heightfields are mapped again instead of
+        # copied from the terrain, so that float heights keep their precision.
+        if self.terrain_tiles is not None:
+            self.terrain_sampler = HeightfieldSampler(
+                self.terrain_tiles.heightfield,
+                Vec3(self.terrain_tiles.pos.x, self.terrain_tiles.pos.y, self.terrain_tiles.height_offset),
+                Vec3(1, 1, self.terrain_tiles.height_scale)
+            )
+
+        elif self.terrain is not None:
+            heightfield = terrain_heightfield.get_value()
+            self.terrain_sampler = HeightfieldSampler(
+                heightfield if is_raw_heightfield(heightfield) else self.terrain.heightfield(),
+                self.terrain.get_root().get_pos(self.render),
+                self.terrain.get_root().get_scale(self.render)
+            )
+
+        # Cast rays against the same heightfield as the sampler, so that picking doesn't depend on the LOD of the
+        # terrain
+        self.terrain_raycaster = HeightfieldRaycaster(self.terrain_sampler)
+
+        # Start ocean simulation
+        self.ocean = None
+
+        if ocean_enabled.get_value():
+            self.ocean = OceanSimulation(
+                resolution=ocean_resolution.get_value(),
+                tick_rate=ocean_tick_rate.get_value(),
+                spectrum=ocean_spectrum.get_value()
+            )
+            self.ocean.start()
+
+        # Start ripple simulation
+        self.ripples = None
+
+        if water_ripples_enabled.get_value():
+            self.ripples = RippleSimulation(resolution=water_ripple_resolution.get_value())
+            self.ripples.start()
+
+        # Load water plane
+        self.water = WaterPlane(
+            Vec3(0, 261, -20),
+            scale=Vec3(256, 256, 1),
+            reflection_mode=water_reflection_mode.get_value(),
+            refraction_mode=water_refraction_mode.get_value(),
+            clip_mode=water_clip_mode.get_value(),
+            depth_format=water_depth_format.get_value(),
+            linear_depth=water_linear_depth.get_value(),
+            strict_depth=water_depth_strict.get_value(),
+            mesh_mode=water_mesh_mode.get_value(),
+            grid_size=water_grid_size.get_value(),
+            ocean=self.ocean,
+            ripples=self.ripples
+        )
+
+        # The water cameras also render the terrain, so the GPU terrain must not cull what they can see
+        if self.gpu_terrain is not None:
+            for camera in (self.water.reflect_cam, self.water.refract_cam):
+                if camera is not None:
+                    self.gpu_terrain.add_camera(camera)
+
+        # Initialize rain. The random number generator uses a fixed seed, so every run looks the same.
+        self.rain_rng = np.random.default_rng(0)
+        self.rain_drops = 0.0
+
+        # Create buoys
+        buoy_count = water_buoy_count.get_value()
+        self.buoys = []
+        self.buoy_x, self.buoy_y = np.meshgrid(
+            np.linspace(-128, 128, buoy_count),
+            np.linspace(133, 389, buoy_count)
+        )
+
+        for i in range(buoy_count * buoy_count):
+            buoy = self.render.attach_new_node("Buoy")
+            box = self.loader.load_model("box")
+            box.reparent_to(buoy)
+            box.set_pos(-2, -2, -2)
+            box.set_scale(4)
+            box.set_texture_off(1)
+            buoy.set_color(Vec4(1, .4, 0, 1))
+            self.buoys.append(buoy)
+
+        # Scatter rocks across the terrain. All rocks are placed with a single query, and the ones that would end
+        # up under water are skipped. The rocks never move, so they are flattened into a single node.
+        rock_count = terrain_rock_count.get_value()
+
+        if rock_count > 0:
+            rock_rng = np.random.default_rng(1)
+            rock_x = rock_rng.uniform(-256, 256, rock_count)
+            rock_y = rock_rng.uniform(0, 512, rock_count)
+            heights, normals = self.terrain_sampler.get_surface(rock_x, rock_y)
+            rocks = self.render.attach_new_node("Rocks")
+            rocks.set_color(Vec4(.4, .4, .4, 1))
+            quat = Quat()
+
+            for x, y, z, normal, size in zip(rock_x, rock_y, heights, normals,
+                rock_rng.uniform(1, 3, rock_count)):
+                if z < self.water.plane.get_z():
+                    continue
+
+                up = Vec3(*normal)
+                look_at(quat, Vec3(0, 1, 0) - up * up.y, up)
+                rock = rocks.attach_new_node("Rock")
+                rock.set_pos_quat(Vec3(x, y, z), quat)
+                box = self.loader.load_model("box")
+                box.reparent_to(rock)
+                box.set_pos(-size / 2, -size / 2, -size / 2)
+                box.set_scale(size)
+                box.set_texture_off(1)
+
+            rocks.flatten_strong()
+
+        # Scatter vegetation across the terrain where the splat mask shows its layers. Each type of vegetation is
+        # a single instanced draw, and its instances are culled in the blocks of the terrain.
+        self.vegetation = None
+
+        if terrain_vegetation.get_value() and (self.terrain is not None or self.gpu_terrain is not None):
+            vegetation_mat = Material("Vegetation")
+            vegetation_mat.set_metallic(0)
+            vegetation_mat.set_emission(Vec4(0, 0, 0, 1))
+            vegetation_mat.set_roughness(.9)
+            vegetation_mat.set_refractive_index(1.5)
+
+            self.vegetation = VegetationScatter(
+                self.terrain_sampler,
+                color_mask_path,
+                self.camera,
+                block_size=self.terrain.get_block_size() if self.terrain is not None else 32,
+                fade_start=terrain_vegetation_fade_start.get_value(),
+                fade_end=terrain_vegetation_fade_end.get_value(),
+                min_height=self.water.plane.get_z(),
+                clip_mode=water_clip_mode.get_value()
+            )
+            self.vegetation.root.set_material(vegetation_mat)
+            self.vegetation.root.reparent_to(self.render)
+
+            grass = self.vegetation.add_type(
+                "Grass",
+                make_grass_tuft(),
+                SplatLayerCuller.L_base,
+                terrain_grass_density.get_value(),
+                scale_range=(.6, 1.4),
+                alignment=.3
+            )
+            grass.set_two_sided(True)
+
+            rocks = self.vegetation.add_type(
+                "Rocks",
+                make_rock(),
+                SplatLayerCuller.L_layer2,
+                terrain_vegetation_rock_density.get_value(),
+                scale_range=(.5, 2.5),
+                alignment=1
+            )
+            rocks.set_color(Vec4(.4, .4, .4, 1))
+
+            # The water cameras render the vegetation too, so its blocks are only culled if no camera sees them
+            for camera in (self.cam, self.water.reflect_cam, self.water.refract_cam):
+                if camera is not None:
+                    self.vegetation.add_camera(camera)
+
+            self.vegetation.start()
+
+        # Let the terrain be sculpted. Only the blocks an edit touches are rebuilt, along with the parts of the
+        # splat mask, the culling data and the vegetation it changes.
+        self.terrain_editor = None
+
+        if terrain_editing.get_value() and self.terrain is not None:
+            self.terrain_editor = TerrainEditor(
+                self.terrain,
+                self.camera,
+                lod=self.terrain_lod,
+                sampler=self.terrain_sampler,
+                splat_generator=self.splat_generator,
+                splat_tex=self.color_mask_tex,
+                splat_culler=self.splat_culler,
+                horizon_culler=self.horizon_culler,
+                raycaster=self.terrain_raycaster,
+                vegetation=self.vegetation,
+                time_budget=terrain_edit_budget.get_value() / 1000
+            )
+            self.terrain_editor.start()
+
+        # Add update task
+        self.task_mgr.add(self.update, "update")
+
+        # Configure buffer viewer
+        self.bufferViewer.setPosition("ulcorner")
+        self.bufferViewer.setCardSize(.5, 0)
+        self.accept("v", self.bufferViewer.toggleEnable)
+
+        # Record the camera path for the benchmark
+        self.camera_path = None
+        self.accept("r", self.toggle_camera_path)
+
+    def toggle_camera_path(self):
+        # Start recording, or write the recorded poses of the camera. Each frame adds one pose.
+        if self.camera_path is None:
+            self.camera_path = []
+            return
+
+        with open(camera_path_file.get_value(), "w") as f:
+            json.dump(self.camera_path, f)
+
+        print("Recorded {} camera poses to {}".format(len(self.camera_path), camera_path_file.get_value()))
+        self.camera_path = None
+
+    def update(self, task):
+        # Record the pose of the camera
+        if self.camera_path is not None:
+            self.camera_path.append((
+                tuple(self.camera.get_pos(self.render)),
+                tuple(self.camera.get_hpr(self.render))
+            ))
+
+        # Sculpt the terrain under the mouse. Offscreen windows have no mouse.
+        if self.terrain_editor is not None and self.mouseWatcherNode is not None:
+            self.update_terrain_editing()
+
+        # Move the buoys to the water surface and align them with its normal. The surface is queried for all
+        # buoys at once.
+        if self.buoys:
+            heights, normals = self.water.get_surface(self.buoy_x, self.buoy_y)
+            quat = Quat()
+
+            for buoy, x, y, z, normal in zip(self.buoys, self.buoy_x.flat, self.buoy_y.flat, heights.flat,
+                normals.reshape(-1, 3)):
+                up = Vec3(*normal)
+                look_at(quat, Vec3(0, 1, 0) - up * up.y, up)
+                buoy.set_pos_quat(Vec3(x, y, z), quat)
+
+        # Let it rain on the lake
+        if self.ripples is not None:
+            self.rain_drops += water_ripple_rain.get_value() * ClockObject.get_global_clock().get_dt()
+
+            while self.rain_drops >= 1:
+                self.water.add_ripple(
+                    self.rain_rng.uniform(-256, 256),
+                    self.rain_rng.uniform(5, 517),
+                    self.rain_rng.uniform(5, 10)
+                )
+                self.rain_drops -= 1
+
+        return task.cont
+
+    def get_mouse_terrain_pos(self):
+        # Find the point of the terrain under the mouse by casting the mouse ray against the heightfield
+        if not self.mouseWatcherNode.has_mouse():
+            return None
+
+        near = Point3()
+        far = Point3()
+        self.camLens.extrude(self.mouseWatcherNode.get_mouse(), near, far)
+        near = self.render.get_relative_point(self.cam, near)
+        far = self.render.get_relative_point(self.cam, far)
+        direction = (far - near).normalized()
+        positions, normals = self.terrain_raycaster.cast_rays(np.array(near), np.array(direction))
+        return positions if not np.isnan(positions[0]) else None
+
+    def update_terrain_editing(self):
+        keys = {
+            "e": (TerrainEditor.BM_raise, terrain_brush_strength.get_value()),
+            "q": (TerrainEditor.BM_raise, -terrain_brush_strength.get_value()),
+            "f": (TerrainEditor.BM_flatten, 1),
+            "g": (TerrainEditor.BM_smooth, 1)
+        }
+        pressed = [key for key in keys if self.mouseWatcherNode.is_button_down(KeyboardButton.ascii_key(key))]
+
+        if not pressed:
+            return
+
+        pos = self.get_mouse_terrain_pos()
+
+        if pos is None:
+            return
+
+        # Flattening and smoothing move the heights towards their target by the same fraction per second
+        mode, rate = keys[pressed[0]]
+        self.terrain_editor.paint(
+            pos,
+            terrain_brush_radius.get_value(),
+            rate * ClockObject.get_global_clock().get_dt(),
+            mode
+        )
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    TerrainDemo().run()
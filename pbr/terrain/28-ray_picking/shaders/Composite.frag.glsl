@@ -0,0 +1,14 @@
+#version 140
+
+uniform sampler2D p3d_Texture0;
+uniform sampler2D p3d_Texture1;
+
+out vec4 p3d_FragColor;
+
+
+void main() {
+    // Copy the main pass color and depth into the window
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+    p3d_FragColor = texelFetch(p3d_Texture0, texel, 0);
+    gl_FragDepth = texelFetch(p3d_Texture1, texel, 0).r;
+}
@@ -0,0 +1,389 @@
+import math
+import time
+
+import numpy as np
+from panda3d.core import (
+    Geom,
+    GeomEnums,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexData,
+    GeomVertexFormat,
+    GeomVertexWriter,
+    NodePath,
+    OmniBoundingVolume,
+    Texture,
+    Vec2
+)
+
+from gpu_terrain import get_frustum_planes
+from horizon import expand_ranges, get_height_ranges
+from splatlayers import load_splat_mask
+from water import load_shader, WaterPlane
+
+
+# Functions
+# =========
+def get_layer_weights(mask):
+    # Calculate how much of each layer is visible, from the base layer to layer 3. Each layer covers the layers
+    # below it by the value of its channel in the mask, just like in the terrain shader.
+    weights = np.empty(mask.shape[:-1] + (4,), np.float32)
+    cover = np.ones(mask.shape[:-1], np.float32)
+
+    for layer in range(3, 0, -1):
+        weights[..., layer] = mask[..., layer - 1] * cover
+        cover = cover * (1 - mask[..., layer - 1])
+
+    weights[..., 0] = cover
+    return weights
+
+
+def make_grass_tuft(num_blades=3, width=.6, height=1.0):
+    # Create a tuft of crossed blades. The blades are darker at the bottom, and their normals point up, so that
+    # they are lit just like the ground they grow from.
+    vdata = GeomVertexData("GrassTuft", GeomVertexFormat.get_v3n3c4(), Geom.UH_static)
+    vdata.unclean_set_num_rows(num_blades * 4)
+    vertex = GeomVertexWriter(vdata, "vertex")
+    normal = GeomVertexWriter(vdata, "normal")
+    color = GeomVertexWriter(vdata, "color")
+    tris = GeomTriangles(Geom.UH_static)
+
+    for i in range(num_blades):
+        angle = math.pi * i / num_blades
+        dx = math.cos(angle) * width / 2
+        dy = math.sin(angle) * width / 2
+
+        for x, y, z in ((-dx, -dy, 0), (dx, dy, 0), (dx * .3, dy * .3, height), (-dx * .3, -dy * .3, height)):
+            vertex.add_data3(x, y, z)
+            normal.add_data3(0, 0, 1)
+            color.add_data4(.05 + z * .1, .15 + z * .25, .02, 1)
+
+        tris.add_vertices(i * 4, i * 4 + 1, i * 4 + 2)
+        tris.add_vertices(i * 4, i * 4 + 2, i * 4 + 3)
+
+    geom = Geom(vdata)
+    geom.add_primitive(tris)
+    node = GeomNode("GrassTuft")
+    node.add_geom(geom)
+    return NodePath(node)
+
+
+def make_rock(num_sides=7, height=.35):
+    # Create a low rock with flat faces and an uneven outline. The rock reaches a little below its origin, so that
+    # it doesn't float on slopes.
+    vdata = GeomVertexData("Rock", GeomVertexFormat.get_v3n3(), Geom.UH_static)
+    vdata.unclean_set_num_rows(num_sides * 6)
+    vertex = GeomVertexWriter(vdata, "vertex")
+    normal = GeomVertexWriter(vdata, "normal")
+    tris = GeomTriangles(Geom.UH_static)
+    top = np.array([0, 0, height])
+    bottom = np.array([0, 0, -height / 2])
+
+    for i in range(num_sides):
+        a0 = math.pi * 2 * i / num_sides
+        a1 = math.pi * 2 * (i + 1) / num_sides
+        r0 = .5 - .15 * (i % 2)
+        r1 = .5 - .15 * ((i + 1) % num_sides % 2)
+        p0 = np.array([math.cos(a0) * r0, math.sin(a0) * r0, 0])
+        p1 = np.array([math.cos(a1) * r1, math.sin(a1) * r1, 0])
+
+        # Each side has a face above and below the widest point of the rock
+        for j, corners in enumerate(((p0, p1, top), (p1, p0, bottom))):
+            n = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+            n /= np.linalg.norm(n)
+
+            for corner in corners:
+                vertex.add_data3(*corner)
+                normal.add_data3(*n)
+
+            start = (i * 2 + j) * 3
+            tris.add_vertices(start, start + 1, start + 2)
+
+    geom = Geom(vdata)
+    geom.add_primitive(tris)
+    node = GeomNode("Rock")
+    node.add_geom(geom)
+    return NodePath(node)
+
+
+# Classes
+# =======
+class VegetationType(object):
+    def __init__(self, index, node, layers, capacity, expected, scale_range, num_blocks):
+        self.index = index
+        self.node = node
+        self.layers = layers
+        self.capacity = capacity
+        self.expected = expected
+        self.scale_range = scale_range
+
+        # Each instance takes 2 texels. The first one stores its position and scale, and the second one the x and
+        # y of the terrain normal, its heading and its rank within its block.
+        num_slots = capacity * num_blocks
+        name = node.get_name()
+        self.data = np.zeros((num_slots, 2, 4), np.float32)
+        self.counts = np.zeros(num_blocks, int)
+        self.data_tex = Texture("{}Instances".format(name))
+        self.data_tex.setup_buffer_texture(num_slots * 2, Texture.T_float, Texture.F_rgba32, GeomEnums.UH_static)
+
+        # The slots of the visible instances are uploaded whenever they change
+        self.indices = np.zeros(num_slots, np.int32)
+        self.visible_counts = None
+        self.index_tex = Texture("{}Indices".format(name))
+        self.index_tex.setup_buffer_texture(num_slots, Texture.T_int, Texture.F_r32i, GeomEnums.UH_dynamic)
+
+
+class VegetationScatter(object):
+    shaders = {}
+
+    def __init__(self, sampler, mask, focal_point, block_size=32, fade_start=64.0, fade_end=160.0,
+        min_height=-np.inf, seed=0, clip_mode=WaterPlane.CM_clip_plane):
+        # Oblique clipping of the water cameras needs a variant of the shader without clip planes
+        if clip_mode not in VegetationScatter.shaders:
+            VegetationScatter.shaders[clip_mode] = load_shader(
+                "shaders/Vegetation.vert.glsl",
+                "shaders/Vegetation.frag.glsl",
+                clip_mode
+            )
+
+        self.sampler = sampler
+        self.focal_point = focal_point
+        self.block_size = block_size
+        self.fade_start = fade_start
+        self.fade_end = fade_end
+        self.min_height = min_height
+        self.seed = seed
+        self.types = []
+        self.cameras = []
+
+        # Instances are scattered and culled in blocks of the heightfield. With the same block size as
+        # GeoMipTerrain, they line up with the blocks of the terrain.
+        self.num_blocks = (
+            (sampler.x_size - 1) // block_size,
+            (sampler.y_size - 1) // block_size
+        )
+        y, x = np.mgrid[:self.num_blocks[1], :self.num_blocks[0]]
+        self.block_x = x.ravel()
+        self.block_y = y.ravel()
+
+        # The mask doesn't need to have the same size as the heightfield, so heightfield coordinates are scaled
+        # to the mask
+        self.mask = load_splat_mask(mask) if not isinstance(mask, np.ndarray) else mask
+        self.mask_scale = (
+            (self.mask.shape[1] - 1) / (sampler.x_size - 1),
+            (self.mask.shape[0] - 1) / (sampler.y_size - 1)
+        )
+
+        # The bounding box of each block covers its terrain, grown by the size of the largest instance, since
+        # instances near the edge of a block reach into the next one
+        self.min_z, self.max_z = [ranges.ravel() for ranges in get_height_ranges(sampler.heights, block_size)]
+        self.max_instance_size = 0.0
+
+        # All vegetation shares the same shader. The instanced nodes are culled by the blocks, so Panda3D
+        # shouldn't cull them.
+        self.root = NodePath("Vegetation")
+        self.root.set_shader(self.shaders[clip_mode])
+        self.root.set_shader_input("focalPos", self.focal_point.get_pos(base.render))
+        self.root.set_shader_input("fadeRange", Vec2(fade_start, fade_end))
+
+        # Initialize stats
+        self.instance_count = 0
+        self.update_count = 0
+        self.update_time = 0.0
+        self.total_instance_count = 0
+
+    def add_type(self, name, model, layers, density, scale_range=(1.0, 1.0), alignment=0.0):
+        # Add a type of vegetation that grows on the given splat layers, with the given number of instances per
+        # square unit where the layers are fully visible. Each block has room for a fixed number of instances,
+        # so that the instances of a block can be scattered again without moving the other blocks.
+        area = self.block_size * self.block_size * self.sampler.scale.x * self.sampler.scale.y
+        expected = density * area
+        capacity = max(int(math.ceil(expected)), 1)
+
+        # All instances of the type are drawn with a single instanced draw of the model
+        node = GeomNode(name)
+        node.add_geoms_from(model.node())
+        node.set_bounds(OmniBoundingVolume())
+        node.set_final(True)
+        veg = VegetationType(len(self.types), self.root.attach_new_node(node), layers, capacity, expected,
+            scale_range, len(self.block_x))
+        veg.node.set_shader_input("instanceData", veg.data_tex)
+        veg.node.set_shader_input("instanceIndices", veg.index_tex)
+        veg.node.set_shader_input("alignment", float(alignment))
+        veg.node.set_instance_count(0)
+
+        bounds = np.abs(np.array(model.get_tight_bounds()))
+        self.max_instance_size = max(self.max_instance_size, float(bounds.max()) * scale_range[1])
+        self.types.append(veg)
+
+        for block in range(len(self.block_x)):
+            self.scatter_block(veg, block)
+
+        veg.data_tex.set_ram_image(veg.data)
+        return veg.node
+
+    def sample_mask(self, x, y):
+        # Blend the 4 pixels of the mask around each position, like the terrain shader does when it samples the
+        # mask
+        height, width = self.mask.shape[:2]
+        fx = np.clip(x * self.mask_scale[0], 0, width - 1)
+        fy = np.clip(y * self.mask_scale[1], 0, height - 1)
+        x0 = np.minimum(fx.astype(int), width - 2)
+        y0 = np.minimum(fy.astype(int), height - 2)
+        tx = (fx - x0)[:, None]
+        ty = (fy - y0)[:, None]
+        bottom = self.mask[y0, x0] + (self.mask[y0, x0 + 1] - self.mask[y0, x0]) * tx
+        top = self.mask[y0 + 1, x0] + (self.mask[y0 + 1, x0 + 1] - self.mask[y0 + 1, x0]) * tx
+        return bottom + (top - bottom) * ty
+
+    def scatter_block(self, veg, block):
+        # Each block draws its random numbers from its own generator, so it gets the same candidates every time it
+        # is scattered
+        rng = np.random.default_rng((self.seed, veg.index, int(self.block_x[block]), int(self.block_y[block])))
+        n = veg.capacity
+        x = (self.block_x[block] + rng.random(n)) * self.block_size
+        y = (self.block_y[block] + rng.random(n)) * self.block_size
+        roll = rng.random(n)
+        scale = rng.uniform(veg.scale_range[0], veg.scale_range[1], n)
+        heading = rng.uniform(0, math.pi * 2, n)
+
+        # Keep each candidate with the probability that the selected layers are visible at its position. Layers
+        # are selected with the same bits as in the splat layer culler.
+        weights = get_layer_weights(self.sample_mask(x, y))
+        weight = sum(weights[:, layer] for layer in range(4) if veg.layers & (1 << layer))
+        wx = self.sampler.pos.x + x * self.sampler.scale.x
+        wy = self.sampler.pos.y + y * self.sampler.scale.y
+        heights, normals = self.sampler.get_surface(wx, wy)
+        keep = (roll * n < weight * veg.expected) & (heights >= self.min_height)
+        count = int(np.count_nonzero(keep))
+
+        # The candidates are in random order already, so the instances that are kept at lower densities are
+        # spread evenly across the block
+        start = block * n
+        data = veg.data[start:start + n]
+        data[:] = 0
+        data[:count, 0] = np.stack([wx[keep], wy[keep], heights[keep], scale[keep]], axis=1)
+        data[:count, 1] = np.stack([
+            normals[keep, 0],
+            normals[keep, 1],
+            heading[keep],
+            np.arange(count) / max(count, 1)
+        ], axis=1)
+        veg.counts[block] = count
+
+    def update_region(self, x0, y0, x1, y1, mask=None):
+        # Scatter the blocks that contain the given columns and rows of the heightfield again, after the heights
+        # or the mask have changed there. A changed region of the mask is given at the size of the heightfield.
+        if mask is not None and self.mask_scale == (1, 1):
+            self.mask[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]] = mask
+
+        mx0 = max((x0 - 1) // self.block_size, 0)
+        my0 = max((y0 - 1) // self.block_size, 0)
+        mx1 = min((x1 - 1) // self.block_size + 1, self.num_blocks[0])
+        my1 = min((y1 - 1) // self.block_size + 1, self.num_blocks[1])
+        min_z, max_z = get_height_ranges(
+            self.sampler.heights[my0 * self.block_size:my1 * self.block_size + 1,
+                mx0 * self.block_size:mx1 * self.block_size + 1],
+            self.block_size
+        )
+
+        for my in range(my0, my1):
+            for mx in range(mx0, mx1):
+                block = my * self.num_blocks[0] + mx
+                self.min_z[block] = min_z[my - my0, mx - mx0]
+                self.max_z[block] = max_z[my - my0, mx - mx0]
+
+                for veg in self.types:
+                    self.scatter_block(veg, block)
+
+        for veg in self.types:
+            veg.data_tex.set_ram_image(veg.data)
+            veg.visible_counts = None
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_vegetation", sort=-2)
+
+    def stop(self):
+        base.task_mgr.remove("update_vegetation")
+
+    def add_camera(self, camera):
+        # Blocks are culled against the frustums of all cameras that render the vegetation
+        self.cameras.append(camera)
+
+    def get_block_densities(self, focal_pos):
+        # Calculate the bounding box of each block in world space
+        pos = self.sampler.pos
+        scale = self.sampler.scale
+        size = self.max_instance_size
+        min_x = pos.x + self.block_x * self.block_size * scale.x - size
+        min_y = pos.y + self.block_y * self.block_size * scale.y - size
+        max_x = min_x + self.block_size * scale.x + size * 2
+        max_y = min_y + self.block_size * scale.y + size * 2
+        min_z = self.min_z - size
+        max_z = self.max_z + size
+
+        # The density falls off with the distance from the focal point. Each block is drawn with the density of
+        # its closest point, and the vertex shader thins out the instances further away.
+        dx = np.maximum(np.maximum(min_x - focal_pos.x, focal_pos.x - max_x), 0)
+        dy = np.maximum(np.maximum(min_y - focal_pos.y, focal_pos.y - max_y), 0)
+        dz = np.maximum(np.maximum(min_z - focal_pos.z, focal_pos.z - max_z), 0)
+        dist = np.sqrt(dx * dx + dy * dy + dz * dz)
+        density = np.clip((self.fade_end - dist) / (self.fade_end - self.fade_start), 0, 1)
+
+        # Cull the blocks that are outside of all camera frustums. A box is outside of a plane if the corner that
+        # is furthest along the normal of the plane is behind it.
+        if self.cameras:
+            visible = np.zeros(len(density), bool)
+
+            for frustum in [get_frustum_planes(camera) for camera in self.cameras]:
+                inside = np.ones(len(density), bool)
+
+                for a, b, c, d in frustum:
+                    inside &= (
+                        np.where(a >= 0, max_x, min_x) * a
+                        + np.where(b >= 0, max_y, min_y) * b
+                        + np.where(c >= 0, max_z, min_z) * c + d
+                    ) >= 0
+
+                visible |= inside
+
+            density[~visible] = 0
+
+        return density
+
+    def update(self, task):
+        start = time.perf_counter()
+        focal_pos = self.focal_point.get_pos(base.render)
+        density = self.get_block_densities(focal_pos)
+        self.instance_count = 0
+
+        for veg in self.types:
+            # Each visible block draws the instances at the start of its slots, up to its density. The slots are
+            # only uploaded again when the number of instances of a block changes.
+            counts = np.ceil(veg.counts * density).astype(int)
+
+            if veg.visible_counts is None or not np.array_equal(counts, veg.visible_counts):
+                blocks = np.flatnonzero(counts)
+                ids, slots = expand_ranges(blocks * veg.capacity, counts[blocks])
+                veg.indices[:len(slots)] = slots
+                veg.index_tex.set_ram_image(veg.indices)
+                veg.node.set_instance_count(len(slots))
+                veg.visible_counts = counts
+
+            self.instance_count += int(veg.visible_counts.sum())
+
+        self.root.set_shader_input("focalPos", focal_pos)
+
+        self.update_time += time.perf_counter() - start
+        self.update_count += 1
+        self.total_instance_count += self.instance_count
+        return task.cont
+
+    def get_average_update_time(self):
+        return self.update_time / self.update_count if self.update_count > 0 else 0.0
+
+    def get_average_instance_count(self):
+        return self.total_instance_count / self.update_count if self.update_count > 0 else 0.0
+
+    def get_scattered_count(self):
+        return sum(int(veg.counts.sum()) for veg in self.types)
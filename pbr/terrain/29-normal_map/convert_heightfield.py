@@ -0,0 +1,23 @@
+import argparse
+
+from heightfield import RawHeightfield
+
+
+# Functions
+# =========
+def main():
+    # Parse command line
+    parser = argparse.ArgumentParser(description="Convert a heightfield image into a raw heightfield.")
+    parser.add_argument("input", help="heightfield image")
+    parser.add_argument("output", help="raw heightfield, usually with the extension " + RawHeightfield.extension)
+    parser.add_argument("--format", choices=RawHeightfield.formats, default=RawHeightfield.F_uint16,
+        help="format of the heights")
+    args = parser.parse_args()
+
+    RawHeightfield.convert(args.input, args.output, args.format)
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    main()
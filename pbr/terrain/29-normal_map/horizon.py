@@ -0,0 +1,193 @@
+import time
+
+import numpy as np
+from panda3d.core import NodePath
+
+from heightfield import load_heightfield
+
+
+# Functions
+# =========
+def get_height_ranges(heights, cell_size):
+    # Calculate the lowest and highest point of each cell. Each cell also includes the vertices along its edges,
+    # which it shares with the next cell, so the height range of each quad is found first.
+    num_cells = ((heights.shape[1] - 1) // cell_size, (heights.shape[0] - 1) // cell_size)
+    heights = heights[:num_cells[1] * cell_size + 1, :num_cells[0] * cell_size + 1]
+    quad_min = np.minimum(np.minimum(heights[:-1, :-1], heights[1:, :-1]), np.minimum(heights[:-1, 1:],
+        heights[1:, 1:]))
+    quad_max = np.maximum(np.maximum(heights[:-1, :-1], heights[1:, :-1]), np.maximum(heights[:-1, 1:],
+        heights[1:, 1:]))
+    shape = (num_cells[1], cell_size, num_cells[0], cell_size)
+    return quad_min.reshape(shape).min(axis=(1, 3)), quad_max.reshape(shape).max(axis=(1, 3))
+
+
+def get_cell_rects(num_cells, cell_size):
+    # Calculate the corners of each cell in terrain space, in the same order as the height ranges
+    y, x = np.mgrid[:num_cells[1], :num_cells[0]] * float(cell_size)
+    return x.ravel(), y.ravel(), x.ravel() + cell_size, y.ravel() + cell_size
+
+
+def get_rect_bounds(rects, pos):
+    # Calculate the nearest and farthest distance from the given position to each rectangle, and the range of
+    # angles it covers as seen from there. A rectangle that contains the position has a nearest distance of 0.
+    x0, y0, x1, y1 = rects
+    dx = np.maximum(np.maximum(x0 - pos[0], pos[0] - x1), 0)
+    dy = np.maximum(np.maximum(y0 - pos[1], pos[1] - y1), 0)
+    min_dist = np.hypot(dx, dy)
+    max_dist = np.hypot(np.maximum(np.abs(x0 - pos[0]), np.abs(x1 - pos[0])),
+        np.maximum(np.abs(y0 - pos[1]), np.abs(y1 - pos[1])))
+
+    # The angles of the corners are measured from the center of the rectangle, so that the range of angles
+    # doesn't break where the angles wrap around
+    center = np.arctan2((y0 + y1) / 2 - pos[1], (x0 + x1) / 2 - pos[0])
+    corners = np.arctan2(np.stack((y0, y0, y1, y1)) - pos[1], np.stack((x0, x1, x0, x1)) - pos[0])
+    offsets = (corners - center + np.pi) % (np.pi * 2) - np.pi
+    return min_dist, max_dist, center + offsets.min(axis=0), center + offsets.max(axis=0)
+
+
+def expand_ranges(first, count):
+    # Expand each range of bins into one entry per bin. Returns the index of the range each entry belongs to
+    # and the bin of the entry.
+    ids = np.repeat(np.arange(len(first)), count)
+    steps = np.arange(len(ids)) - np.repeat(np.cumsum(count) - count, count)
+    return ids, first[ids] + steps
+
+
+# Classes
+# =======
+class HorizonCuller(object):
+    def __init__(self, terrain, focal_point, num_bins=512, occluder_size=4, ring_size=16.0):
+        block_size = terrain.get_block_size()
+
+        if block_size % occluder_size != 0:
+            raise ValueError("Block size must be a multiple of the occluder size")
+
+        self.terrain = terrain
+        self.focal_point = focal_point
+        self.block_size = block_size
+        self.occluder_size = occluder_size
+        self.num_bins = num_bins
+        self.ring_size = ring_size
+
+        # The highest point of each block decides if it can be hidden. The terrain in front of it is split into
+        # smaller occluder cells, which can only be trusted to be as high as their lowest point.
+        heightfield = terrain.heightfield()
+        heights = load_heightfield(heightfield)
+        self.num_blocks = (
+            (heightfield.get_x_size() - 1) // block_size,
+            (heightfield.get_y_size() - 1) // block_size
+        )
+        num_cells = (self.num_blocks[0] * block_size // occluder_size,
+            self.num_blocks[1] * block_size // occluder_size)
+        self.max_heights = get_height_ranges(heights, block_size)[1]
+        self.min_heights = np.ascontiguousarray(get_height_ranges(heights, occluder_size)[0][:num_cells[1],
+            :num_cells[0]])
+        self.block_rects = get_cell_rects(self.num_blocks, block_size)
+        self.cell_rects = get_cell_rects(num_cells, occluder_size)
+        self.visible = np.ones((self.num_blocks[1], self.num_blocks[0]), bool)
+
+        # Initialize stats
+        self.blocks_culled = 0
+        self.update_count = 0
+        self.update_time = 0.0
+        self.total_blocks_culled = 0
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_terrain_horizon", sort=-3)
+
+    def stop(self):
+        base.task_mgr.remove("update_terrain_horizon")
+
+        # Show all blocks again
+        self.apply(np.ones_like(self.visible))
+
+    def update_heights(self, heights, x0, y0, x1, y1):
+        # Update the height ranges of the blocks and occluder cells that contain the given columns and rows of the
+        # heightfield. A pixel on the edge of a cell is shared with the next cell, so both are updated.
+        for ranges, index, cell_size in ((self.max_heights, 1, self.block_size),
+            (self.min_heights, 0, self.occluder_size)):
+            cx0 = max((x0 - 1) // cell_size, 0)
+            cy0 = max((y0 - 1) // cell_size, 0)
+            cx1 = min((x1 - 1) // cell_size + 1, ranges.shape[1])
+            cy1 = min((y1 - 1) // cell_size + 1, ranges.shape[0])
+            ranges[cy0:cy1, cx0:cx1] = get_height_ranges(
+                heights[cy0 * cell_size:cy1 * cell_size + 1, cx0 * cell_size:cx1 * cell_size + 1],
+                cell_size
+            )[index]
+
+    def get_horizon(self, pos):
+        # Each occluder cell is at least as high as its lowest point, so its lowest possible slope as seen from
+        # the focal point is a conservative horizon for all directions that pass through it. Cells that contain
+        # the focal point have no horizon.
+        min_dist, max_dist, first, last = get_rect_bounds(self.cell_rects, pos)
+        rise = self.min_heights.ravel() - pos[2]
+        cells = min_dist > 0
+        slopes = rise[cells] / np.where(rise[cells] >= 0, max_dist[cells], min_dist[cells])
+
+        # Only bins that the cell covers completely get its horizon
+        bin_size = np.pi * 2 / self.num_bins
+        first_bin = np.ceil(first[cells] / bin_size).astype(int)
+        count = np.maximum(np.floor(last[cells] / bin_size).astype(int) - first_bin, 0)
+        ids, bins = expand_ranges(first_bin, count)
+
+        # The horizon is split into rings by distance, and each ring includes all cells in front of it. A block
+        # may only be hidden by cells that are closer than its nearest point.
+        rings = (max_dist[cells] // self.ring_size).astype(int)
+        horizon = np.full((rings.max() + 1 if len(rings) > 0 else 1, self.num_bins), -np.inf)
+        np.maximum.at(horizon, (rings[ids], bins % self.num_bins), slopes[ids])
+        return np.maximum.accumulate(horizon, axis=0)
+
+    def get_visible_blocks(self, pos):
+        horizon = self.get_horizon(pos)
+
+        # Each block is at most as high as its highest point, so its highest possible slope must be below the
+        # horizon in every direction it covers to be hidden
+        min_dist, max_dist, first, last = get_rect_bounds(self.block_rects, pos)
+        rings = np.minimum((min_dist // self.ring_size).astype(int) - 1, len(horizon) - 1)
+        blocks = (min_dist > 0) & (rings >= 0)
+        rise = self.max_heights.ravel()[blocks] - pos[2]
+        slopes = rise / np.where(rise >= 0, min_dist[blocks], max_dist[blocks])
+
+        bin_size = np.pi * 2 / self.num_bins
+        first_bin = np.floor(first[blocks] / bin_size).astype(int)
+        count = np.floor(last[blocks] / bin_size).astype(int) - first_bin + 1
+        ids, bins = expand_ranges(first_bin, count)
+        visible = np.ones(len(min_dist), bool)
+
+        if len(ids) > 0:
+            starts = np.cumsum(count) - count
+            lowest = np.minimum.reduceat(horizon[rings[blocks][ids], bins % self.num_bins], starts)
+            visible[blocks] = slopes >= lowest
+
+        return visible.reshape(self.visible.shape)
+
+    def apply(self, visible):
+        # Only the blocks whose visibility changed are updated. GeoMipTerrain keeps the draw mask of a block when
+        # it rebuilds it.
+        for my, mx in np.argwhere(visible != self.visible):
+            block = NodePath(self.terrain.get_block_node_path(int(mx), int(my)).node())
+
+            if visible[my, mx]:
+                block.show()
+
+            else:
+                block.hide()
+
+        self.visible = visible
+
+    def update(self, task):
+        # Hide the blocks that are below the horizon as seen from the focal point
+        start = time.perf_counter()
+        self.apply(self.get_visible_blocks(self.focal_point.get_pos(self.terrain.get_root())))
+
+        self.blocks_culled = int(self.visible.size - np.count_nonzero(self.visible))
+        self.update_count += 1
+        self.update_time += time.perf_counter() - start
+        self.total_blocks_culled += self.blocks_culled
+        return task.cont
+
+    def get_average_update_time(self):
+        return self.update_time / self.update_count if self.update_count > 0 else 0.0
+
+    def get_average_blocks_culled(self):
+        return self.total_blocks_culled / self.update_count if self.update_count > 0 else 0.0
@@ -0,0 +1,224 @@
+import numpy as np
+
+from horizon import get_height_ranges
+
+
+# Functions
+# =========
+def get_max_pyramid(quad_max):
+    # Build the levels of a quadtree of the highest points of the heightfield. Each level halves the cells of the
+    # previous one, and cells that reach past the edge of the heightfield are only as high as the part inside it.
+    levels = [quad_max]
+
+    while levels[-1].shape != (1, 1):
+        level = levels[-1]
+        padded = np.full(((level.shape[0] + 1) // 2 * 2, (level.shape[1] + 1) // 2 * 2), -np.inf, np.float32)
+        padded[:level.shape[0], :level.shape[1]] = level
+        levels.append(padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3)))
+
+    return levels
+
+
+def solve_cell(heights, x_size, index, u, v, z, dx, dy, dz, length):
+    # Intersect each ray with the surface of its cell, which is blended from its 4 corners just like the height
+    # queries of the sampler. Along the ray, the height of the surface is a quadratic function of the distance
+    # s from the point (u, v, z) where the ray enters the cell, so the hit is the smallest root of
+    # a * s^2 + b * s + c = 0 that lies within the given length.
+    h00 = heights[index]
+    h10 = heights[index + 1]
+    h01 = heights[index + x_size]
+    h11 = heights[index + x_size + 1]
+    ex = h10 - h00
+    ey = h01 - h00
+    k = h00 - h10 - h01 + h11
+    a = -k * dx * dy
+    b = dz - (ex * dx + ey * dy + k * (u * dy + v * dx))
+    c = z - (h00 + ex * u + ey * v + k * u * v)
+
+    # Rays that enter the cell below its surface hit it right away. The roots are calculated in a form that
+    # doesn't lose precision when a is tiny, and a of 0 leaves a single root.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        disc = b * b - 4 * a * c
+        q = -.5 * (b + np.copysign(np.sqrt(np.maximum(disc, 0)), b))
+        roots = np.stack((
+            np.where(a != 0, q / a, np.inf),
+            np.where(q != 0, c / q, np.inf)
+        ))
+
+    roots[:, disc < 0] = np.inf
+    roots[(roots < 0) | (roots > length) | np.isnan(roots)] = np.inf
+    return np.where(c <= 0, 0, roots.min(axis=0))
+
+
+# Classes
+# =======
+class HeightfieldRaycaster(object):
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+        # The quadtree stores the highest point of each cell, so a ray can skip any cell that it passes above
+        self.levels = get_max_pyramid(get_height_ranges(sampler.heights, 1)[1])
+        self.min_height = float(sampler.heights.min())
+        self.update_offsets()
+
+    def update_offsets(self):
+        # All levels are searched through a single flat array
+        self.level_widths = np.array([level.shape[1] for level in self.levels])
+        self.level_heights = np.array([level.shape[0] for level in self.levels])
+        self.offsets = np.cumsum([0] + [level.size for level in self.levels[:-1]])
+        self.max_heights = np.concatenate([level.ravel() for level in self.levels])
+
+    def update_heights(self, x0, y0, x1, y1):
+        # Update the cells that contain the given columns and rows of the heightfield after the heights of the
+        # sampler have changed there. A pixel on the edge of a cell is shared with the next cell, so both are
+        # updated, along with the cells above them in the quadtree.
+        cx0 = max(x0 - 1, 0)
+        cy0 = max(y0 - 1, 0)
+        cx1 = min(x1, self.levels[0].shape[1])
+        cy1 = min(y1, self.levels[0].shape[0])
+        min_heights, max_heights = get_height_ranges(self.sampler.heights[cy0:cy1 + 1, cx0:cx1 + 1], 1)
+        self.levels[0][cy0:cy1, cx0:cx1] = max_heights
+        self.min_height = min(self.min_height, float(min_heights.min()))
+
+        for i in range(1, len(self.levels)):
+            cx0 //= 2
+            cy0 //= 2
+            cx1 = (cx1 + 1) // 2
+            cy1 = (cy1 + 1) // 2
+            region = self.levels[i - 1][cy0 * 2:cy1 * 2, cx0 * 2:cx1 * 2]
+            padded = np.full(((cy1 - cy0) * 2, (cx1 - cx0) * 2), -np.inf, np.float32)
+            padded[:region.shape[0], :region.shape[1]] = region
+            self.levels[i][cy0:cy1, cx0:cx1] = padded.reshape(cy1 - cy0, 2, cx1 - cx0, 2).max(axis=(1, 3))
+
+        self.update_offsets()
+
+    def intersect(self, origins, directions, max_t=np.inf):
+        # Find the first point where each ray hits the terrain, as a multiple of its direction. Rays that miss
+        # the terrain, or only hit it beyond the given maximum, return infinity. The rays can be arrays of any
+        # shape, as long as the last axis holds the 3 components of each vector.
+        origins = np.asarray(origins, np.float64)
+        directions = np.asarray(directions, np.float64)
+        shape = np.broadcast(origins[..., 0], directions[..., 0]).shape
+        origins = np.broadcast_to(origins, shape + (3,)).reshape(-1, 3)
+        directions = np.broadcast_to(directions, shape + (3,)).reshape(-1, 3)
+        max_t = np.broadcast_to(np.asarray(max_t, np.float64), shape).ravel()
+
+        # The rays are traced in heightfield coordinates, with world space heights. The transform of the
+        # terrain root only scales and moves the heightfield, so the distance along each ray stays the same.
+        sampler = self.sampler
+        ox = (origins[:, 0] - sampler.pos.x) / sampler.scale.x
+        oy = (origins[:, 1] - sampler.pos.y) / sampler.scale.y
+        oz = origins[:, 2]
+        dx = directions[:, 0] / sampler.scale.x
+        dy = directions[:, 1] / sampler.scale.y
+        dz = directions[:, 2]
+
+        # Clip each ray to the heightfield, and to the heights where it can hit the terrain. A ray is below the
+        # terrain everywhere once it passes the lowest point, so every ray that has a direction ends somewhere.
+        x_size = sampler.x_size
+        start = np.zeros(len(ox))
+        end = max_t.copy()
+        max_height = self.levels[-1][0, 0]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for o, d, high in ((ox, dx, x_size - 1), (oy, dy, sampler.y_size - 1)):
+                t0 = -o / d
+                t1 = (high - o) / d
+                inside = (o >= 0) & (o <= high)
+                start = np.maximum(start, np.where(d != 0, np.minimum(t0, t1), np.where(inside, -np.inf, np.inf)))
+                end = np.minimum(end, np.where(d != 0, np.maximum(t0, t1), np.where(inside, np.inf, -np.inf)))
+
+            t_top = (max_height - oz) / dz
+            t_bottom = (self.min_height - 1 - oz) / dz
+            start = np.maximum(start, np.where(dz < 0, t_top, np.where(oz > max_height, np.inf, -np.inf)))
+            end = np.minimum(end, np.where(dz > 0, t_top, np.where(dz < 0, np.maximum(t_bottom, start), np.inf)))
+
+            # Crossing a cell boundary always moves a ray a tiny bit past it, so that it ends up in the next cell
+            nudge = 1e-7 / np.maximum(np.abs(dx), np.abs(dy))
+
+        # Each ray starts at the top of the quadtree. It moves down a level whenever it might hit something in its
+        # cell, and skips the cells it passes above. All rays are stepped at once, and the ones that are finished
+        # are dropped.
+        hits = np.full(len(ox), np.inf)
+        top_level = len(self.levels) - 1
+        rays = np.flatnonzero((start <= end) & np.isfinite(end))
+        ox, oy, oz, dx, dy, dz, end, nudge = [values[rays] for values in (ox, oy, oz, dx, dy, dz, end, nudge)]
+        t = start[rays]
+        level = np.full(len(rays), top_level)
+        heights = sampler.heights.ravel()
+
+        while len(rays) > 0:
+            rx = ox + dx * t
+            ry = oy + dy * t
+            cell_size = 2.0 ** level
+            cx = np.minimum(np.floor(np.maximum(rx, 0) / cell_size), self.level_widths[level] - 1)
+            cy = np.minimum(np.floor(np.maximum(ry, 0) / cell_size), self.level_heights[level] - 1)
+
+            # Find where the ray leaves its cell. Cells on the upper levels may reach past the heightfield.
+            with np.errstate(divide="ignore", invalid="ignore"):
+                exit_x = (np.where(dx > 0, np.minimum((cx + 1) * cell_size, x_size - 1), cx * cell_size) - ox) / dx
+                exit_y = (np.where(dy > 0, np.minimum((cy + 1) * cell_size, sampler.y_size - 1), cy * cell_size)
+                    - oy) / dy
+
+            exit_x[dx == 0] = np.inf
+            exit_y[dy == 0] = np.inf
+            t_exit = np.minimum(np.minimum(exit_x, exit_y), end)
+            z = oz + dz * t
+            below = np.minimum(z, oz + dz * t_exit) <= self.max_heights[
+                self.offsets[level] + cy.astype(np.intp) * self.level_widths[level] + cx.astype(np.intp)
+            ]
+
+            # The cells of the first level are intersected exactly
+            hit = np.full(len(rays), np.inf)
+            exact = below & (level == 0)
+
+            if exact.any():
+                hit[exact] = t[exact] + solve_cell(
+                    heights,
+                    x_size,
+                    (cy[exact] * x_size + cx[exact]).astype(np.intp),
+                    rx[exact] - cx[exact],
+                    ry[exact] - cy[exact],
+                    z[exact],
+                    dx[exact],
+                    dy[exact],
+                    dz[exact],
+                    t_exit[exact] - t[exact]
+                )
+
+            # A ray that skips a cell only moves up a level if the next cell has a different parent, since it
+            # would move right back down otherwise
+            skip = ~below | (exact & np.isinf(hit))
+            leaves_parent = np.where(exit_x <= exit_y, np.where(dx > 0, cx % 2 == 1, cx % 2 == 0),
+                np.where(dy > 0, cy % 2 == 1, cy % 2 == 0))
+            t = np.where(skip, t_exit + nudge, t)
+            level = np.where(skip, np.minimum(level + leaves_parent, top_level), np.where(below, level - 1, level))
+
+            # Rays that hit something or leave the box are finished
+            found = np.isfinite(hit)
+            hits[rays[found]] = hit[found]
+            active = ~found & (t <= end)
+
+            if not active.all():
+                rays, ox, oy, oz, dx, dy, dz, end, nudge, t, level = [
+                    values[active] for values in (rays, ox, oy, oz, dx, dy, dz, end, nudge, t, level)
+                ]
+
+        return hits.reshape(shape)
+
+    def cast_rays(self, origins, directions, max_distance=np.inf):
+        # Cast rays from the given world space origins in the given directions. Returns the hit positions and the
+        # normals of the terrain there. Rays that miss the terrain within the given distance have no hit.
+        directions = np.asarray(directions, np.float64)
+        directions = directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+        t = self.intersect(origins, directions, max_distance)
+        hit = np.isfinite(t)
+        positions = np.asarray(origins, np.float64) + directions * np.where(hit, t, np.nan)[..., None]
+        normals = np.full(positions.shape, np.nan, np.float32)
+        normals[hit] = self.sampler.get_normal(positions[hit, 0], positions[hit, 1])
+        return positions, normals
+
+    def has_line_of_sight(self, starts, ends):
+        # Check if the terrain is out of the way between each pair of world space points
+        starts = np.asarray(starts, np.float64)
+        return ~np.isfinite(self.intersect(starts, np.asarray(ends, np.float64) - starts, 1.0))
@@ -0,0 +1,162 @@
+import math
+import time
+
+import numpy as np
+from panda3d.core import (
+    ClockObject,
+    SamplerState,
+    Texture
+)
+
+
+# Classes
+# =======
+class RippleSimulation(object):
+    def __init__(self, resolution=256, size=512.0, tick_rate=60.0, wave_speed=8.0, damping=.99,
+        drop_radius=2, max_ticks_per_frame=4):
+        self.resolution = resolution
+        self.cell_size = size / resolution
+        self.tick_rate = tick_rate
+        self.tick_length = 1 / tick_rate
+        self.damping = damping
+        self.max_ticks_per_frame = max_ticks_per_frame
+
+        # The squared Courant number tells the solver how far a wave travels per tick. The solver is only stable
+        # if a wave travels less than about 0.7 cells per tick.
+        self.courant = (wave_speed * self.tick_length / self.cell_size) ** 2
+
+        if self.courant > .5:
+            raise ValueError("Ripple wave speed is too high for the given tick rate and resolution")
+
+        # Allocate all arrays up front, so that ticking the simulation never allocates memory. The solver
+        # alternates between 2 height buffers: the current heights and the previous heights, which are
+        # overwritten by the next heights each tick.
+        self.height = np.zeros((resolution, resolution), np.float32)
+        self.prev_height = np.zeros((resolution, resolution), np.float32)
+        self.laplacian = np.zeros((resolution - 2, resolution - 2), np.float32)
+
+        # Panda3D stores texels in BGRA order. The red and green channels hold the negated slope of the
+        # surface along X and Y and the blue channel holds the height.
+        self.ripple_map = np.zeros((resolution, resolution, 4), np.float32)
+
+        # Precalculate a smooth bump for the drops and a scratch array to scale it
+        d = np.arange(-drop_radius, drop_radius + 1, dtype=np.float32)
+        dist = np.sqrt(d[None, :] ** 2 + d[:, None] ** 2) / (drop_radius + 1)
+        self.drop_radius = drop_radius
+        self.drop_kernel = (np.cos(np.minimum(dist, 1) * math.pi) * .5 + .5).astype(np.float32)
+        self.drop_scratch = np.zeros_like(self.drop_kernel)
+        self.drops = []
+
+        # Create ripple texture
+        self.ripple_tex = Texture("Ripples")
+        self.ripple_tex.setup_2d_texture(resolution, resolution, Texture.T_float, Texture.F_rgba32)
+        self.ripple_tex.wrap_u = SamplerState.WM_clamp
+        self.ripple_tex.wrap_v = SamplerState.WM_clamp
+        self.ripple_tex.minfilter = SamplerState.FT_linear
+        self.ripple_tex.magfilter = SamplerState.FT_linear
+        self.ripple_tex.set_ram_image(self.ripple_map)
+
+        # Initialize stats
+        self.accumulator = 0.0
+        self.tick_count = 0
+        self.tick_time = 0.0
+        self.skipped_ticks = 0
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_ripples", sort=-10)
+
+    def stop(self):
+        base.task_mgr.remove("update_ripples")
+
+    def disturb(self, u, v, strength):
+        # Queue a drop at the given texture coordinates. Drops are applied at the start of the next tick.
+        self.drops.append((u, v, strength))
+
+    def apply_drops(self):
+        r = self.drop_radius
+        n = self.resolution
+
+        for u, v, strength in self.drops:
+            # Find the part of the drop that is inside the simulation. The outermost cells stay at rest. The drop
+            # is subtracted from both height buffers, so it pushes the water down without giving it a velocity.
+            cx = int(u * n)
+            cy = int(v * n)
+            x0 = max(cx - r, 1)
+            x1 = min(cx + r + 1, n - 1)
+            y0 = max(cy - r, 1)
+            y1 = min(cy + r + 1, n - 1)
+
+            if x0 >= x1 or y0 >= y1:
+                continue
+
+            kernel = self.drop_scratch[y0 - cy + r:y1 - cy + r, x0 - cx + r:x1 - cx + r]
+            np.multiply(self.drop_kernel[y0 - cy + r:y1 - cy + r, x0 - cx + r:x1 - cx + r], strength, out=kernel)
+            self.height[y0:y1, x0:x1] -= kernel
+            self.prev_height[y0:y1, x0:x1] -= kernel
+
+        self.drops.clear()
+
+    def tick(self):
+        self.apply_drops()
+        h = self.height
+        prev = self.prev_height
+        lap = self.laplacian
+
+        # Sum up the neighbors of the interior cells
+        np.add(h[:-2, 1:-1], h[2:, 1:-1], out=lap)
+        lap += h[1:-1, :-2]
+        lap += h[1:-1, 2:]
+
+        # Integrate the wave equation with the Verlet method:
+        #     next = 2 * height - prev + c^2 * (neighbors - 4 * height)
+        # The next heights are written over the previous heights, which are no longer needed. The outermost
+        # cells are never written, so they stay at rest.
+        inner = prev[1:-1, 1:-1]
+        lap *= self.courant
+        np.subtract(lap, inner, out=inner)
+        np.multiply(h[1:-1, 1:-1], 2 - 4 * self.courant, out=lap)
+        inner += lap
+        inner *= self.damping
+
+        # Swap the buffers
+        self.height, self.prev_height = prev, h
+
+    def update_ripple_map(self):
+        # Calculate the negated slopes with central differences
+        h = self.height
+        scale = -.5 / self.cell_size
+        np.subtract(h[1:-1, 2:], h[1:-1, :-2], out=self.ripple_map[1:-1, 1:-1, 2])
+        self.ripple_map[1:-1, 1:-1, 2] *= scale
+        np.subtract(h[2:, 1:-1], h[:-2, 1:-1], out=self.ripple_map[1:-1, 1:-1, 1])
+        self.ripple_map[1:-1, 1:-1, 1] *= scale
+        self.ripple_map[..., 0] = h
+
+    def update(self, task):
+        # Run the simulation at a fixed tick rate, no matter how fast the frames are rendered. If the frame
+        # rate drops too low, skip ticks instead of trying to catch up.
+        self.accumulator += ClockObject.get_global_clock().get_dt()
+        ticks = int(self.accumulator / self.tick_length)
+        self.accumulator -= ticks * self.tick_length
+
+        if ticks > self.max_ticks_per_frame:
+            self.skipped_ticks += ticks - self.max_ticks_per_frame
+            ticks = self.max_ticks_per_frame
+
+        if ticks == 0:
+            return task.cont
+
+        start = time.perf_counter()
+
+        for i in range(ticks):
+            self.tick()
+
+        self.update_ripple_map()
+        self.tick_time += time.perf_counter() - start
+        self.tick_count += ticks
+
+        # Upload the ripple map
+        self.ripple_tex.set_ram_image(self.ripple_map)
+        return task.cont
+
+    def get_average_tick_time(self):
+        return self.tick_time / self.tick_count if self.tick_count > 0 else 0.0
@@ -0,0 +1,45 @@
+#version 140
+
+in vec4 p3d_Vertex;
+
+// Terrain with a baked normal map has no vertex normals. Variants of this shader for it are created by defining
+// TERRAIN_NORMAL_MAP before the shader is compiled.
+#ifndef TERRAIN_NORMAL_MAP
+in vec3 p3d_Normal;
+#endif
+in vec3 p3d_MultiTexCoord0;
+
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat3 p3d_NormalMatrix;
+// The water cameras of oblique clipping mode are clipped by their near planes instead of clip planes. Variants
+// of this shader for it are created by defining WATER_OBLIQUE_CLIPPING before the shader is compiled.
+#ifndef WATER_OBLIQUE_CLIPPING
+uniform vec4 p3d_ClipPlane[1];
+#endif
+uniform vec2 tileUVOffset;
+uniform vec2 tileUVScale;
+
+out vec3 fragPos;
+#ifndef TERRAIN_NORMAL_MAP
+out vec3 normal;
+#endif
+out vec2 uv;
+
+
+void main() {
+    // Calculate vertex position, fragment position, and surface normal
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    fragPos = vec3(p3d_ModelViewMatrix * p3d_Vertex);
+#ifndef TERRAIN_NORMAL_MAP
+    normal = p3d_NormalMatrix * p3d_Normal;
+#endif
+
+    // Calculate UV. A terrain tile only covers part of the whole terrain, so its UV is moved into that part.
+    uv = tileUVOffset + p3d_MultiTexCoord0.xy * tileUVScale;
+
+#ifndef WATER_OBLIQUE_CLIPPING
+    // Calculate clip distance
+    gl_ClipDistance[0] = dot(vec4(fragPos, 1), p3d_ClipPlane[0]);
+#endif
+}
@@ -0,0 +1,59 @@
+#version 140
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec4 p3d_Color;
+
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat3 p3d_NormalMatrix;
+// The water cameras of oblique clipping mode are clipped by their near planes instead of clip planes. Variants
+// of this shader for it are created by defining WATER_OBLIQUE_CLIPPING before the shader is compiled.
+#ifndef WATER_OBLIQUE_CLIPPING
+uniform vec4 p3d_ClipPlane[1];
+#endif
+uniform samplerBuffer instanceData;
+uniform isamplerBuffer instanceIndices;
+uniform vec3 focalPos;
+uniform vec2 fadeRange;
+uniform float alignment;
+
+out vec3 fragPos;
+out vec3 normal;
+out vec4 vertexColor;
+
+// Fraction of the density over which an instance grows to its full size
+const float FADE_WIDTH = .1;
+
+
+void main() {
+    // Fetch the position, scale, terrain normal, heading, and rank of the instance
+    int index = texelFetch(instanceIndices, gl_InstanceID).r;
+    vec4 placement = texelFetch(instanceData, index * 2);
+    vec4 orientation = texelFetch(instanceData, index * 2 + 1);
+
+    // The density falls off with the distance from the focal point. Instances whose rank is above the density
+    // at their position are hidden, and they shrink before they disappear so that they don't pop.
+    float density = clamp((fadeRange.y - distance(placement.xyz, focalPos)) / (fadeRange.y - fadeRange.x), 0,
+        1);
+    float scale = placement.w * clamp((density - orientation.w) / FADE_WIDTH, 0, 1);
+
+    // Tilt the instance towards the terrain normal and turn it to its heading
+    vec3 terrainNormal = vec3(orientation.xy, sqrt(max(1 - dot(orientation.xy, orientation.xy), 0)));
+    vec3 up = normalize(mix(vec3(0, 0, 1), terrainNormal, alignment));
+    vec3 heading = vec3(cos(orientation.z), sin(orientation.z), 0);
+    vec3 right = normalize(heading - up * dot(heading, up));
+    mat3 rotation = mat3(right, cross(up, right), up);
+    vec4 vertex = vec4(placement.xyz + rotation * p3d_Vertex.xyz * scale, 1);
+
+    // Calculate vertex position, fragment position, and surface normal. Instances are placed in world space.
+    gl_Position = p3d_ModelViewProjectionMatrix * vertex;
+    fragPos = vec3(p3d_ModelViewMatrix * vertex);
+    normal = p3d_NormalMatrix * (rotation * p3d_Normal);
+    vertexColor = p3d_Color;
+
+#ifndef WATER_OBLIQUE_CLIPPING
+    // Calculate clip distance
+    gl_ClipDistance[0] = dot(vec4(fragPos, 1), p3d_ClipPlane[0]);
+#endif
+}
@@ -0,0 +1,268 @@
+import time
+
+import numpy as np
+from panda3d.core import (
+    Geom,
+    GeomEnums,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexData,
+    GeomVertexFormat,
+    GeomVertexWriter,
+    NodePath,
+    OmniBoundingVolume,
+    PTA_LVecBase2f,
+    SamplerState,
+    Texture,
+    Vec2
+)
+
+from water import load_shader, WaterPlane
+
+
+# Functions
+# =========
+def get_frustum_planes(camera):
+    # Extract the planes of the camera frustum in world space. Panda3D uses row vectors, so the planes are found
+    # in the columns of the matrix.
+    mat = base.render.get_mat(camera) * camera.node().get_lens().get_projection_mat()
+    m = np.array([[mat.get_cell(row, col) for col in range(4)] for row in range(4)])
+    return np.array([
+        m[:, 3] + m[:, 0],
+        m[:, 3] - m[:, 0],
+        m[:, 3] + m[:, 1],
+        m[:, 3] - m[:, 1],
+        m[:, 3] + m[:, 2],
+        m[:, 3] - m[:, 2]
+    ])
+
+
+# Classes
+# =======
+class GPUTerrain(object):
+    shaders = {}
+
+    def __init__(self, sampler, focal_point, patch_size=32, lod_distance=160.0, morph_start=.8,
+        clip_mode=WaterPlane.CM_clip_plane):
+        # The heightfield must be a square with a power of 2 plus 1 pixels on each side, so that it can be split
+        # into a quadtree of patches
+        size = sampler.x_size - 1
+
+        if (sampler.x_size != sampler.y_size or size & (size - 1) != 0 or patch_size & (patch_size - 1) != 0
+            or patch_size > size):
+            raise ValueError("Heightfield size must be a power of 2 plus 1 and a multiple of the patch size")
+
+        # Oblique clipping of the water cameras needs a variant of the shader without clip planes
+        if clip_mode not in GPUTerrain.shaders:
+            GPUTerrain.shaders[clip_mode] = load_shader(
+                "shaders/GPUTerrain.vert.glsl",
+                "shaders/Terrain.frag.glsl",
+                clip_mode
+            )
+
+        self.sampler = sampler
+        self.focal_point = focal_point
+        self.patch_size = patch_size
+        self.size = size
+        self.num_levels = (size // patch_size).bit_length()
+        self.cameras = []
+
+        # Calculate the LOD ranges. Each level of the quadtree covers twice the distance of the previous level. The
+        # vertices of a patch start morphing into the grid of the next level near the end of its range, so that
+        # patches of neighboring levels meet without cracks. The top level has nothing to morph into.
+        self.lod_ranges = lod_distance * 2.0 ** np.arange(self.num_levels)
+        self.lod_ranges[-1] = np.inf
+        morph_ranges = PTA_LVecBase2f()
+
+        for lod_range in self.lod_ranges:
+            end = min(lod_range, 1e9)
+            morph_ranges.push_back(Vec2(end * morph_start, end))
+
+        # Calculate the height range of each node of the quadtree, so that patches can be culled. The height
+        # range of each cell is found first, since the cells along the edges of a patch share their vertices with
+        # the next patch.
+        heights = sampler.heights
+        num_patches = size // patch_size
+        cell_min = np.minimum(np.minimum(heights[:-1, :-1], heights[1:, :-1]), np.minimum(heights[:-1, 1:],
+            heights[1:, 1:]))
+        cell_max = np.maximum(np.maximum(heights[:-1, :-1], heights[1:, :-1]), np.maximum(heights[:-1, 1:],
+            heights[1:, 1:]))
+        min_heights = cell_min.reshape(num_patches, patch_size, num_patches, patch_size).min(axis=(1, 3))
+        max_heights = cell_max.reshape(num_patches, patch_size, num_patches, patch_size).max(axis=(1, 3))
+        self.min_heights = []
+        self.max_heights = []
+
+        for level in range(self.num_levels):
+            self.min_heights.append(min_heights)
+            self.max_heights.append(max_heights)
+            min_heights = np.minimum(
+                np.minimum(min_heights[::2, ::2], min_heights[1::2, ::2]),
+                np.minimum(min_heights[::2, 1::2], min_heights[1::2, 1::2])
+            )
+            max_heights = np.maximum(
+                np.maximum(max_heights[::2, ::2], max_heights[1::2, ::2]),
+                np.maximum(max_heights[::2, 1::2], max_heights[1::2, 1::2])
+            )
+
+        # Create height texture. It stores the same heights as GeoMipTerrain uses, from 0 to 1.
+        self.height_tex = Texture("TerrainHeights")
+        self.height_tex.setup_2d_texture(sampler.x_size, sampler.y_size, Texture.T_float, Texture.F_r32)
+        self.height_tex.wrap_u = SamplerState.WM_clamp
+        self.height_tex.wrap_v = SamplerState.WM_clamp
+        self.height_tex.minfilter = SamplerState.FT_linear
+        self.height_tex.magfilter = SamplerState.FT_linear
+        self.height_tex.set_ram_image((heights - sampler.pos.z) / sampler.scale.z)
+
+        # Create patch data texture. Each instance of the patch reads its origin, size, and level from it.
+        self.max_patches = num_patches * num_patches
+        self.patch_data = np.zeros((self.max_patches, 4), np.float32)
+        self.patch_tex = Texture("TerrainPatches")
+        self.patch_tex.setup_buffer_texture(self.max_patches, Texture.T_float, Texture.F_rgba32,
+            GeomEnums.UH_dynamic)
+        self.patch_tex.set_ram_image(self.patch_data)
+
+        # Create the terrain root with the same transform as the sampler
+        self.root = NodePath("GPUTerrain")
+        self.root.set_pos(sampler.pos)
+        self.root.set_scale(sampler.scale)
+        self.root.set_shader(self.shaders[clip_mode])
+        self.root.set_shader_input("heightMap", self.height_tex)
+        self.root.set_shader_input("patchData", self.patch_tex)
+        self.root.set_shader_input("morphRanges", morph_ranges)
+        self.root.set_shader_input("patchSize", float(patch_size))
+        self.root.set_shader_input("terrainSize", float(size))
+        self.root.set_shader_input("focalPos", self.focal_point.get_pos(base.render))
+
+        # All patches are instances of a single grid, so the grid is the only geometry of the terrain. The
+        # quadtree already culls the patches, so Panda3D shouldn't cull the grid.
+        self.patch = self.root.attach_new_node(self.make_grid(patch_size))
+        self.patch.node().set_bounds(OmniBoundingVolume())
+        self.patch.node().set_final(True)
+
+        # Initialize stats
+        self.patch_count = 0
+        self.update_count = 0
+        self.update_time = 0.0
+
+    def make_grid(self, size):
+        # Create a grid of vertices from 0 to the given size. The vertex shader moves them into place.
+        vdata = GeomVertexData("Patch", GeomVertexFormat.get_v3(), Geom.UH_static)
+        vdata.unclean_set_num_rows((size + 1) * (size + 1))
+        vertex = GeomVertexWriter(vdata, "vertex")
+
+        for y in range(size + 1):
+            for x in range(size + 1):
+                vertex.add_data3(x, y, 0)
+
+        # Each cell is split into 2 triangles
+        tris = GeomTriangles(Geom.UH_static)
+
+        for y in range(size):
+            for x in range(size):
+                i = y * (size + 1) + x
+                tris.add_vertices(i, i + 1, i + size + 2)
+                tris.add_vertices(i, i + size + 2, i + size + 1)
+
+        geom = Geom(vdata)
+        geom.add_primitive(tris)
+        node = GeomNode("Patch")
+        node.add_geom(geom)
+        return node
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_gpu_terrain", sort=-5)
+
+    def stop(self):
+        base.task_mgr.remove("update_gpu_terrain")
+
+    def add_camera(self, camera):
+        # Patches are culled against the frustums of all cameras that render the terrain
+        self.cameras.append(camera)
+
+    def select_patches(self, focal_pos):
+        pos = self.sampler.pos
+        planes = [get_frustum_planes(camera) for camera in self.cameras]
+        selected = []
+
+        # Walk down the quadtree one level at a time, starting with the root node
+        level = self.num_levels - 1
+        nx = np.zeros(1, np.intp)
+        ny = np.zeros(1, np.intp)
+
+        while len(nx) > 0:
+            # Calculate the bounding box of each node in world space
+            node_size = self.patch_size << level
+            min_x = pos.x + nx * node_size * self.sampler.scale.x
+            min_y = pos.y + ny * node_size * self.sampler.scale.y
+            max_x = min_x + node_size * self.sampler.scale.x
+            max_y = min_y + node_size * self.sampler.scale.y
+            min_z = self.min_heights[level][ny, nx]
+            max_z = self.max_heights[level][ny, nx]
+
+            # Cull the nodes that are outside of all camera frustums. A box is outside of a plane if the corner
+            # that is furthest along the normal of the plane is behind it.
+            if planes:
+                visible = np.zeros(len(nx), bool)
+
+                for frustum in planes:
+                    inside = np.ones(len(nx), bool)
+
+                    for a, b, c, d in frustum:
+                        inside &= (
+                            np.where(a >= 0, max_x, min_x) * a
+                            + np.where(b >= 0, max_y, min_y) * b
+                            + np.where(c >= 0, max_z, min_z) * c + d
+                        ) >= 0
+
+                    visible |= inside
+
+                nx = nx[visible]
+                ny = ny[visible]
+                min_x, min_y, max_x, max_y = min_x[visible], min_y[visible], max_x[visible], max_y[visible]
+                min_z, max_z = min_z[visible], max_z[visible]
+
+            # Split the nodes that are within the range of the next level down
+            if level > 0:
+                dx = np.maximum(np.maximum(min_x - focal_pos.x, focal_pos.x - max_x), 0)
+                dy = np.maximum(np.maximum(min_y - focal_pos.y, focal_pos.y - max_y), 0)
+                dz = np.maximum(np.maximum(min_z - focal_pos.z, focal_pos.z - max_z), 0)
+                split = dx * dx + dy * dy + dz * dz < self.lod_ranges[level - 1] ** 2
+
+            else:
+                split = np.zeros(len(nx), bool)
+
+            # Select the nodes that aren't split and continue with the children of the others
+            keep = ~split
+            selected.append(np.stack([
+                nx[keep] * node_size,
+                ny[keep] * node_size,
+                np.full(np.count_nonzero(keep), node_size),
+                np.full(np.count_nonzero(keep), level)
+            ], axis=1))
+            nx = np.repeat(nx[split] * 2, 4) + np.tile([0, 1, 0, 1], np.count_nonzero(split))
+            ny = np.repeat(ny[split] * 2, 4) + np.tile([0, 0, 1, 1], np.count_nonzero(split))
+            level -= 1
+
+        return np.concatenate(selected)
+
+    def update(self, task):
+        start = time.perf_counter()
+
+        # Select the patches and upload them
+        focal_pos = self.focal_point.get_pos(base.render)
+        patches = self.select_patches(focal_pos)
+        self.patch_count = len(patches)
+        self.patch_data[:self.patch_count] = patches
+        self.patch_tex.set_ram_image(self.patch_data)
+        self.patch.set_instance_count(self.patch_count)
+        self.root.set_shader_input("focalPos", focal_pos)
+
+        self.update_time += time.perf_counter() - start
+        self.update_count += 1
+        return task.cont
+
+    def get_average_update_time(self):
+        return self.update_time / self.update_count if self.update_count > 0 else 0.0
+
+    def get_triangle_count(self):
+        return self.patch_count * self.patch_size * self.patch_size * 2
@@ -0,0 +1,271 @@
+#version 140
+
+// Each bit enables one layer of the terrain, from the base layer in bit 0 to layer 3 in bit 3. Variants of this
+// shader that only sample some of the layers are created by defining this before the shader is compiled.
+#ifndef TERRAIN_LAYERS
+#define TERRAIN_LAYERS 15
+#endif
+
+in vec3 fragPos;
+
+// Terrain with a baked normal map reads its normals from the normal map instead of its vertices. Variants of this
+// shader for it are created by defining TERRAIN_NORMAL_MAP before the shader is compiled.
+#ifdef TERRAIN_NORMAL_MAP
+vec3 normal = vec3(0, 0, 1);
+#else
+in vec3 normal;
+#endif
+in vec2 uv;
+
+uniform mat4 p3d_ViewMatrix;
+uniform struct p3d_LightModelParameters {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct p3d_LightSourceParameters {
+    // Primary light color.
+    vec4 color;
+
+    // Light color broken up into components, for compatibility with legacy
+    // shaders. These are now deprecated.
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 specular;
+
+    // View-space position. If w=0, this is a directional light, with the xyz
+    // being -direction.
+    vec4 position;
+
+    // Spotlight-only settings
+    vec3 spotDirection;
+    float spotExponent;
+    float spotCutoff;
+    float spotCosCutoff;
+
+    // Individual attenuation constants
+    float constantAttenuation;
+    float linearAttenuation;
+    float quadraticAttenuation;
+
+    // constant, linear, quadratic attenuation in one vector
+    vec3 attenuation;
+
+    // Shadow map for this light source
+    sampler2DShadow shadowMap;
+
+    // Transforms view-space coordinates to shadow map coordinates
+    mat4 shadowViewMatrix;
+} p3d_LightSource[2];
+uniform struct p3d_MaterialParameters {
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 emission;
+    vec3 specular;
+    float shininess;
+    
+    vec4 baseColor;
+    float roughness;
+    float metallic;
+    float refractiveIndex;
+} p3d_Material;
+uniform struct p3d_FogParameters {
+    vec4 color;
+    float density;
+    float start;
+    float end;
+    float scale; // 1.0 / (end - start)
+} p3d_Fog;
+uniform sampler2D p3d_Texture0;
+uniform sampler2D p3d_Texture1;
+uniform sampler2D p3d_Texture2;
+uniform sampler2D p3d_Texture3;
+uniform sampler2D p3d_Texture4;
+uniform vec2 texScale0;
+uniform vec2 texScale1;
+uniform vec2 texScale2;
+uniform vec2 texScale3;
+#ifdef TERRAIN_NORMAL_MAP
+uniform sampler2D normalMap;
+#endif
+
+// Terrain with a baked lightmap reads the diffuse lighting and the shadow of the sun from the lightmap. Variants of
+// this shader for it are created by defining TERRAIN_LIGHTMAP before the shader is compiled.
+#ifdef TERRAIN_LIGHTMAP
+uniform sampler2D lightmap;
+vec2 sunLight = vec2(1);
+#endif
+
+out vec4 p3d_FragColor;
+
+const float PI = 3.14159265359;
+
+
+float distributionGGX(vec3 N, vec3 H, float roughness) {
+    float a = roughness * roughness;
+    float a2 = a * a;
+    float NdotH = max(dot(N, H), 0.0);
+    float NdotH2 = NdotH * NdotH;
+
+    float num = a2;
+    float denom = (NdotH2 * (a2 - 1.0) + 1.0);
+    denom = PI * denom * denom;
+    return num / denom;
+}
+
+
+float geometrySchlickGGX(float NdotV, float roughness) {
+    float r = (roughness + 1.0);
+    float k = (r * r) / 8.0;
+
+    float num = NdotV;
+    float denom = NdotV * (1.0 - k) + k;
+
+    return num / denom;
+}
+
+
+float geometrySmith(vec3 N, vec3 V, vec3 L, float roughness) {
+    float NdotV = max(dot(N, V), 0.0);
+    float NdotL = max(dot(N, L), 0.0);
+    float ggx2 = geometrySchlickGGX(NdotV, roughness);
+    float ggx1 = geometrySchlickGGX(NdotL, roughness);
+
+    return ggx1 * ggx2;
+}
+
+
+vec3 fresnelSchlick(float cosTheta, vec3 F0) {
+    return F0 + (1.0 - F0) * pow(clamp(1.0 - cosTheta, 0.0, 1.0), 5.0);
+}
+
+
+vec4 applyLighting(vec4 albedo, float metallic, float emission, float roughness) {
+    // Normalize normal and extract camera position from view matrix
+    vec3 N = normalize(normal);
+    vec3 cameraPos = p3d_ViewMatrix[3].xyz;
+
+    // Calculate view vector
+    vec3 V = normalize(cameraPos - fragPos);
+
+    // Calculate base reflectivity
+    vec3 F0 = vec3(.04);
+    F0 = mix(F0, albedo.rgb, metallic);
+
+    // Calculate total radiance
+    vec3 Lo = vec3(0.0);
+
+    for(int i = 0; i < p3d_LightSource.length(); i++) {
+        // Calculate per-light radiance
+        vec3 lightDir = p3d_LightSource[i].position.xyz - fragPos * 
+            p3d_LightSource[i].position.w;
+        vec3 L = normalize(lightDir);
+        vec3 H = normalize(V + L);
+        float dist = length(lightDir);
+        vec3 atten = p3d_LightSource[i].attenuation;
+        float attenuation = 1.0 / (atten.x + atten.y * dist + 
+            atten.z * dist * dist);
+        vec3 radiance = p3d_LightSource[i].color.rgb * attenuation;
+
+        // Cook-Torrance BRDF
+        float NDF = distributionGGX(N, H, roughness);
+        float G = geometrySmith(N, V, L, roughness);
+        vec3 F = fresnelSchlick(max(dot(H, V), 0.0), F0);
+
+        vec3 kS = F;
+        vec3 kD = vec3(1.0) - kS;
+        kD *= 1.0 - metallic;
+
+        vec3 num = NDF * G * F;
+        float denom = 4.0 * max(dot(N, V), 0.0) * max(dot(N, L), 0.0) + 
+            .0001;
+        vec3 specular = num / denom;
+
+        // Add to outgoing radiance Lo
+        float NdotL = max(dot(N, L), 0.0);
+#ifdef TERRAIN_LIGHTMAP
+        // The sun is the only directional light. Its diffuse lighting is read from the lightmap, and its specular
+        // lighting is hidden by the same shadow.
+        vec2 baked = p3d_LightSource[i].position.w == 0 ? sunLight : vec2(NdotL, 1);
+        Lo += (kD * albedo.rgb / PI * baked.x + specular * NdotL * baked.y) * radiance;
+#else
+        Lo += (kD * albedo.rgb / PI + specular) * radiance * NdotL;
+#endif
+
+        // Add emission
+        Lo += p3d_Material.emission.rgb * emission;
+    }
+
+    // Apply lighting to initial color
+    vec3 ambient = p3d_LightModel.ambient.rgb * albedo.rgb * 
+        p3d_Material.refractiveIndex;
+    vec3 color = ambient + Lo;
+    color = color / (color + vec3(1.0));
+    return vec4(color, albedo.a);
+}
+
+
+vec4 applyFog(vec4 color) {
+    // If fog is disabled, skip fog calculations
+    if(p3d_Fog.start == p3d_Fog.end) {
+        return color;
+    }
+
+    // Calculate linear fog
+    float dist = length(fragPos);
+    float fogFactor = (p3d_Fog.end - dist) / (p3d_Fog.end - p3d_Fog.start);
+    fogFactor = clamp(fogFactor, 0, 1);
+    return mix(p3d_Fog.color, color, fogFactor);
+}
+
+
+void main() {
+    // Calculate base color, metallic, emission, and roughness. Only the enabled layers are sampled. A layer is
+    // only disabled where it is completely hidden by the layers above it, so the first enabled layer can be
+    // blended with black. The mask isn't needed if only one layer is enabled.
+#if (TERRAIN_LAYERS & (TERRAIN_LAYERS - 1)) != 0
+    vec4 mask0 = texture(p3d_Texture4, uv);
+#else
+    vec4 mask0 = vec4(1);
+#endif
+
+    vec4 baseColor = vec4(0);
+
+#if (TERRAIN_LAYERS & 1) != 0
+    baseColor = texture(p3d_Texture0, uv / texScale0);
+#endif
+
+#if (TERRAIN_LAYERS & 2) != 0
+    baseColor = mix(baseColor, texture(p3d_Texture1, uv / texScale1), mask0.r);
+#endif
+
+#if (TERRAIN_LAYERS & 4) != 0
+    baseColor = mix(baseColor, texture(p3d_Texture2, uv / texScale2), mask0.g);
+#endif
+
+#if (TERRAIN_LAYERS & 8) != 0
+    baseColor = mix(baseColor, texture(p3d_Texture3, uv / texScale3), mask0.b);
+#endif
+
+#ifdef TERRAIN_NORMAL_MAP
+    // The normal map has one texel for each vertex of the heightfield, so the UV is moved onto the centers of
+    // the texels. The normals are in world space, and the z of each normal is calculated from its x and y.
+    vec2 size = vec2(textureSize(normalMap, 0));
+    vec2 normalXY = texture(normalMap, (uv * (size - 1) + .5) / size).rg * 2 - 1;
+    normal = mat3(p3d_ViewMatrix) * vec3(normalXY, sqrt(max(1 - dot(normalXY, normalXY), 0)));
+#endif
+
+#ifdef TERRAIN_LIGHTMAP
+    // The lightmap has one texel for each vertex of the heightfield too
+    vec2 lightmapSize = vec2(textureSize(lightmap, 0));
+    sunLight = texture(lightmap, (uv * (lightmapSize - 1) + .5) / lightmapSize).rg;
+#endif
+
+    float metallic = p3d_Material.metallic;
+    float emission = 0.0;
+    float roughness = p3d_Material.roughness;
+
+    // Calculate final color and store the linear depth in the alpha channel. The alpha channel of the
+    // main window is not used, so this only matters when rendering into a float buffer.
+    vec4 color = applyFog(applyLighting(baseColor, metallic, emission,
+        roughness));
+    p3d_FragColor = vec4(color.rgb, length(fragPos));
+}
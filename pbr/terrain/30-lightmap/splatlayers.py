@@ -0,0 +1,168 @@
+import math
+
+import numpy as np
+from panda3d.core import (
+    Filename,
+    NodePath,
+    PNMImage,
+    Texture
+)
+
+from water import load_shader, WaterPlane
+
+
+# Functions
+# =========
+def load_splat_mask(mask):
+    if not isinstance(mask, PNMImage):
+        mask = PNMImage(Filename(mask))
+
+    # Load the mask into an array through a texture, so that row 0 is the bottom row of the image just like
+    # the rows of the heightfield. Texels are stored in BGR order.
+    tex = Texture()
+    tex.load(mask)
+    dtype = np.uint16 if tex.get_component_type() == Texture.T_unsigned_short else np.uint8
+    data = np.frombuffer(tex.get_ram_image(), dtype).reshape(
+        tex.get_y_size(),
+        tex.get_x_size(),
+        tex.get_num_components()
+    ).astype(np.float32) / mask.get_maxval()
+
+    if data.shape[2] < 3:
+        raise ValueError("Splat mask must have at least 3 channels")
+
+    return data[..., 2::-1]
+
+
+def get_fetch_count(layers):
+    # Each enabled layer costs one texture fetch, and the mask costs another one if more than one layer is enabled
+    count = bin(layers).count("1")
+    return count + 1 if count > 1 else count
+
+
+# Classes
+# =======
+class SplatLayerCuller(object):
+    # Layers
+    L_base = 1
+    L_layer1 = 2
+    L_layer2 = 4
+    L_layer3 = 8
+    L_all = 15
+
+    shaders = {}
+
+    def __init__(self, terrain, mask, margin=4, normal_map=False, lightmap=False,
+        clip_mode=WaterPlane.CM_clip_plane):
+        self.terrain = terrain
+        self.clip_mode = clip_mode
+        self.block_size = terrain.get_block_size()
+        self.margin = margin
+        self.normal_map = normal_map
+        self.lightmap = lightmap
+        heightfield = terrain.heightfield()
+        self.num_blocks = (
+            (heightfield.get_x_size() - 1) // self.block_size,
+            (heightfield.get_y_size() - 1) // self.block_size
+        )
+
+        # The mask doesn't need to have the same size as the heightfield, so the pixels of each block are scaled
+        # to the mask
+        self.mask = load_splat_mask(mask)
+        self.mask_scale = (
+            (self.mask.shape[1] - 1) / (heightfield.get_x_size() - 1),
+            (self.mask.shape[0] - 1) / (heightfield.get_y_size() - 1)
+        )
+        self.block_layers = np.zeros((self.num_blocks[1], self.num_blocks[0]), int)
+
+        for my in range(self.num_blocks[1]):
+            for mx in range(self.num_blocks[0]):
+                self.block_layers[my, mx] = self.get_block_layers(mx, my)
+
+    def get_block_mask_rect(self, mx, my):
+        # Find the pixels of the mask that cover a block. Blocks also look at a few pixels around them, since the
+        # mask is filtered when it is sampled.
+        x0 = max(int(math.floor(mx * self.block_size * self.mask_scale[0])) - self.margin, 0)
+        y0 = max(int(math.floor(my * self.block_size * self.mask_scale[1])) - self.margin, 0)
+        x1 = int(math.ceil((mx + 1) * self.block_size * self.mask_scale[0])) + self.margin + 1
+        y1 = int(math.ceil((my + 1) * self.block_size * self.mask_scale[1])) + self.margin + 1
+        return x0, y0, x1, y1
+
+    def get_block_layers(self, mx, my):
+        x0, y0, x1, y1 = self.get_block_mask_rect(mx, my)
+        region = self.mask[y0:y1, x0:x1].reshape(-1, 3)
+        return self.get_layers(region.max(axis=0) > 0, region.min(axis=0) >= 1)
+
+    def get_layers(self, used, opaque):
+        # Walk down from the top layer. Each layer that is used somewhere in the block is enabled, and a layer
+        # that covers the whole block hides all layers below it.
+        layers = 0
+
+        for channel in (2, 1, 0):
+            if used[channel]:
+                layers |= self.L_layer1 << channel
+
+            if opaque[channel]:
+                return layers
+
+        return layers | self.L_base
+
+    @classmethod
+    def get_shader(cls, layers, normal_map=False, lightmap=False, clip_mode=WaterPlane.CM_clip_plane):
+        # Each variant of the terrain shader is only compiled once. Terrain with a baked normal map needs its own
+        # variants, since it has no vertex normals, and so does terrain with a baked lightmap. Oblique clipping
+        # of the water cameras needs variants without clip planes.
+        key = (layers, normal_map, lightmap, clip_mode)
+
+        if key not in cls.shaders:
+            defines = "#define TERRAIN_LAYERS {}\n".format(layers)
+
+            if normal_map:
+                defines += "#define TERRAIN_NORMAL_MAP\n"
+
+            if lightmap:
+                defines += "#define TERRAIN_LIGHTMAP\n"
+
+            cls.shaders[key] = load_shader(
+                "shaders/Terrain.vert.glsl",
+                "shaders/Terrain.frag.glsl",
+                clip_mode,
+                defines
+            )
+
+        return cls.shaders[key]
+
+    def apply(self):
+        # Assign each block the shader variant for its layers. GeoMipTerrain keeps the state of a block when it
+        # rebuilds it, so this only needs to be done once.
+        for my in range(self.num_blocks[1]):
+            for mx in range(self.num_blocks[0]):
+                block = NodePath(self.terrain.get_block_node_path(mx, my).node())
+                layers = int(self.block_layers[my, mx])
+                block.set_shader(self.get_shader(layers, self.normal_map, self.lightmap, self.clip_mode))
+
+    def set_mask_region(self, x, y, region):
+        # Replace a region of the mask that starts at the given column and row, and give the blocks that look at
+        # it the shader variant for their new layers
+        self.mask[y:y + region.shape[0], x:x + region.shape[1]] = region
+
+        for my in range(self.num_blocks[1]):
+            for mx in range(self.num_blocks[0]):
+                x0, y0, x1, y1 = self.get_block_mask_rect(mx, my)
+
+                if x0 >= x + region.shape[1] or x1 <= x or y0 >= y + region.shape[0] or y1 <= y:
+                    continue
+
+                layers = self.get_block_layers(mx, my)
+
+                if layers != self.block_layers[my, mx]:
+                    self.block_layers[my, mx] = layers
+                    block = NodePath(self.terrain.get_block_node_path(mx, my).node())
+                    block.set_shader(self.get_shader(layers, self.normal_map, self.lightmap, self.clip_mode))
+
+    def get_variant_counts(self):
+        layers, counts = np.unique(self.block_layers, return_counts=True)
+        return dict(zip(layers.tolist(), counts.tolist()))
+
+    def get_average_fetch_count(self):
+        return float(np.mean([get_fetch_count(layers) for layers in self.block_layers.flat]))
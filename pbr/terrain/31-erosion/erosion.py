@@ -0,0 +1,293 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from generate_hills import get_valley
+
+
+# Functions
+# =========
+def hash_coords(x, y, seed):
+    # Hash integer lattice coordinates into 32-bit values. The hash only depends on the coordinates and the seed,
+    # so every tile gets the same values for the same lattice points.
+    h = (x.astype(np.uint32) * np.uint32(0x8da6b343)) ^ (y.astype(np.uint32) * np.uint32(0xd8163841))
+    h ^= np.uint32(seed * 0xcb1ab31f & 0xffffffff)
+    h ^= h >> np.uint32(15)
+    h *= np.uint32(0x2c1b3c6d)
+    h ^= h >> np.uint32(12)
+    h *= np.uint32(0x297a2d39)
+    h ^= h >> np.uint32(15)
+    return h
+
+
+def get_gradient_noise(x, y, seed):
+    # Blend the gradients of the 4 lattice points around each position. Each lattice point gets a random
+    # direction from its hash. The result goes from about -0.7 to 0.7.
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = x - x0
+    fy = y - y0
+    x0 = x0.astype(np.int64)
+    y0 = y0.astype(np.int64)
+
+    def dot_gradient(dx, dy):
+        angle = hash_coords(x0 + dx, y0 + dy, seed) * (np.pi * 2 / 2 ** 32)
+        return np.cos(angle) * (fx - dx) + np.sin(angle) * (fy - dy)
+
+    # The quintic fade curve keeps the slope of the noise continuous across the edges of the lattice cells
+    ux = fx * fx * fx * (fx * (fx * 6 - 15) + 10)
+    uy = fy * fy * fy * (fy * (fy * 6 - 15) + 10)
+    bottom = dot_gradient(0, 0) + (dot_gradient(1, 0) - dot_gradient(0, 0)) * ux
+    top = dot_gradient(0, 1) + (dot_gradient(1, 1) - dot_gradient(0, 1)) * ux
+    return bottom + (top - bottom) * uy
+
+
+def get_fbm(x, y, seed, octaves=8, frequency=1 / 256):
+    # Add up octaves of gradient noise. Each octave has twice the frequency and half the amplitude of the previous
+    # one, and its own seed. The result is scaled to go from about 0 to 1 without looking at the other tiles.
+    noise = np.zeros(np.shape(x))
+    amplitude = 1.0
+
+    for octave in range(octaves):
+        noise += get_gradient_noise(x * frequency, y * frequency, seed * octaves + octave) * amplitude
+        frequency *= 2
+        amplitude /= 2
+
+    return np.clip(noise / (2 - amplitude * 2) + .5, 0, 1)
+
+
+def get_brush(radius, x_size):
+    # Erosion is spread across the pixels within the radius of the brush, which keeps droplets from digging
+    # narrow pits. Closer pixels get more of it. The pixels are returned as offsets into the flat heights.
+    r = int(np.ceil(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    dist = np.hypot(dx, dy)
+    inside = dist < radius
+    weights = 1 - dist[inside] / radius
+    return dy[inside] * x_size + dx[inside], weights / weights.sum()
+
+
+def erode(heights, rng, num_droplets, params):
+    # Simulate droplets of water running down the heights, which are in world units. A batch of droplets moves in
+    # lockstep, so each step is done for the whole batch at once. Each droplet picks up sediment while it speeds
+    # downhill, and drops it when it slows down or runs uphill.
+    (batch_size, max_lifetime, inertia, capacity_factor, min_capacity, erode_rate, deposit_rate, evaporate_rate,
+        gravity, radius) = params
+
+    # The heights are padded by the radius of the brush, so that the brush never reaches past them. Droplets stay
+    # out of the padding.
+    border = int(np.ceil(radius))
+    heights = np.pad(heights, border, mode="edge")
+    y_size, x_size = heights.shape
+    low = border
+    high = np.array((x_size - 1 - border, y_size - 1 - border))
+    flat = heights.ravel()
+    brush_offsets, brush_weights = get_brush(radius, x_size)
+
+    for first in range(0, num_droplets, batch_size):
+        count = min(batch_size, num_droplets - first)
+        pos = rng.uniform(low, high, (count, 2))
+        direction = np.zeros((count, 2))
+        speed = np.ones(count)
+        water = np.ones(count)
+        sediment = np.zeros(count)
+
+        for i in range(max_lifetime):
+            # Calculate the height and the gradient at the position of each droplet
+            cell = np.minimum(pos.astype(np.intp), (x_size - 2, y_size - 2))
+            fx, fy = (pos - cell).T
+            index = cell[:, 1] * x_size + cell[:, 0]
+            h00 = flat[index]
+            h10 = flat[index + 1]
+            h01 = flat[index + x_size]
+            h11 = flat[index + x_size + 1]
+            height = (h00 * (1 - fx) + h10 * fx) * (1 - fy) + (h01 * (1 - fx) + h11 * fx) * fy
+            gradient = np.stack((
+                (h10 - h00) * (1 - fy) + (h11 - h01) * fy,
+                (h01 - h00) * (1 - fx) + (h11 - h10) * fx
+            ), axis=-1)
+
+            # Turn each droplet downhill and move it 1 pixel. Droplets that stop or leave the heights are done.
+            direction = direction * inertia - gradient * (1 - inertia)
+            length = np.hypot(direction[:, 0], direction[:, 1])
+            new_pos = pos + direction / np.maximum(length, 1e-9)[:, None]
+            alive = (length > 1e-9) & (new_pos >= low).all(axis=1) & (new_pos < high).all(axis=1)
+
+            if not alive.all():
+                cell, fx, fy, index, height, sediment, speed, water = (
+                    cell[alive], fx[alive], fy[alive], index[alive], height[alive], sediment[alive], speed[alive],
+                    water[alive]
+                )
+                direction = direction[alive] / length[alive, None]
+                new_pos = new_pos[alive]
+
+            else:
+                direction /= length[:, None]
+
+            if len(new_pos) == 0:
+                break
+
+            new_cell = np.minimum(new_pos.astype(np.intp), (x_size - 2, y_size - 2))
+            nx, ny = (new_pos - new_cell).T
+            new_index = new_cell[:, 1] * x_size + new_cell[:, 0]
+            new_height = ((flat[new_index] * (1 - nx) + flat[new_index + 1] * nx) * (1 - ny)
+                + (flat[new_index + x_size] * (1 - nx) + flat[new_index + x_size + 1] * nx) * ny)
+            delta = new_height - height
+
+            # A faster droplet with more water can carry more sediment
+            capacity = np.maximum(-delta * speed * water * capacity_factor, min_capacity)
+            depositing = (delta > 0) | (sediment > capacity)
+
+            # Droplets that run uphill fill the pit behind them, and droplets that carry too much drop some of it
+            # on the 4 corners of their cell
+            deposit = np.where(delta > 0, np.minimum(delta, sediment), (sediment - capacity) * deposit_rate)
+            deposit = np.where(depositing, deposit, 0)
+            sediment -= deposit
+
+            # The other droplets wear the heights down across their brush, but never deeper than the height they
+            # are about to lose. Both changes are added to the heights at once.
+            amount = np.where(depositing, 0, np.minimum((capacity - sediment) * erode_rate, -delta))
+            sediment += amount
+            eroding = ~depositing
+            np.add.at(flat, np.concatenate((
+                index,
+                index + 1,
+                index + x_size,
+                index + x_size + 1,
+                (index[eroding, None] + brush_offsets).ravel()
+            )), np.concatenate((
+                deposit * (1 - fx) * (1 - fy),
+                deposit * fx * (1 - fy),
+                deposit * (1 - fx) * fy,
+                deposit * fx * fy,
+                -(amount[eroding, None] * brush_weights).ravel()
+            )))
+
+            # Droplets speed up downhill and slow down uphill, and some of their water evaporates on the way
+            speed = np.sqrt(np.maximum(speed * speed - delta * gravity, 0))
+            water *= 1 - evaporate_rate
+            pos = new_pos
+
+    return heights[border:y_size - border, border:x_size - border]
+
+
+def generate_tile(x0, y0, x1, y1, seed, octaves, frequency, valley, height_scale, droplet_density, params):
+    # Generate the heights of the given columns and rows, and erode them. Noise and droplets both only depend on
+    # the seed and the position of the tile, so a tile always turns out the same no matter which process
+    # generates it.
+    y, x = np.mgrid[y0:y1, x0:x1].astype(np.float64)
+    heights = get_fbm(x, y, seed, octaves, frequency)
+
+    if valley:
+        heights = .36 + get_valley(x, y) * (.25 + .45 * heights)
+
+    # The seed of the droplets must not be negative, so the position of the tile is wrapped around into 32 bits.
+    # Tiles along the edges of the heightfield start before column or row 0.
+    rng = np.random.default_rng((seed & 0xffffffff, x0 & 0xffffffff, y0 & 0xffffffff))
+    heights = erode(heights * height_scale, rng, int(heights.size * droplet_density), params) / height_scale
+    return np.clip(heights, 0, 1)
+
+
+def get_blend_weights(start, stop, tile_start, tile_stop, size, fade):
+    # Fade a tile in and out across the edges it shares with the tiles next to it. The fades of 2 neighboring
+    # tiles add up to 1. The outer part of the overlap is left out, since droplets can't run in from beyond it.
+    # The edges of the heightfield don't have a neighbor to fade into.
+    coords = np.arange(start, stop) + .5
+    weights = np.ones(stop - start)
+
+    if fade > 0 and tile_start > 0:
+        weights = np.minimum(weights, np.clip((coords - tile_start) / fade + .5, 0, 1))
+
+    if fade > 0 and tile_stop < size:
+        weights = np.minimum(weights, np.clip((tile_stop - coords) / fade + .5, 0, 1))
+
+    return weights
+
+
+# Classes
+# =======
+class TerrainGenerator(object):
+    def __init__(self, seed=0, octaves=8, frequency=1 / 256, valley=True, height_scale=128.0, droplet_density=1.0,
+        batch_size=1024, max_lifetime=30, inertia=.05, capacity=4.0, min_capacity=.01, erode_rate=.3,
+        deposit_rate=.3, evaporate_rate=.01, gravity=4.0, radius=3.0, tile_size=256, overlap=32, num_workers=0):
+        if tile_size <= 0:
+            raise ValueError("Tile size must be positive")
+
+        if overlap < 0 or overlap > tile_size:
+            raise ValueError("Overlap must be between 0 and the tile size")
+
+        self.seed = seed
+        self.octaves = octaves
+        self.frequency = frequency
+        self.valley = valley
+        self.height_scale = height_scale
+        self.droplet_density = droplet_density
+        self.params = (batch_size, max_lifetime, inertia, capacity, min_capacity, erode_rate, deposit_rate,
+            evaporate_rate, gravity, radius)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.num_workers = num_workers
+
+        # Initialize stats
+        self.generate_time = 0.0
+        self.num_cells = 0
+
+    def get_tiles(self, x_size, y_size):
+        # Split the heightfield into tiles. Each tile is generated with a margin of the overlap around it, so that
+        # droplets can run across the edges of the tile and both tiles can be faded across the overlap. The margin
+        # also reaches past the edges of the heightfield, since the noise goes on forever.
+        # The last tile of each row and column takes the leftover pixels if there are fewer of them than the
+        # overlap, since a heightfield for GeoMipTerrain is always 1 pixel longer than a multiple of the tile size.
+        xs = list(range(0, max(x_size - self.overlap, 1), self.tile_size)) + [x_size]
+        ys = list(range(0, max(y_size - self.overlap, 1), self.tile_size)) + [y_size]
+        tiles = []
+
+        for y0, y1 in zip(ys, ys[1:]):
+            for x0, x1 in zip(xs, xs[1:]):
+                tiles.append((x0, y0, x1, y1))
+
+        return tiles
+
+    def generate(self, x_size, y_size):
+        start = time.perf_counter()
+        tiles = self.get_tiles(x_size, y_size)
+        margin = self.overlap
+        regions = [(x0 - margin, y0 - margin, x1 + margin, y1 + margin) for x0, y0, x1, y1 in tiles]
+        args = (self.seed, self.octaves, self.frequency, self.valley, self.height_scale, self.droplet_density,
+            self.params)
+
+        # Generate the tiles across a pool of worker processes. Panda3D may already be running threads, so the
+        # workers are spawned instead of forked.
+        if self.num_workers > 0:
+            with ProcessPoolExecutor(self.num_workers, multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(generate_tile, *region, *args) for region in regions]
+                results = [future.result() for future in futures]
+
+        else:
+            results = [generate_tile(*region, *args) for region in regions]
+
+        # Fade the tiles together across their overlap, and leave out the parts beyond the edges of the
+        # heightfield. The tiles are always added up in the same order, so the heights don't depend on the number
+        # of workers.
+        heights = np.zeros((y_size, x_size))
+
+        for (x0, y0, x1, y1), (rx0, ry0, rx1, ry1), result in zip(tiles, regions, results):
+            result = result * np.outer(
+                get_blend_weights(ry0, ry1, y0, y1, y_size, self.overlap),
+                get_blend_weights(rx0, rx1, x0, x1, x_size, self.overlap)
+            )
+            cx0 = max(rx0, 0)
+            cy0 = max(ry0, 0)
+            cx1 = min(rx1, x_size)
+            cy1 = min(ry1, y_size)
+            heights[cy0:cy1, cx0:cx1] += result[cy0 - ry0:cy1 - ry0, cx0 - rx0:cx1 - rx0]
+
+        self.generate_time = time.perf_counter() - start
+        self.num_cells = x_size * y_size
+        return np.clip(heights, 0, 1)
+
+    def get_throughput(self):
+        # Number of heightfield pixels generated per second
+        return self.num_cells / self.generate_time if self.generate_time > 0 else 0.0
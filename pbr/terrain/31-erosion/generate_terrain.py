@@ -0,0 +1,50 @@
+import argparse
+
+from panda3d.core import Filename
+
+from erosion import TerrainGenerator
+from heightfield import RawHeightfield, is_raw_heightfield, make_heightfield_image
+
+
+# Functions
+# =========
+def main():
+    # Parse command line
+    parser = argparse.ArgumentParser(description="Generate an eroded heightfield from noise.")
+    parser.add_argument("output", help="raw heightfield with the extension " + RawHeightfield.extension
+        + ", or heightfield image")
+    parser.add_argument("--size", type=int, default=513, help="number of pixels along each side")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the noise and the droplets")
+    parser.add_argument("--droplets", type=float, default=1.0, help="number of droplets per pixel")
+    parser.add_argument("--no-valley", action="store_true", help="don't carve the valley of the benchmark camera")
+    parser.add_argument("--tile-size", type=int, default=256, help="number of pixels along each side of a tile")
+    parser.add_argument("--overlap", type=int, default=32, help="number of pixels shared by neighboring tiles")
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes")
+    args = parser.parse_args()
+
+    generator = TerrainGenerator(
+        seed=args.seed,
+        valley=not args.no_valley,
+        droplet_density=args.droplets,
+        tile_size=args.tile_size,
+        overlap=args.overlap,
+        num_workers=args.workers
+    )
+    heights = generator.generate(args.size, args.size)
+    print("Generated {0}x{0} pixels in {1:.2f} s ({2:.0f} pixels/s)".format(
+        args.size,
+        generator.generate_time,
+        generator.get_throughput()
+    ))
+
+    if is_raw_heightfield(args.output):
+        RawHeightfield.write(args.output, heights)
+
+    else:
+        make_heightfield_image(heights).write(Filename(args.output))
+
+
+# Entry Point
+# ===========
+if __name__ == "__main__":
+    main()
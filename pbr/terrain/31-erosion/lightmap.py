@@ -0,0 +1,256 @@
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from panda3d.core import (
+    SamplerState,
+    Texture
+)
+
+from normalmap import get_sobel_normals
+
+
+# Functions
+# =========
+def get_sun_step(sun_dir, pixel_size):
+    # Calculate the step from a pixel towards the sun, which moves 1 pixel along the longer axis, and the
+    # horizontal distance it covers. The sun has no step if it is straight above the terrain.
+    step = np.array((sun_dir[0] / pixel_size[0], sun_dir[1] / pixel_size[1]))
+    length = np.abs(step).max()
+
+    if length < 1e-6:
+        return None, 0.0
+
+    step /= length
+    return step, math.hypot(step[0] * pixel_size[0], step[1] * pixel_size[1])
+
+
+def bake_tile(heights, x0, y0, x1, y1, pixel_size, sun_dir, max_distance, penumbra):
+    # Bake the given columns and rows of a region of world space heights. The region includes a border of 1 pixel
+    # around the tile for its normals, and the heights between the tile and the sun up to the max distance for its
+    # shadows. The diffuse lighting of the sun is stored in the first channel, and how much of the sun each pixel
+    # can see in the second.
+    normals = get_sobel_normals(heights[y0 - 1:y1 + 1, x0 - 1:x1 + 1], pixel_size)
+    diffuse = np.clip(normals @ np.asarray(sun_dir, np.float64), 0, 1)
+    visibility = np.full(diffuse.shape, 1.0 if sun_dir[2] > 0 else 0.0)
+    step, step_len = get_sun_step(sun_dir, pixel_size)
+
+    if sun_dir[2] > 0 and step is not None:
+        # March from each pixel towards the sun and keep the steepest slope up to the terrain along the way. A
+        # pixel is done once the terrain hides the whole disc of the sun, or once the ray to the bottom of the disc
+        # is above the highest point of the region.
+        elevation = math.atan2(sun_dir[2], math.hypot(sun_dir[0], sun_dir[1]))
+        top_slope = math.tan(min(elevation + penumbra / 2, math.pi / 2 - 1e-3))
+        bottom_slope = math.tan(min(elevation - penumbra / 2, math.pi / 2 - 1e-3))
+        max_height = heights.max()
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        fx = xs.ravel().astype(np.float64)
+        fy = ys.ravel().astype(np.float64)
+        base = heights[ys, xs].ravel().astype(np.float64)
+        slopes = np.full(len(base), -np.inf)
+        active = np.arange(len(base))
+        flat = heights.ravel()
+        x_size = heights.shape[1]
+
+        for i in range(1, int(max_distance / step_len) + 1):
+            px = fx[active] + step[0] * i
+            py = fy[active] + step[1] * i
+            inside = (px >= 0) & (px <= heights.shape[1] - 1) & (py >= 0) & (py <= heights.shape[0] - 1)
+            active = active[inside]
+
+            if len(active) == 0:
+                break
+
+            # Blend the heights of the 4 corners of the cell each sample is in
+            px = px[inside]
+            py = py[inside]
+            cx = np.minimum(px.astype(np.intp), x_size - 2)
+            cy = np.minimum(py.astype(np.intp), heights.shape[0] - 2)
+            tx = px - cx
+            ty = py - cy
+            index = cy * x_size + cx
+            bottom = flat[index] + (flat[index + 1] - flat[index]) * tx
+            top = flat[index + x_size] + (flat[index + x_size + 1] - flat[index + x_size]) * tx
+            sample = bottom + (top - bottom) * ty
+
+            slopes[active] = np.maximum(slopes[active], (sample - base[active]) / (step_len * i))
+            done = (slopes[active] >= top_slope) | (base[active] + step_len * i * bottom_slope > max_height)
+            active = active[~done]
+
+        # The sun fades out while its disc sinks below the horizon
+        horizon = np.arctan(slopes).reshape(diffuse.shape)
+        visibility = np.clip((elevation - horizon) / penumbra + .5, 0, 1)
+
+    return np.round(np.stack((diffuse * visibility, visibility), axis=-1) * 255).astype(np.uint8)
+
+
+# Classes
+# =======
+class TerrainLightmap(object):
+    def __init__(self, sampler, sun, max_distance=256.0, penumbra=2.0, tile_size=128, num_workers=0):
+        if tile_size <= 0:
+            raise ValueError("Tile size must be positive")
+
+        self.sampler = sampler
+        self.sun = sun
+        self.max_distance = max_distance
+        self.penumbra = math.radians(penumbra)
+        self.tile_size = tile_size
+        self.num_workers = num_workers
+
+        # The workers are kept around, since the lightmap is baked again whenever the sun moves. Panda3D may
+        # already be running threads, so the workers are spawned instead of forked.
+        self.pool = None
+
+        if num_workers > 0:
+            self.pool = ProcessPoolExecutor(num_workers, multiprocessing.get_context("spawn"))
+
+        # The lightmap has one texel for each pixel of the heightfield. The lighting doesn't need more than 8 bits.
+        self.tex = Texture("TerrainLightmap")
+        self.tex.setup_2d_texture(sampler.x_size, sampler.y_size, Texture.T_unsigned_byte, Texture.F_rg)
+        self.tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.tex.magfilter = SamplerState.FT_linear
+        self.tex.wrap_u = SamplerState.WM_clamp
+        self.tex.wrap_v = SamplerState.WM_clamp
+        self.tex.set_ram_image(np.zeros((sampler.y_size, sampler.x_size, 2), np.uint8))
+        self.tex.set_keep_ram_image(True)
+
+        # The region of the lightmap that needs to be baked again, and the tiles of the bake that is running
+        self.dirty = None
+        self.pending = None
+
+        # Initialize stats
+        self.bake_count = 0
+        self.bake_time = 0.0
+
+        # Bake the whole lightmap before the first frame
+        self.sun_hpr = self.sun.get_hpr(base.render)
+        self.write_tiles(self.submit_bake(0, 0, sampler.x_size, sampler.y_size))
+
+    def start(self):
+        base.task_mgr.add(self.update, "update_terrain_lightmap", sort=-2)
+
+    def stop(self):
+        base.task_mgr.remove("update_terrain_lightmap")
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def get_sun_dir(self):
+        # A directional light shines along its forward vector, so the sun is in the opposite direction
+        return tuple(-self.sun.get_quat(base.render).get_forward())
+
+    def get_tiles(self, x0, y0, x1, y1):
+        # Split the given columns and rows into tiles. Each tile gets its part of the heights, which overlaps the
+        # heights of the tiles next to it by the distance the shadows are traced towards the sun. The heights are
+        # padded with a copy of the edge, just like the normals of the normal map are clamped at the edges.
+        pixel_size = (self.sampler.scale.x, self.sampler.scale.y)
+        sun_dir = self.get_sun_dir()
+        step, step_len = get_sun_step(sun_dir, pixel_size)
+        reach = step * int(self.max_distance / step_len) if step is not None else np.zeros(2)
+        heights = np.pad(self.sampler.heights, 1, mode="edge")
+        args = (pixel_size, sun_dir, self.max_distance, self.penumbra)
+        tiles = []
+
+        for ty in range(y0, y1, self.tile_size):
+            for tx in range(x0, x1, self.tile_size):
+                tx1 = min(tx + self.tile_size, x1)
+                ty1 = min(ty + self.tile_size, y1)
+                rx0 = max(int(math.floor(tx + min(reach[0], 0))), 0)
+                ry0 = max(int(math.floor(ty + min(reach[1], 0))), 0)
+                rx1 = min(int(math.ceil(tx1 + max(reach[0], 0))) + 2, heights.shape[1])
+                ry1 = min(int(math.ceil(ty1 + max(reach[1], 0))) + 2, heights.shape[0])
+                region = heights[ry0:ry1, rx0:rx1].copy()
+                tiles.append((tx, ty, (region, tx + 1 - rx0, ty + 1 - ry0, tx1 + 1 - rx0, ty1 + 1 - ry0) + args))
+
+        return tiles
+
+    def submit_bake(self, x0, y0, x1, y1):
+        # Start baking the given columns and rows across the pool of worker processes. Without workers, they are
+        # baked right away.
+        start = time.perf_counter()
+        tiles = self.get_tiles(x0, y0, x1, y1)
+
+        if self.pool is not None:
+            return start, [(tx, ty, self.pool.submit(bake_tile, *args)) for tx, ty, args in tiles]
+
+        return start, [(tx, ty, bake_tile(*args)) for tx, ty, args in tiles]
+
+    def write_tiles(self, bake):
+        # Copy the baked tiles into the lightmap. Row 0 of the texture is the bottom row, just like row 0 of the
+        # heights.
+        start, tiles = bake
+        texels = np.asarray(memoryview(self.tex.modify_ram_image())).reshape(
+            self.sampler.y_size,
+            self.sampler.x_size,
+            2
+        )
+
+        for tx, ty, result in tiles:
+            if self.pool is not None:
+                result = result.result()
+
+            texels[ty:ty + result.shape[0], tx:tx + result.shape[1]] = result
+
+        self.bake_count += 1
+        self.bake_time += time.perf_counter() - start
+
+    def update_heights(self, x0, y0, x1, y1):
+        # The heights of the given columns and rows have changed, so the pixels next to them get new normals, and
+        # the pixels that look towards the sun across them get new shadows. They are baked again with the next
+        # update.
+        step, step_len = get_sun_step(self.get_sun_dir(), (self.sampler.scale.x, self.sampler.scale.y))
+        reach = step * int(self.max_distance / step_len) if step is not None else np.zeros(2)
+        self.add_dirty_region(
+            max(int(math.floor(x0 - max(reach[0], 0))) - 1, 0),
+            max(int(math.floor(y0 - max(reach[1], 0))) - 1, 0),
+            min(int(math.ceil(x1 - min(reach[0], 0))) + 1, self.sampler.x_size),
+            min(int(math.ceil(y1 - min(reach[1], 0))) + 1, self.sampler.y_size)
+        )
+
+    def add_dirty_region(self, x0, y0, x1, y1):
+        if self.dirty is None:
+            self.dirty = (x0, y0, x1, y1)
+
+        else:
+            self.dirty = (
+                min(self.dirty[0], x0),
+                min(self.dirty[1], y0),
+                max(self.dirty[2], x1),
+                max(self.dirty[3], y1)
+            )
+
+    def update(self, task):
+        # The whole lightmap is baked again whenever the sun moves
+        sun_hpr = self.sun.get_hpr(base.render)
+
+        if not sun_hpr.almost_equal(self.sun_hpr):
+            self.sun_hpr = sun_hpr
+            self.add_dirty_region(0, 0, self.sampler.x_size, self.sampler.y_size)
+
+        # Copy the tiles of the running bake into the lightmap once all of them are done
+        if self.pending is not None:
+            if not all(result.done() for tx, ty, result in self.pending[1]):
+                return task.cont
+
+            self.write_tiles(self.pending)
+            self.pending = None
+
+        # Start baking the dirty region. Without workers, it is baked right away.
+        if self.dirty is not None:
+            bake = self.submit_bake(*self.dirty)
+            self.dirty = None
+
+            if self.pool is not None:
+                self.pending = bake
+
+            else:
+                self.write_tiles(bake)
+
+        return task.cont
+
+    def get_average_bake_time(self):
+        return self.bake_time / self.bake_count if self.bake_count > 0 else 0.0
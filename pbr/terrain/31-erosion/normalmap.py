@@ -0,0 +1,68 @@
+import numpy as np
+from panda3d.core import (
+    GeomVertexFormat,
+    SamplerState,
+    Texture
+)
+
+
+# Functions
+# =========
+def get_sobel_normals(heights, pixel_size):
+    # Calculate the normal of each pixel inside a border of 1 pixel with the Sobel operator. It blends the
+    # central differences of each pixel with the ones of its neighbors, which smooths out the steps of the
+    # heightfield.
+    dx = ((heights[:-2, 2:] + heights[1:-1, 2:] * 2 + heights[2:, 2:])
+        - (heights[:-2, :-2] + heights[1:-1, :-2] * 2 + heights[2:, :-2])) / (8 * pixel_size[0])
+    dy = ((heights[2:, :-2] + heights[2:, 1:-1] * 2 + heights[2:, 2:])
+        - (heights[:-2, :-2] + heights[:-2, 1:-1] * 2 + heights[:-2, 2:])) / (8 * pixel_size[1])
+    normals = np.stack((-dx, -dy, np.ones_like(dx)), axis=-1)
+    return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+def strip_normals(node):
+    # Remove the normals from the vertices of all geoms of a terrain block. The normal map replaces them, so they
+    # only take up memory.
+    for i in range(node.get_num_geoms()):
+        geom = node.modify_geom(i)
+        geom.set_vertex_data(geom.get_vertex_data().convert_to(GeomVertexFormat.get_v3t2()))
+
+
+# Classes
+# =======
+class TerrainNormalMap(object):
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+        # The x and y of each normal are stored in 16 bits each, and the shader calculates the z from them, since
+        # terrain normals always point up. The texture has one texel for each pixel of the heightfield.
+        self.tex = Texture("TerrainNormalMap")
+        self.tex.setup_2d_texture(sampler.x_size, sampler.y_size, Texture.T_unsigned_short, Texture.F_rg16)
+        self.tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.tex.magfilter = SamplerState.FT_linear
+        self.tex.wrap_u = SamplerState.WM_clamp
+        self.tex.wrap_v = SamplerState.WM_clamp
+        self.tex.set_ram_image(np.zeros((sampler.y_size, sampler.x_size, 2), np.uint16))
+        self.tex.set_keep_ram_image(True)
+        self.bake(0, 0, sampler.x_size, sampler.y_size)
+
+    def bake(self, x0, y0, x1, y1):
+        # Calculate the normals of the given columns and rows of the heightfield from the heights of the sampler.
+        # The pixels around them are clamped at the edges of the heightfield. Row 0 of the texture is the bottom
+        # row, just like row 0 of the heights.
+        sampler = self.sampler
+        xs = np.clip(np.arange(x0 - 1, x1 + 1), 0, sampler.x_size - 1)
+        ys = np.clip(np.arange(y0 - 1, y1 + 1), 0, sampler.y_size - 1)
+        normals = get_sobel_normals(sampler.heights[ys[:, None], xs], (sampler.scale.x, sampler.scale.y))
+        texels = np.asarray(memoryview(self.tex.modify_ram_image())).view(np.uint16).reshape(
+            sampler.y_size,
+            sampler.x_size,
+            2
+        )
+        texels[y0:y1, x0:x1] = np.round((normals[..., :2] * .5 + .5) * 65535)
+
+    def update_heights(self, x0, y0, x1, y1):
+        # Bake the normals around the given columns and rows again after the heights of the sampler have changed
+        # there. The normals of the pixels next to the region depend on its heights too.
+        self.bake(max(x0 - 1, 0), max(y0 - 1, 0), min(x1 + 1, self.sampler.x_size),
+            min(y1 + 1, self.sampler.y_size))
@@ -0,0 +1,197 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from panda3d.core import (
+    Filename,
+    Texture
+)
+
+from heightfield import load_heightfield
+
+
+# Functions
+# =========
+def get_band_weight(values, low, high, blend):
+    # Calculate how much each value is within the given band. The weight fades from 0 to 1 over the blend
+    # distance, centered on each edge of the band.
+    return (np.clip((values - low) / blend + .5, 0, 1)
+        * np.clip((high - values) / blend + .5, 0, 1))
+
+
+def generate_tile(heights, rules, pixel_size, height_blend, slope_blend):
+    # The tile has a border of 1 pixel on each side, so the slope can be calculated for all of its pixels
+    # with central differences
+    dx = (heights[1:-1, 2:] - heights[1:-1, :-2]) * .5 / pixel_size[0]
+    dy = (heights[2:, 1:-1] - heights[:-2, 1:-1]) * .5 / pixel_size[1]
+    slopes = np.degrees(np.arctan(np.sqrt(dx * dx + dy * dy)))
+    heights = heights[1:-1, 1:-1]
+
+    # Each channel of the mask is covered by the strongest rule that applies to it
+    weights = np.zeros(heights.shape + (3,), np.float32)
+
+    for channel, min_height, max_height, min_slope, max_slope in rules:
+        weight = (get_band_weight(heights, min_height, max_height, height_blend)
+            * get_band_weight(slopes, min_slope, max_slope, slope_blend))
+        np.maximum(weights[..., channel], weight, out=weights[..., channel])
+
+    return np.round(weights * 255).astype(np.uint8)
+
+
+# Classes
+# =======
+class SplatRule(object):
+    C_red = 0
+    C_green = 1
+    C_blue = 2
+
+    def __init__(self, channel, min_height=-np.inf, max_height=np.inf, min_slope=-np.inf, max_slope=np.inf):
+        if channel not in (self.C_red, self.C_green, self.C_blue):
+            raise ValueError("Invalid splat mask channel: {}".format(channel))
+
+        self.channel = channel
+        self.min_height = min_height
+        self.max_height = max_height
+        self.min_slope = min_slope
+        self.max_slope = max_slope
+
+    def get_params(self):
+        return (self.channel, self.min_height, self.max_height, self.min_slope, self.max_slope)
+
+
+class SplatMaskGenerator(object):
+    # Changing the way masks are generated must change this, so that old cached masks are not used anymore
+    version = 1
+
+    # The red channel blends in dirt, the green channel rock, and the blue channel is unused. Dirt covers
+    # everything below the shore of the lake, and rock covers the steep slopes and the pillars.
+    default_rules = (
+        SplatRule(SplatRule.C_red, max_height=-15.0),
+        SplatRule(SplatRule.C_green, min_height=-8.0),
+        SplatRule(SplatRule.C_green, min_slope=50.0)
+    )
+
+    def __init__(self, rules=default_rules, height_scale=128.0, height_offset=-64.0, pixel_size=(1.0, 1.0),
+        height_blend=2.0, slope_blend=10.0, tile_size=256, num_workers=0, cache_dir="cache"):
+        if tile_size <= 0:
+            raise ValueError("Tile size must be positive")
+
+        self.rules = tuple(rules)
+        self.height_scale = height_scale
+        self.height_offset = height_offset
+        self.pixel_size = tuple(pixel_size)
+        self.height_blend = height_blend
+        self.slope_blend = slope_blend
+        self.tile_size = tile_size
+        self.num_workers = num_workers
+        self.cache_dir = cache_dir
+
+        # Initialize stats
+        self.cache_hit = False
+        self.generate_time = 0.0
+
+    def get_cache_key(self, heightfield):
+        # The key covers the contents of the heightfield and every parameter that changes the mask, so a mask
+        # is generated again whenever any of them changes
+        key = hashlib.sha256()
+
+        with open(heightfield, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                key.update(chunk)
+
+        key.update(repr((
+            self.version,
+            [rule.get_params() for rule in self.rules],
+            self.height_scale,
+            self.height_offset,
+            self.pixel_size,
+            self.height_blend,
+            self.slope_blend
+        )).encode())
+        return key.hexdigest()[:16]
+
+    def get_cache_path(self, heightfield):
+        name = os.path.splitext(os.path.basename(heightfield))[0]
+        return os.path.join(self.cache_dir, "{}-SplatMask-{}.png".format(name, self.get_cache_key(heightfield)))
+
+    def generate(self, heightfield):
+        start = time.perf_counter()
+
+        # Convert the heightfield to world space heights and pad them with a copy of the edge, just like the
+        # normals of GeoMipTerrain are clamped at the edges
+        heights = np.pad(load_heightfield(heightfield) * self.height_scale + self.height_offset, 1, mode="edge")
+        y_size = heights.shape[0] - 2
+        x_size = heights.shape[1] - 2
+        rules = [rule.get_params() for rule in self.rules]
+
+        # Split the heightfield into tiles. Each tile includes the border it needs for its slopes.
+        tiles = []
+
+        for y in range(0, y_size, self.tile_size):
+            for x in range(0, x_size, self.tile_size):
+                tiles.append((y, x, heights[y:y + self.tile_size + 2, x:x + self.tile_size + 2]))
+
+        args = (rules, self.pixel_size, self.height_blend, self.slope_blend)
+
+        # Generate the tiles across a pool of worker processes. Panda3D may already be running threads, so the
+        # workers are spawned instead of forked.
+        if self.num_workers > 0:
+            with ProcessPoolExecutor(self.num_workers, multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(generate_tile, tile, *args) for y, x, tile in tiles]
+                results = [future.result() for future in futures]
+
+        else:
+            results = [generate_tile(tile, *args) for y, x, tile in tiles]
+
+        # Stitch the tiles back together
+        mask = np.empty((y_size, x_size, 3), np.uint8)
+
+        for (y, x, tile), result in zip(tiles, results):
+            mask[y:y + result.shape[0], x:x + result.shape[1]] = result
+
+        self.generate_time = time.perf_counter() - start
+        return mask
+
+    def generate_region(self, heights, x0, y0, x1, y1):
+        # Generate the mask for the given columns and rows of the heightfield again, after their heights have
+        # changed. The heights go from 0 to 1, and the region gets a border that is clamped at the edges, just
+        # like a tile.
+        xs = np.clip(np.arange(x0 - 1, x1 + 1), 0, heights.shape[1] - 1)
+        ys = np.clip(np.arange(y0 - 1, y1 + 1), 0, heights.shape[0] - 1)
+        tile = heights[ys[:, None], xs] * self.height_scale + self.height_offset
+        return generate_tile(
+            tile,
+            [rule.get_params() for rule in self.rules],
+            self.pixel_size,
+            self.height_blend,
+            self.slope_blend
+        )
+
+    def write_mask(self, mask, path):
+        # Write the mask through a texture, so that row 0 ends up at the bottom of the image just like the
+        # heightfield. Texels are stored in BGR order. The mask is written to a temporary file first, so that
+        # an interrupted write never leaves a broken mask in the cache.
+        tex = Texture()
+        tex.setup_2d_texture(mask.shape[1], mask.shape[0], Texture.T_unsigned_byte, Texture.F_rgb8)
+        tex.set_ram_image(np.ascontiguousarray(mask[..., ::-1]))
+        temp_path = "{}.tmp.png".format(os.path.splitext(path)[0])
+
+        if not tex.write(Filename.from_os_specific(temp_path)):
+            raise IOError("Failed to write splat mask: {}".format(path))
+
+        os.replace(temp_path, path)
+
+    def get_mask(self, heightfield):
+        # Use the cached mask if there is one for this heightfield and these rules. Otherwise, generate it and
+        # add it to the cache.
+        path = self.get_cache_path(heightfield)
+        self.cache_hit = os.path.exists(path)
+
+        if not self.cache_hit:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.write_mask(self.generate(heightfield), path)
+
+        return path
@@ -0,0 +1,74 @@
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import (
+    ConfigVariableDouble,
+    ConfigVariableInt,
+    load_prc_file,
+    SamplerState,
+    Vec2,
+    Vec4
+)
+
+from sky import SkyDome
+
+
+# Config Variables
+# ================
+sky_cubemap_size = ConfigVariableInt(
+    "sky-cubemap-size",
+    0,
+    "Size of each face of the cubemap that the skydome is rendered into. The window samples the cubemap instead "
+    "of rendering the skydome every frame. 0 renders the skydome straight into the window."
+)
+sky_cubemap_interval = ConfigVariableInt(
+    "sky-cubemap-interval",
+    0,
+    "Number of frames after which the cubemap is rendered again. 0 only renders it again once the sky has "
+    "scrolled far enough."
+)
+sky_cubemap_max_shift = ConfigVariableDouble(
+    "sky-cubemap-max-shift",
+    1.0,
+    "Number of texels of the cubemap that the clouds and celestials may scroll before the cubemap is rendered "
+    "again. 0 only renders it again after the given number of frames."
+)
+
+
+# Classes
+# =======
+class SkyDemo(ShowBase):
+    def __init__(self):
+        # Load config file
+        load_prc_file("settings.prc")
+
+        # Call the base constructor
+        ShowBase.__init__(self)
+
+        # Load textures
+        self.cloud_tex = self.loader.load_texture("images/Clouds.png")
+        self.cloud_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.cloud_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+        self.cloud_tex.wrap_u = SamplerState.WM_repeat
+        self.cloud_tex.wrap_v = SamplerState.WM_repeat
+
+        self.celestials_tex = self.loader.load_texture("images/Celestials.png")
+        self.celestials_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.celestials_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+        self.celestials_tex.wrap_u = SamplerState.WM_repeat
+        self.celestials_tex.wrap_v = SamplerState.WM_repeat
+
+        # Create skydome
+        self.skydome = SkyDome(
+            Vec4(1, .5, .1, 1),
+            Vec4(0, .61, 1, 1),
+            self.cloud_tex,
+            self.celestials_tex,
+            sky_cubemap_size.get_value(),
+            sky_cubemap_interval.get_value(),
+            sky_cubemap_max_shift.get_value()
+        )
+        self.skydome.set_cloud_scale(Vec2(.5, .5))
+
+
+# Entry Point
+if __name__ == "__main__":
+    SkyDemo().run()
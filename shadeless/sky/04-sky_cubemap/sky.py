@@ -0,0 +1,231 @@
+from panda3d.core import (
+    DepthTestAttrib,
+    FrameBufferProperties,
+    Geom,
+    GeomNode,
+    GeomTriangles,
+    GeomVertexData,
+    GeomVertexFormat,
+    GeomVertexWriter,
+    NodePath,
+    OmniBoundingVolume,
+    SamplerState,
+    Shader,
+    TextureStage,
+    Vec2
+)
+
+
+# Classes
+# =======
+class SkyBox(object):
+    skybox_shader = Shader.load(
+        Shader.SL_GLSL,
+        "shaders/SkyBox.vert.glsl",
+        "shaders/SkyBox.frag.glsl"
+    )
+    skybox_mesh = None
+
+    def __init__(self, texture):
+        # Create skybox mesh
+        if self.skybox_mesh is None:
+            # Get vertex format
+            vtx_format = GeomVertexFormat.get_v3()
+
+            # Allocate vertex data
+            vertices = GeomVertexData("Skybox", vtx_format, Geom.UH_static)
+            vertices.reserve_num_rows(8)
+
+            # Write vertex data
+            vertex = GeomVertexWriter(vertices, "vertex")
+
+            vertex.add_data3(-1, -1, -1)
+            vertex.add_data3(1, -1, -1)
+            vertex.add_data3(-1, 1, -1)
+            vertex.add_data3(1, 1, -1)
+            vertex.add_data3(-1, -1, 1)
+            vertex.add_data3(1, -1, 1)
+            vertex.add_data3(-1, 1, 1)
+            vertex.add_data3(1, 1, 1)
+
+            # Allocate primitive data
+            triangles = GeomTriangles(Geom.UH_static)
+            triangles.reserve_num_vertices(12)
+
+            # Write primitive data
+            triangles.add_vertices(4, 5, 1)
+            triangles.add_vertices(1, 0, 4)
+            triangles.add_vertices(2, 3, 7)
+            triangles.add_vertices(7, 6, 2)
+            triangles.add_vertices(2, 6, 4)
+            triangles.add_vertices(4, 0, 2)
+            triangles.add_vertices(1, 5, 7)
+            triangles.add_vertices(7, 3, 1)
+            triangles.add_vertices(4, 6, 7)
+            triangles.add_vertices(7, 5, 4)
+            triangles.add_vertices(0, 1, 3)
+            triangles.add_vertices(3, 2, 0)
+
+            # Create skybox mesh
+            SkyBox.skybox_mesh = Geom(vertices)
+            self.skybox_mesh.add_primitive(triangles)
+
+        # Create skybox
+        self.skybox = base.render.attach_new_node(GeomNode("Skybox"))
+        self.skybox.node().add_geom(self.skybox_mesh)
+        self.skybox.node().set_bounds(OmniBoundingVolume())
+        self.skybox.set_shader(self.skybox_shader)
+        self.skybox.set_texture(texture)
+        depth_test_attrib = DepthTestAttrib.make(DepthTestAttrib.M_less_equal)
+        self.skybox.set_attrib(depth_test_attrib)
+
+
+class SkyDome(object):
+    sky_shader = Shader.load(
+        Shader.SL_GLSL,
+        "shaders/Sky.vert.glsl",
+        "shaders/Sky.frag.glsl"
+    )
+
+    def __init__(self, horizon, zenith, cloud_tex, celestials_tex, cubemap_size=0, update_interval=0,
+        max_texel_shift=1.0):
+        self.cubemap_size = cubemap_size
+        self.update_interval = update_interval
+        self.max_texel_shift = max_texel_shift
+        self.cubemap = None
+        self.skybox = None
+
+        # Set background color
+        base.win.set_clear_color(horizon)
+
+        # Load skydome mesh
+        self.skydome = base.loader.load_model("meshes/DynamicSkyDome.gltf")
+        self.skydome.find("**/DynamicSkyDome").node().set_bounds(OmniBoundingVolume())
+        self.skydome.set_shader(self.sky_shader)
+        self.skydome.set_attrib(DepthTestAttrib.make(DepthTestAttrib.M_less_equal))
+
+        # Without a cubemap, the skydome is rendered straight into the window every frame
+        if cubemap_size <= 0:
+            self.skydome.reparent_to(base.render)
+
+        # Otherwise, the skydome gets a scene of its own, which a rig of 6 cameras renders into a small cubemap
+        # from time to time. The window only samples the cubemap with a skybox. The cubemap is an sRGB texture
+        # just like the window, so that the dark parts of the sky don't lose precision.
+        else:
+            self.scene = NodePath("SkyDomeScene")
+            self.skydome.reparent_to(self.scene)
+            camera_rig = self.scene.attach_new_node("SkyDomeCameraRig")
+            fbp = FrameBufferProperties()
+            fbp.set_rgba_bits(8, 8, 8, 0)
+            fbp.set_srgb_color(True)
+            self.buffer = base.win.make_cube_map(
+                "SkyDomeCubeMap",
+                cubemap_size,
+                camera_rig,
+                to_ram=False,
+                fbp=fbp
+            )
+            self.buffer.set_clear_color(horizon)
+            self.cubemap = self.buffer.get_texture()
+            self.cubemap.minfilter = SamplerState.FT_linear
+            self.cubemap.magfilter = SamplerState.FT_linear
+            self.skybox = SkyBox(self.cubemap)
+
+            # The cubemap is rendered again whenever the sky changes. Scrolling is tracked separately, since it
+            # changes the sky every frame.
+            self.dirty = True
+            self.bake_time = 0.0
+            self.frames_since_bake = 0
+
+            # Initialize stats
+            self.bake_count = 0
+            self.frame_count = 0
+
+        self.set_horizon_color(horizon)
+        self.set_zenith_color(zenith)
+        self.set_cloud_texture(cloud_tex)
+        self.set_cloud_scroll_vec(Vec2(.01, 0))
+        self.set_cloud_scale(Vec2(1, 1))
+        self.set_celestial_texture(celestials_tex)
+        self.set_celestial_scroll_vec(Vec2(.001, 0))
+
+        if self.cubemap is not None:
+            base.task_mgr.add(self.update, "update_sky_cubemap")
+
+    def set_horizon_color(self, color):
+        self.skydome.set_shader_input("horizonColor", color)
+
+        if self.cubemap is not None:
+            self.buffer.set_clear_color(color)
+
+        self.mark_dirty()
+
+    def set_zenith_color(self, color):
+        self.skydome.set_shader_input("zenithColor", color)
+        self.mark_dirty()
+
+    def set_cloud_texture(self, tex):
+        stage1 = TextureStage("Clouds")
+        stage1.set_sort(1)
+        self.skydome.set_texture(stage1, tex)
+        self.mark_dirty()
+
+    def set_cloud_scroll_vec(self, vec):
+        self.cloud_scroll_vec = Vec2(vec)
+        self.skydome.set_shader_input("cloudScrollVec", vec)
+        self.mark_dirty()
+
+    def set_cloud_scale(self, scale):
+        self.cloud_scale = Vec2(scale)
+        self.skydome.set_shader_input("cloudScale", scale)
+        self.mark_dirty()
+
+    def set_celestial_texture(self, tex):
+        stage2 = TextureStage("Celestials")
+        stage2.set_sort(2)
+        self.skydome.set_texture(stage2, tex)
+        self.mark_dirty()
+
+    def set_celestial_scroll_vec(self, vec):
+        self.celestial_scroll_vec = Vec2(vec)
+        self.skydome.set_shader_input("celestialScrollVec", vec)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        if self.cubemap is not None:
+            self.dirty = True
+
+    def get_texel_shift(self, frame_time):
+        # Estimate how many texels of the cubemap the clouds and celestials have scrolled since the last bake. The
+        # skydome stretches a UV of 1 across 180 degrees of the sky, and a face of the cubemap covers 90 degrees, so
+        # a UV of 1 covers about 2 faces.
+        elapsed = frame_time - self.bake_time
+        cloud_shift = self.cloud_scroll_vec * elapsed
+        cloud_shift.componentwise_mult(self.cloud_scale)
+        celestial_shift = self.celestial_scroll_vec * elapsed
+        celestial_shift.componentwise_mult(Vec2(2, 1))
+        return max(cloud_shift.length(), celestial_shift.length()) * 2 * self.cubemap_size
+
+    def update(self, task):
+        # Render the cubemap again if the sky has changed, if the clouds or celestials have scrolled far enough,
+        # or if the given number of frames has passed. Either of the last 2 can be disabled with a value of 0. The
+        # buffer is only active during the frames in which it is rendered.
+        frame_time = base.clock.get_frame_time()
+        self.frames_since_bake += 1
+        self.frame_count += 1
+        bake = (self.dirty
+            or (self.max_texel_shift > 0 and self.get_texel_shift(frame_time) >= self.max_texel_shift)
+            or (self.update_interval > 0 and self.frames_since_bake >= self.update_interval))
+        self.buffer.set_active(bake)
+
+        if bake:
+            self.dirty = False
+            self.bake_time = frame_time
+            self.frames_since_bake = 0
+            self.bake_count += 1
+
+        return task.cont
+
+    def get_bake_rate(self):
+        # Fraction of frames in which the cubemap was rendered
+        return self.bake_count / self.frame_count if self.frame_count > 0 else 0.0
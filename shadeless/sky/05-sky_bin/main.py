@@ -0,0 +1,115 @@
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import (
+    CardMaker,
+    ConfigVariableBool,
+    ConfigVariableDouble,
+    ConfigVariableInt,
+    ConfigVariableString,
+    load_prc_file,
+    load_prc_file_data,
+    SamplerState,
+    Shader,
+    Vec2,
+    Vec4
+)
+
+from sky import SkyDome, SkyPixelCounter
+
+
+# Config Variables
+# ================
+sky_cubemap_size = ConfigVariableInt(
+    "sky-cubemap-size",
+    0,
+    "Size of each face of the cubemap that the skydome is rendered into. The window samples the cubemap instead "
+    "of rendering the skydome every frame. 0 renders the skydome straight into the window."
+)
+sky_cubemap_interval = ConfigVariableInt(
+    "sky-cubemap-interval",
+    0,
+    "Number of frames after which the cubemap is rendered again. 0 only renders it again once the sky has "
+    "scrolled far enough."
+)
+sky_cubemap_max_shift = ConfigVariableDouble(
+    "sky-cubemap-max-shift",
+    1.0,
+    "Number of texels of the cubemap that the clouds and celestials may scroll before the cubemap is rendered "
+    "again. 0 only renders it again after the given number of frames."
+)
+sky_bin = ConfigVariableString(
+    "sky-bin",
+    "sky",
+    "Bin that the sky is drawn in. The sky bin is drawn after all opaque geometry, so that only the pixels the "
+    "scene doesn't cover run the sky shader. The opaque bin sorts the sky among the rest of the scene by state, "
+    "and the background bin draws it first."
+)
+sky_ground = ConfigVariableBool(
+    "sky-ground",
+    False,
+    "Adds a flat ground below the sky, which covers the lower part of the screen like a terrain would."
+)
+sky_count_pixels = ConfigVariableBool(
+    "sky-count-pixels",
+    False,
+    "Counts the pixels that pass the depth test of the sky in each frame, which are the pixels that run the sky "
+    "shader on a GPU with early depth testing. Reading the count stalls every frame, so this is only meant for "
+    "measurements."
+)
+
+
+# Classes
+# =======
+class SkyDemo(ShowBase):
+    def __init__(self):
+        # Load config file
+        load_prc_file("settings.prc")
+
+        # The sky pixel counter needs a stencil buffer
+        if sky_count_pixels.get_value():
+            load_prc_file_data("sky-count-pixels", "framebuffer-stencil 1")
+
+        # Call the base constructor
+        ShowBase.__init__(self)
+
+        # Load textures
+        self.cloud_tex = self.loader.load_texture("images/Clouds.png")
+        self.cloud_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.cloud_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+        self.cloud_tex.wrap_u = SamplerState.WM_repeat
+        self.cloud_tex.wrap_v = SamplerState.WM_repeat
+
+        self.celestials_tex = self.loader.load_texture("images/Celestials.png")
+        self.celestials_tex.minfilter = SamplerState.FT_linear_mipmap_linear
+        self.celestials_tex.magfilter = SamplerState.FT_linear_mipmap_linear
+        self.celestials_tex.wrap_u = SamplerState.WM_repeat
+        self.celestials_tex.wrap_v = SamplerState.WM_repeat
+
+        # Create ground. It has a shader and shader inputs of its own, just like a real terrain.
+        if sky_ground.get_value():
+            cm = CardMaker("Ground")
+            cm.set_frame(-1000, 1000, -1000, 1000)
+            self.ground = self.render.attach_new_node(cm.generate())
+            self.ground.set_p(-90)
+            self.ground.set_z(-2)
+            self.ground.set_shader(Shader.load(Shader.SL_GLSL, "shaders/Ground.vert.glsl", "shaders/Ground.frag.glsl"))
+            self.ground.set_shader_input("groundColor", Vec4(.2, .3, .1, 1))
+
+        # Create skydome
+        self.sky_pixel_counter = SkyPixelCounter() if sky_count_pixels.get_value() else None
+        self.skydome = SkyDome(
+            Vec4(1, .5, .1, 1),
+            Vec4(0, .61, 1, 1),
+            self.cloud_tex,
+            self.celestials_tex,
+            sky_cubemap_size.get_value(),
+            sky_cubemap_interval.get_value(),
+            sky_cubemap_max_shift.get_value(),
+            sky_bin.get_value(),
+            self.sky_pixel_counter
+        )
+        self.skydome.set_cloud_scale(Vec2(.5, .5))
+
+
+# Entry Point
+if __name__ == "__main__":
+    SkyDemo().run()
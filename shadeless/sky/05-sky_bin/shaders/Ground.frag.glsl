@@ -0,0 +1,11 @@
+#version 140
+
+uniform vec4 groundColor;
+
+out vec4 p3d_FragColor;
+
+
+void main() {
+    // Calculate final color
+    p3d_FragColor = groundColor;
+}